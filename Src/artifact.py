@@ -0,0 +1,306 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from cache import compiler_version
+from ir import CONSTANT_KINDS, FLOAT, INT, VAR, Operand, OperandKind, Quad
+from vm import Bytecode, BytecodeCompiler
+
+# Layout of a compiled-program artifact (all integers in the byte order of
+# the machine that wrote it, recorded in the flags):
+#
+#   header     magic, format version, flags, CRC-32 of everything after the
+#              header, and the compiler version that wrote it
+#   sections   a table of (offset, length) pairs, then the sections below,
+#              each starting on an 8-byte boundary
+#
+# Operands are stored as one int32 reference, index << 3 | kind, where the
+# index points into the string table (variables, temporaries, labels, spill
+# slots), the int pool or the float pool; -1 is "no operand". Ints too wide
+# for the int64 pool are strings too, in hex, with kind WIDE_INT. An IR
+# instruction is four int32s: opcode, dest, arg1, arg2.
+#
+# Bump VERSION whenever the layout or the VM's opcodes change. An artifact
+# written by another compiler version is refused, like the cache's results.
+MAGIC = b'SLC\0'
+VERSION = 3
+HEADER = struct.Struct('<4sHHI16s')
+SECTION = struct.Struct('<QQ')
+ALIGNMENT = 8
+LITTLE_ENDIAN = 1
+
+SECTIONS = ('string_offsets', 'strings', 'ints', 'floats', 'symbols', 'ir', 'code', 'registers',
+            'spills')
+SECTION_TYPES = {'string_offsets': 'I', 'strings': 'B', 'ints': 'q', 'floats': 'd',
+                 'symbols': 'i', 'ir': 'i', 'code': 'i', 'registers': 'i',
+                 'spills': 'i'}
+DATA_START = HEADER.size + SECTION.size * len(SECTIONS)
+
+OPCODES = ('=', 'print', 'goto', 'label', '+', '-', '*', '/',
+           '>', '<', '==', '!=', '<=', '>=')
+OPCODE_NUMBERS = {op: number for number, op in enumerate(OPCODES)}
+TYPES = ('int', 'float')
+NO_OPERAND = -1
+WIDE_INT = 7
+
+
+class ArtifactError(ValueError):
+    """Raised for a file that isn't a readable artifact of this format."""
+
+
+def native_flags():
+    return LITTLE_ENDIAN if sys.byteorder == 'little' else 0
+
+
+def is_artifact(path):
+    """True if the file at `path` starts like an artifact."""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ArtifactBuilder:
+    """Interns the names and constants of a compiled program and lays the
+    program out in the artifact format."""
+
+    def __init__(self):
+        self.strings = {}
+        self.ints = {}
+        self.floats = {}
+
+    def operand(self, operand):
+        if operand is None:
+            return NO_OPERAND
+        kind = operand.kind
+        if kind == INT:
+            pool = self.ints
+            key = operand.value
+            if not -1 << 63 <= key < 1 << 63:
+                pool, key, kind = self.strings, hex(key), WIDE_INT
+        elif kind == FLOAT:
+            # float.hex() tells 0.0 from -0.0, which compare equal
+            pool = self.floats
+            key = operand.value.hex()
+        else:
+            pool = self.strings
+            key = operand.value
+        index = pool.get(key)
+        if index is None:
+            index = pool[key] = len(pool)
+        return index << 3 | kind
+
+    def build(self, code, symbol_table, bytecode=None):
+        """The artifact bytes for `code` (optimized three-address code) and
+        the declarations in `symbol_table`. The bytecode is lowered from
+        `code` unless given."""
+        if bytecode is None:
+            bytecode = BytecodeCompiler(symbol_table).compile(code)
+        operand = self.operand
+
+        ir = array('i')
+        for quad in code:
+            ir.extend((OPCODE_NUMBERS[quad.op], operand(quad.dest), operand(quad.arg1),
+                       operand(quad.arg2)))
+        symbols = array('i')
+        for name, info in symbol_table.items():
+            var_type = info.get('type')
+            symbols.extend((operand(Operand(VAR, name)),
+                            TYPES.index(var_type) if var_type in TYPES else -1))
+        registers = array('i', map(operand, bytecode.names))
+        spills = array('i', map(operand, bytecode.spills))
+
+        encoded = [name.encode() for name in self.strings]
+        string_offsets = array('I', [0])
+        total = 0
+        for name in encoded:
+            total += len(name)
+            string_offsets.append(total)
+        sections = {
+            'string_offsets': string_offsets,
+            'strings': b''.join(encoded),
+            'ints': array('q', self.ints),
+            'floats': array('d', map(float.fromhex, self.floats)),
+            'symbols': symbols,
+            'ir': ir,
+            'code': array('i', bytecode.code),
+            'registers': registers,
+            'spills': spills,
+        }
+
+        table = bytearray()
+        body = bytearray()
+        for name in SECTIONS:
+            data = memoryview(sections[name]).cast('B')
+            body.extend(bytes(-(DATA_START + len(body)) % ALIGNMENT))
+            table += SECTION.pack(DATA_START + len(body), len(data))
+            body += data
+        checksum = zlib.crc32(body, zlib.crc32(table))
+        header = HEADER.pack(MAGIC, VERSION, native_flags(), checksum,
+                             compiler_version().encode())
+        return header + table + body
+
+
+def save_artifact(path, code, symbol_table, bytecode=None):
+    """Write the artifact for a compiled program to `path`. The file is
+    replaced in one step, so processes mapping the old one keep a
+    consistent copy."""
+    data = ArtifactBuilder().build(code, symbol_table, bytecode)
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+    return len(data)
+
+
+class Artifact:
+    """A compiled program read from an artifact.
+
+    The sections are typed memoryviews straight over the file's bytes, so
+    loading only checks the header (and the checksum, with `verify`);
+    instructions, names and constants are decoded when asked for.
+    bytecode() hands the VM its code array without copying it.
+    """
+
+    def __init__(self, buffer, verify=True, check_version=True):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.sections = {}
+        try:
+            self.read(verify, check_version)
+        except Exception:
+            self.close()
+            raise
+
+    def read(self, verify, check_version):
+        if len(self.view) < DATA_START:
+            raise ArtifactError("File too short to be an artifact")
+        magic, version, flags, checksum, written_by = HEADER.unpack_from(self.view)
+        if magic != MAGIC:
+            raise ArtifactError("Not a SimpleLang artifact")
+        if version != VERSION:
+            raise ArtifactError(f"Artifact format version {version}; this compiler reads {VERSION}")
+        if flags & LITTLE_ENDIAN != native_flags():
+            raise ArtifactError("Artifact was written on a machine with the other byte order")
+        if verify and zlib.crc32(self.view[HEADER.size:]) != checksum:
+            raise ArtifactError("Artifact checksum mismatch; the file is corrupt")
+        self.compiler_version = written_by.decode('ascii')
+        if check_version and self.compiler_version != compiler_version():
+            raise ArtifactError(f"Artifact was written by compiler version {self.compiler_version}, "
+                                f"this is {compiler_version()}; build it again")
+
+        for number, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(self.view, HEADER.size + number * SECTION.size)
+            if offset + length > len(self.view):
+                raise ArtifactError(f"Section {name} runs past the end of the file")
+            self.sections[name] = self.view[offset:offset + length].cast(SECTION_TYPES[name])
+        self.ir = self.sections['ir']
+        self.string_offsets = self.sections['string_offsets']
+        self.strings = self.sections['strings']
+
+    @classmethod
+    def open(cls, path, verify=True, check_version=True):
+        """Map the artifact at `path` read-only."""
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, verify, check_version)
+
+    def close(self):
+        """Release the mapping. The code of Bytecode from bytecode() is a
+        view of the file and can't be used afterwards."""
+        for section in self.sections.values():
+            section.release()
+        self.view.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.ir) // 4
+
+    def string(self, index):
+        offsets = self.string_offsets
+        return bytes(self.strings[offsets[index]:offsets[index + 1]]).decode()
+
+    def operand(self, ref):
+        if ref == NO_OPERAND:
+            return None
+        index = ref >> 3
+        if ref & 7 == WIDE_INT:
+            return Operand(INT, int(self.string(index), 16))
+        kind = OperandKind(ref & 7)
+        if kind == INT:
+            return Operand(INT, self.sections['ints'][index])
+        if kind == FLOAT:
+            return Operand(FLOAT, self.sections['floats'][index])
+        return Operand(kind, self.string(index))
+
+    def instruction(self, index):
+        op, dest, arg1, arg2 = self.ir[index * 4:index * 4 + 4]
+        return Quad(OPCODES[op], self.operand(dest), self.operand(arg1), self.operand(arg2))
+
+    def code(self):
+        """The optimized three-address code, decoded."""
+        return [self.instruction(index) for index in range(len(self))]
+
+    def symbol_table(self):
+        """The declared variables and their types."""
+        symbols = self.sections['symbols']
+        return {self.operand(symbols[i]).value: {'type': TYPES[symbols[i + 1]]
+                                                 if symbols[i + 1] >= 0 else None}
+                for i in range(0, len(symbols), 2)}
+
+    def bytecode(self):
+        """The program as VM Bytecode, its code array a view of the file."""
+        var_types = {name: info['type'] for name, info in self.symbol_table().items()}
+        names = list(map(self.operand, self.sections['registers']))
+        registers = []
+        for operand in names:
+            if operand.kind in CONSTANT_KINDS:
+                registers.append(operand.value)
+            elif operand.kind == VAR and var_types.get(operand.value) == 'float':
+                registers.append(0.0)
+            else:
+                registers.append(0)
+        spills = map(self.operand, self.sections['spills'])
+        return Bytecode(self.sections['code'], registers, names, spills)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+    from ir import format_code, parse_code
+    from vm import VirtualMachine
+
+    code = parse_code([
+        "t1 = a + 2.5",
+        "x = t1",
+        "if x <= 1 goto L1",
+        "print x",
+        "L1:",
+    ])
+    declarations = {'a': {'type': 'int'}, 'x': {'type': 'float'}}
+    path = os.path.join(tempfile.mkdtemp(), 'program.slc')
+    size = save_artifact(path, code, declarations)
+    with Artifact.open(path) as artifact:
+        print(f"{size} bytes, written by compiler {artifact.compiler_version}")
+        print("\n".join(format_code(artifact.code())))
+        VirtualMachine(artifact.bytecode()).run()
+
+    # Opening costs the same however long the program is; only the
+    # checksum pass grows with it
+    line = ["t1 = x + 1", "x = t1", "print x"]
+    for copies in (1000, 100000):
+        save_artifact(path, parse_code(line * copies), {'x': {'type': 'int'}})
+        for verify in (True, False):
+            started = time.perf_counter()
+            with Artifact.open(path, verify) as artifact:
+                artifact.bytecode()
+                elapsed = time.perf_counter() - started
+            print(f"{copies * 3:7} instructions, verify={verify!s:5}: opened in {elapsed * 1000:.2f} ms")
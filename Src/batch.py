@@ -0,0 +1,109 @@
+import glob
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from service import compile_summary
+
+SOURCE_SUFFIX = '.sl'
+
+
+def collect_files(pattern):
+    """Source files to compile: every .sl file under a directory, or the
+    files matching a glob ('**' recurses), sorted."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '**', '*' + SOURCE_SUFFIX)
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+
+def compile_file(path, fixed_point=False):
+    """Compile one file to a JSON-ready result. Failures to read or compile
+    it become an `error` in the result instead of stopping the batch."""
+    try:
+        with open(path, 'r') as f:
+            source = f.read()
+        result = compile_summary(source, fixed_point)
+    except Exception as e:
+        return {'name': path, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    return {'name': path, **result}
+
+
+def compile_named_source(item, fixed_point=False):
+    """Like compile_file, for a (name, source) pair sent over the wire."""
+    name, source = item
+    try:
+        result = compile_summary(source, fixed_point)
+    except Exception as e:
+        return {'name': name, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    return {'name': name, **result}
+
+
+class BatchCompiler:
+    """Compiles many programs over a pool of worker processes.
+
+    Inputs are handed to the workers in chunks, so the per-task cost of
+    pickling and queueing is paid once per chunk rather than per file;
+    results come back in input order. The pool starts on first use and is
+    reused until close().
+    """
+
+    def __init__(self, workers=None, chunk_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.pool = None
+
+    def compile_files(self, paths, fixed_point=False):
+        return self.map(partial(compile_file, fixed_point=fixed_point), paths)
+
+    def compile_sources(self, items, fixed_point=False):
+        """Compile (name, source) pairs."""
+        return self.map(partial(compile_named_source, fixed_point=fixed_point), items)
+
+    def map(self, function, items):
+        items = list(items)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Several chunks per worker keep them all busy to the end
+        chunk_size = self.chunk_size or max(1, min(64, len(items) // (self.workers * 4)))
+        return self.pool.map(function, items, chunksize=chunk_size)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_jsonl(results, out):
+    """Write one JSON object per line; returns (total, failed)."""
+    total = failed = 0
+    for result in results:
+        out.write(json.dumps(result) + '\n')
+        total += 1
+        failed += not result['ok']
+    return total, failed
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as directory:
+        program = "int x;\nx = 1;\n" + "x = x * 2 + 1;\nif (x > 5) { print(x); }\n" * 200
+        for number in range(200):
+            with open(os.path.join(directory, f"p{number}.sl"), 'w') as f:
+                f.write(program if number % 50 else "x = 1;\n")
+        paths = collect_files(directory)
+        for workers in (1, os.cpu_count() or 1):
+            with BatchCompiler(workers) as compiler:
+                started = time.perf_counter()
+                total, failed = write_jsonl(compiler.compile_files(paths), io.StringIO())
+                print(f"{workers} workers: {total} files ({failed} failed) in "
+                      f"{time.perf_counter() - started:.2f} s")
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@lru_cache(maxsize=None)
+def compiler_version():
+    """Fingerprint of the compiler's own source files.
+
+    Part of every cache key, so results cached on disk by an older version
+    of the compiler are never served by a newer one.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(SRC_DIR)):
+        if name.endswith('.py'):
+            with open(os.path.join(SRC_DIR, name), 'rb') as f:
+                digest.update(name.encode() + b'\0' + f.read())
+    return digest.hexdigest()[:16]
+
+
+def cache_key(source, options=None):
+    """Content address of a compile: the source plus everything else that
+    changes the result."""
+    digest = hashlib.sha256()
+    digest.update(compiler_version().encode())
+    digest.update(json.dumps(options or {}, sort_keys=True).encode())
+    digest.update(b'\0')
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """Compile results (encoded JSON bytes) by cache key.
+
+    The memory tier is an LRU bounded both by entry count and by total
+    bytes. With `path`, results are also written to a sqlite database that
+    outlives the process; a memory miss that is found there counts as a
+    disk hit and moves the entry back into memory. Safe to share between
+    request threads.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 << 20, path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)")
+            self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            if self.db is not None:
+                row = self.db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self._remember(key, bytes(row[0]))
+                    return bytes(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (key, value))
+                self.db.commit()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached bytes for `key`, or call compute() and cache
+        what it returns."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remember(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = value
+        self.size += len(value)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'disk': self.db is not None,
+            }
@@ -0,0 +1,445 @@
+import heapq
+import operator
+from functools import reduce
+
+from ir import (ARITHMETIC, ASSIGN, COMMUTATIVE, GOTO, LABEL_OP, RELATIONAL, TEMP, VAR,
+                format_code, parse_code)
+
+NAME_KINDS = frozenset({VAR, TEMP})
+
+
+def defined_name(quad):
+    """The variable or temporary an instruction writes, or None."""
+    if quad.op == ASSIGN or quad.op in ARITHMETIC:
+        return quad.dest
+    return None
+
+
+def used_names(quad):
+    """The variables and temporaries an instruction reads."""
+    return [arg for arg in (quad.arg1, quad.arg2) if arg is not None and arg.kind in NAME_KINDS]
+
+
+def expression_key(quad):
+    """Key of the expression an arithmetic instruction computes, with the
+    operands of + and * in canonical order."""
+    arg1, arg2 = quad.arg1, quad.arg2
+    if quad.op in COMMUTATIVE and arg2 < arg1:
+        arg1, arg2 = arg2, arg1
+    return (quad.op, arg1, arg2)
+
+
+class BitDomain:
+    """Numbers the facts of an analysis so sets of them are int bitsets."""
+
+    def __init__(self):
+        self.index = {}
+        self.items = []
+
+    def bit(self, item):
+        index = self.index.get(item)
+        if index is None:
+            index = self.index[item] = len(self.items)
+            self.items.append(item)
+        return 1 << index
+
+    def __len__(self):
+        return len(self.items)
+
+    def full(self):
+        return (1 << len(self.items)) - 1
+
+    def decode(self, bits):
+        """The items of a bitset, lowest bit first."""
+        items = []
+        while bits:
+            low = bits & -bits
+            items.append(self.items[low.bit_length() - 1])
+            bits ^= low
+        return items
+
+
+class BasicBlock:
+    """Instructions code[start:end], entered only at the top and left only
+    at the bottom."""
+    __slots__ = ('index', 'start', 'end', 'successors', 'predecessors')
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.successors = []
+        self.predecessors = []
+
+    def __repr__(self):
+        return f"BasicBlock({self.index}, {self.start}:{self.end}, successors={self.successors})"
+
+
+class ControlFlowGraph:
+    """Basic blocks of a quad list and the jumps and fall-throughs between
+    them. Block 0 is the entry; `exits` holds the blocks the program can end
+    in (by falling off the last one or reaching one without successors)."""
+
+    def __init__(self, code):
+        self.code = code
+        self.blocks = []
+        self.block_of_label = {}
+        self.exits = set()
+
+        leaders = {0} if code else set()
+        for index, quad in enumerate(code):
+            if quad.op == LABEL_OP:
+                leaders.add(index)
+            elif quad.op == GOTO or quad.op in RELATIONAL:
+                leaders.add(index + 1)
+        starts = sorted(leader for leader in leaders if leader < len(code))
+        for block_index, start in enumerate(starts):
+            end = starts[block_index + 1] if block_index + 1 < len(starts) else len(code)
+            block = BasicBlock(block_index, start, end)
+            self.blocks.append(block)
+            if code[start].op == LABEL_OP:
+                self.block_of_label[code[start].dest] = block_index
+
+        for block in self.blocks:
+            last = code[block.end - 1]
+            if last.op == GOTO or last.op in RELATIONAL:
+                target = self.block_of_label.get(last.dest)
+                if target is None:
+                    raise ValueError(f"Jump to undefined label {last.dest}")
+                self.add_edge(block.index, target)
+            if last.op != GOTO and block.index + 1 < len(self.blocks):
+                self.add_edge(block.index, block.index + 1)
+            elif last.op != GOTO or not block.successors:
+                self.exits.add(block.index)
+
+    def add_edge(self, source, target):
+        if target not in self.blocks[source].successors:
+            self.blocks[source].successors.append(target)
+            self.blocks[target].predecessors.append(source)
+
+    def instructions(self, block):
+        return self.code[block.start:block.end]
+
+    def reachable(self):
+        """reachable[i] is True if block i can be reached from the entry."""
+        seen = [False] * len(self.blocks)
+        stack = [0] if self.blocks else []
+        while stack:
+            index = stack.pop()
+            if not seen[index]:
+                seen[index] = True
+                stack.extend(self.blocks[index].successors)
+        return seen
+
+    def reverse_postorder(self):
+        """Block indexes in reverse postorder from the entry, followed by the
+        unreachable blocks in program order."""
+        if not self.blocks:
+            return []
+        postorder = []
+        visited = [False] * len(self.blocks)
+        visited[0] = True
+        stack = [(0, iter(self.blocks[0].successors))]
+        while stack:
+            index, successors = stack[-1]
+            for successor in successors:
+                if not visited[successor]:
+                    visited[successor] = True
+                    stack.append((successor, iter(self.blocks[successor].successors)))
+                    break
+            else:
+                stack.pop()
+                postorder.append(index)
+        postorder.reverse()
+        postorder.extend(index for index, seen in enumerate(visited) if not seen)
+        return postorder
+
+
+def solve(cfg, gen, kill, forward=True, meet=operator.or_, top=0, boundary=0, transfer=None):
+    """Solve a gen/kill dataflow problem over int bitsets with a worklist.
+
+    Each block transforms the value flowing into it as gen | (value & ~kill),
+    or as transfer(block index, value) for problems that don't split into
+    gen and kill sets.
+    The value entering a block is the meet of its neighbours (predecessors
+    going forward, successors going backward), and of `boundary` at the
+    entry (or at the exits going backward) and at blocks with no neighbours;
+    `top` is the starting guess (0 for union problems, the full set for
+    intersection ones). Blocks are taken from the worklist in reverse
+    postorder, or postorder going backward, so most facts settle in one or
+    two sweeps.
+
+    Returns (ins, outs): the values at the top and bottom of each block.
+    """
+    blocks = cfg.blocks
+    ends = {0} if forward else cfg.exits
+    order = cfg.reverse_postorder()
+    if not forward:
+        order.reverse()
+    position = [0] * len(blocks)
+    for rank, index in enumerate(order):
+        position[index] = rank
+
+    entering = [top] * len(blocks)
+    leaving = [top] * len(blocks)
+    queued = [True] * len(blocks)
+    worklist = list(range(len(order)))
+    while worklist:
+        index = order[heapq.heappop(worklist)]
+        queued[index] = False
+        block = blocks[index]
+        sources = block.predecessors if forward else block.successors
+        values = [leaving[source] for source in sources]
+        if index in ends or not values:
+            values.append(boundary)
+        value = reduce(meet, values)
+        entering[index] = value
+        if transfer is None:
+            value = gen[index] | (value ^ (value & kill[index]))
+        else:
+            value = transfer(index, value)
+        if value != leaving[index]:
+            leaving[index] = value
+            for target in (block.successors if forward else block.predecessors):
+                if not queued[target]:
+                    queued[target] = True
+                    heapq.heappush(worklist, position[target])
+    return (entering, leaving) if forward else (leaving, entering)
+
+
+def global_names(cfg):
+    """Names read in some block before being written there.
+
+    Only these can carry a value from one block to another; the temporaries
+    the generator makes for an expression are written and read inside one
+    block and stay out of the bitsets, which keeps them short.
+    """
+    names = set()
+    for block in cfg.blocks:
+        written = set()
+        for quad in cfg.instructions(block):
+            for name in used_names(quad):
+                if name not in written:
+                    names.add(name)
+            name = defined_name(quad)
+            if name is not None:
+                written.add(name)
+    return names
+
+
+class Liveness:
+    """Live variables and temporaries (backward, union).
+
+    live_in[b] / live_out[b] are bitsets over `domain`, the global names
+    (names local to one block are never live across its boundaries), or
+    just `names` when only some of them are wanted.
+    """
+
+    def __init__(self, cfg, names=None):
+        self.cfg = cfg
+        self.domain = BitDomain()
+        bit = self.domain.bit
+        for name in global_names(cfg) if names is None else names:
+            bit(name)
+        index = self.domain.index
+        gen = []
+        kill = []
+        for block in cfg.blocks:
+            uses = defs = 0
+            for quad in reversed(cfg.instructions(block)):
+                name = defined_name(quad)
+                if name in index:
+                    defs |= bit(name)
+                    uses ^= uses & bit(name)
+                for name in used_names(quad):
+                    if name in index:
+                        uses |= bit(name)
+            gen.append(uses)
+            kill.append(defs)
+        self.live_in, self.live_out = solve(cfg, gen, kill, forward=False)
+
+    def walk(self, block):
+        """Step backward through a block, yielding (index, live) where `live`
+        is the set of names live just after instruction `index`. The set is
+        updated in place as the walk moves up."""
+        code = self.cfg.code
+        live = set(self.domain.decode(self.live_out[block.index]))
+        for index in range(block.end - 1, block.start - 1, -1):
+            yield index, live
+            quad = code[index]
+            name = defined_name(quad)
+            if name is not None:
+                live.discard(name)
+            live.update(used_names(quad))
+
+
+class StrongLiveness(Liveness):
+    """Strongly live names (backward, union).
+
+    Like liveness, except that an assignment only makes its operands live
+    if its own result is live. Names that are live but not strongly live
+    feed nothing except each other (a counter bumped in a loop and never
+    printed), so a dead chain of any length, across any number of blocks,
+    shows up in one solve. This isn't a gen/kill problem: the transfer
+    function walks the block.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.domain = BitDomain()
+        for name in global_names(cfg):
+            self.domain.bit(name)
+        self.live_in, self.live_out = solve(cfg, None, None, forward=False,
+                                            transfer=self.transfer)
+
+    def transfer(self, block_index, live):
+        return self.scan(self.cfg.blocks[block_index], live)
+
+    def dead_assignments(self, block):
+        """Indexes of the block's assignments whose results are never used."""
+        dead = []
+        self.scan(block, self.live_out[block.index], dead)
+        return dead
+
+    def scan(self, block, live, dead=None):
+        """Walk a block bottom-up from `live`, the strongly live global names
+        at its end; return those at its start and append the index of every
+        assignment to a name that isn't live to `dead`."""
+        code = self.cfg.code
+        bits = self.domain.index
+        local = set()
+        for index in range(block.end - 1, block.start - 1, -1):
+            quad = code[index]
+            name = defined_name(quad)
+            if name is not None:
+                if name in bits:
+                    bit = 1 << bits[name]
+                    if not live & bit:
+                        if dead is not None:
+                            dead.append(index)
+                        continue
+                    live ^= bit
+                elif name in local:
+                    local.discard(name)
+                else:
+                    if dead is not None:
+                        dead.append(index)
+                    continue
+            for name in used_names(quad):
+                if name in bits:
+                    live |= 1 << bits[name]
+                else:
+                    local.add(name)
+        return live
+
+
+class ReachingDefinitions:
+    """Definitions that reach each block (forward, union).
+
+    The domain holds the indexes in cfg.code of the instructions defining a
+    global name; other definitions are only ever read in their own block.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.domain = BitDomain()
+        code = cfg.code
+        names = global_names(cfg)
+        defs_of = {}
+        for index, quad in enumerate(code):
+            name = defined_name(quad)
+            if name in names:
+                defs_of[name] = defs_of.get(name, 0) | self.domain.bit(index)
+        gen = []
+        kill = []
+        for block in cfg.blocks:
+            block_gen = block_kill = 0
+            for index in range(block.start, block.end):
+                name = defined_name(code[index])
+                if name in names:
+                    block_gen = (block_gen ^ (block_gen & defs_of[name])) | self.domain.bit(index)
+                    block_kill |= defs_of[name]
+            gen.append(block_gen)
+            kill.append(block_kill)
+        self.reach_in, self.reach_out = solve(cfg, gen, kill)
+
+
+class AvailableExpressions:
+    """Arithmetic expressions computed on every path to each block and not
+    invalidated since (forward, intersection).
+
+    The domain holds expression keys (see expression_key) whose operands
+    are constants or global names. An expression over a block-local name
+    is always preceded in its block by that name's definition, so it can
+    never be available on entry.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.domain = BitDomain()
+        bit = self.domain.bit
+        code = cfg.code
+        names = global_names(cfg)
+        keys = {}
+        uses_of = {}
+        for index, quad in enumerate(code):
+            if quad.op in ARITHMETIC:
+                used = used_names(quad)
+                if all(name in names for name in used):
+                    key = expression_key(quad)
+                    keys[index] = key
+                    for name in used:
+                        uses_of[name] = uses_of.get(name, 0) | bit(key)
+        gen = []
+        kill = []
+        for block in cfg.blocks:
+            block_gen = block_kill = 0
+            for index in range(block.start, block.end):
+                key = keys.get(index)
+                if key is not None:
+                    block_gen |= bit(key)
+                name = defined_name(code[index])
+                if name in uses_of:
+                    block_gen ^= block_gen & uses_of[name]
+                    block_kill |= uses_of[name]
+            gen.append(block_gen)
+            kill.append(block_kill)
+        self.avail_in, self.avail_out = solve(
+            cfg, gen, kill, meet=operator.and_, top=self.domain.full())
+
+
+if __name__ == "__main__":
+    code = parse_code([
+        "t1 = a + b",
+        "x = t1",
+        "if x > 10 goto L1",
+        "t2 = b + a",
+        "y = t2",
+        "L1:",
+        "t3 = a + b",
+        "print t3",
+    ])
+    cfg = ControlFlowGraph(code)
+    liveness = Liveness(cfg)
+    reaching = ReachingDefinitions(cfg)
+    available = AvailableExpressions(cfg)
+    for block in cfg.blocks:
+        print(f"B{block.index} -> {block.successors}: {format_code(cfg.instructions(block))}")
+        print("   live out:", sorted(str(name) for name in liveness.domain.decode(liveness.live_out[block.index])))
+        print("   reaching:", reaching.domain.decode(reaching.reach_in[block.index]))
+        print("   available:", [f"{a} {op} {b}" for op, a, b in available.domain.decode(available.avail_in[block.index])])
+
+    # Scaling on a large generated program
+    import time
+    for size in (10_000, 100_000):
+        lines = []
+        for i in range(size):
+            lines += [f"t{i} = a{i % 50} + b", f"x{i % 50} = t{i}", f"if x{i % 50} > 0 goto L{i}",
+                      f"print x{i % 50}", f"L{i}:"]
+        code = parse_code(lines)
+        start = time.perf_counter()
+        cfg = ControlFlowGraph(code)
+        Liveness(cfg)
+        ReachingDefinitions(cfg)
+        AvailableExpressions(cfg)
+        print(f"{len(code)} instructions, {len(cfg.blocks)} blocks: {time.perf_counter() - start:.2f}s")
@@ -1,50 +1,89 @@
-class IntermediateCodeGenerator:
+from ir import ASSIGN, LABEL, LABEL_OP, NEGATED, PRINT, TEMP, VAR, Operand, Quad, const
+from nodes import BinaryOp, Conditional, NodeVisitor
+
+
+class IntermediateCodeGenerator(NodeVisitor):
     def __init__(self, ast):
         self.ast = ast
         self.three_address_code = []
         self.temp_counter = 0
+        self.label_counter = 0
         
     def new_temp(self):
         self.temp_counter += 1
-        return f"t{self.temp_counter}"
+        return Operand(TEMP, f"t{self.temp_counter}")
+
+    def new_label(self):
+        self.label_counter += 1
+        return Operand(LABEL, f"L{self.label_counter}")
     
     def generate(self):
         self.visit(self.ast)
         return self.three_address_code
     
-    def visit(self, node):
-        if node['type'] == 'program':
-            for stmt in node['statements']:
-                self.visit(stmt)
-        elif node['type'] == 'declaration':
-            # Declarations don't generate code in three-address form
-            pass
-        elif node['type'] == 'assignment':
-            expr_result = self.visit_expression(node['expression'])
-            self.three_address_code.append(f"{node['var_name']} = {expr_result}")
-        elif node['type'] == 'print':
-            self.three_address_code.append(f"print {node['var_name']}")
-        elif node['type'] == 'conditional':
-            condition_result = self.visit_condition(node['condition'])
-            self.three_address_code.append(f"if {condition_result} goto L{self.temp_counter}")
-            for stmt in node['statements']:
+    def visit_program(self, node):
+        self.visit_statements(node.statements)
+
+    def visit_statements(self, statements):
+        # Statements in order from an explicit stack, so ifs nest to any
+        # depth: an if's body goes on the stack above the label that ends it
+        stack = statements[::-1]
+        while stack:
+            stmt = stack.pop()
+            if stmt.__class__ is Operand:
+                self.three_address_code.append(Quad(LABEL_OP, stmt))
+            elif stmt.__class__ is Conditional:
+                left, operator, right = self.visit(stmt.condition)
+                label = self.new_label()
+                # Jump over the body when the condition is false
+                self.three_address_code.append(Quad(NEGATED[operator], label, left, right))
+                stack.append(label)
+                stack.extend(reversed(stmt.statements))
+            else:
                 self.visit(stmt)
-            self.three_address_code.append(f"L{self.temp_counter}:")
-    
-    def visit_expression(self, node):
-        if node['type'] == 'constant':
-            return str(node['value'])
-        elif node['type'] == 'identifier':
-            return node['value']
-        elif node['type'] == 'binary_op':
-            left = self.visit_expression(node['left'])
-            right = self.visit_expression(node['right'])
-            temp = self.new_temp()
-            self.three_address_code.append(f"{temp} = {left} {node['operator']} {right}")
-            return temp
-    
-    def visit_condition(self, node):
-        left = self.visit_expression(node['left'])
-        right = self.visit_expression(node['right'])
-        return f"{left} {node['operator']} {right}"
 
+    def visit_declaration(self, node):
+        # Declarations don't generate code in three-address form
+        pass
+
+    def visit_assignment(self, node):
+        expr_result = self.visit(node.expression)
+        self.three_address_code.append(Quad(ASSIGN, Operand(VAR, node.var_name), expr_result))
+
+    def visit_print(self, node):
+        self.three_address_code.append(Quad(PRINT, None, Operand(VAR, node.var_name)))
+
+    def visit_conditional(self, node):
+        self.visit_statements([node])
+
+    def visit_constant(self, node):
+        return const(node.value)
+
+    def visit_identifier(self, node):
+        return Operand(VAR, node.value)
+
+    def visit_binary_op(self, node):
+        # Post-order walk with an explicit stack; `results` holds the operands
+        # computed so far, in the order the recursive walk made them.
+        results = []
+        stack = [(node, False)]
+        while stack:
+            node, operands_done = stack.pop()
+            if node.__class__ is not BinaryOp:
+                results.append(self.visit(node))
+            elif operands_done:
+                right = results.pop()
+                left = results.pop()
+                temp = self.new_temp()
+                self.three_address_code.append(Quad(node.operator, temp, left, right))
+                results.append(temp)
+            else:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        return results[0]
+
+    def visit_condition(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        return left, node.operator, right
@@ -0,0 +1,200 @@
+import tempfile
+
+from lexer import TOKEN_PATTERN, ChunkReader, blocks
+
+# A Spool moves from memory to a temporary file once it holds this many characters
+SPOOL_SIZE = 1 << 20
+
+
+class Diagnostic(str):
+    """An error message that knows which token it is about.
+
+    It is a str, so it compares, prints and serializes as its text just
+    like the plain-string errors it replaces. The parser records the index
+    of the token it stopped at; the semantic analyzer, which only knows
+    where statements start, records the statement's first token and the
+    `name` to look for from there, skipping `occurrence` earlier matches.
+    locate() turns either into a `line` and `column`, which then lead the
+    text.
+    """
+
+    def __new__(cls, message, token=None, name=None, occurrence=0, line=None, column=None):
+        text = message if line is None else f"Line {line}, column {column}: {message}"
+        self = super().__new__(cls, text)
+        self.message = message
+        self.token = token
+        self.name = name
+        self.occurrence = occurrence
+        self.line = line
+        self.column = column
+        return self
+
+    def __reduce__(self):
+        return (Diagnostic, (self.message, self.token, self.name, self.occurrence,
+                             self.line, self.column))
+
+    def shifted(self, tokens):
+        """The same diagnostic for a token stream that has `tokens` more
+        tokens in front of this one's."""
+        if self.token is None:
+            return self
+        return Diagnostic(self.message, self.token + tokens, self.name, self.occurrence)
+
+
+def locate(source, *groups, tokens=None):
+    """Give every Diagnostic in `groups` (lists of errors) its line and
+    column in `source`, the program text or an iterable of text chunks, in
+    one scan of the source that stops after the last one. Returns the
+    groups as new lists; errors without a token index (or plain strings)
+    are passed through. Only one chunk of the source is held at a time.
+
+    `tokens` may be the TokenStore the text was lexed into: the tokens'
+    recorded offsets are used then, and the text is only searched for line
+    breaks."""
+    # Token index -> the diagnostics found there or searching from there
+    starts = {}
+    for group in groups:
+        for error in group:
+            if getattr(error, 'token', None) is not None and error.line is None:
+                starts.setdefault(error.token, []).append(error)
+    if not starts:
+        return [list(group) for group in groups]
+    if tokens is not None:
+        return locate_offsets(source, tokens, starts, groups)
+
+    places = {}        # id(diagnostic) -> (line, column)
+    searches = {}      # name -> [[diagnostic, matches still to skip]]
+    remaining = len(starts)
+    index = -1
+    # Lines are counted up to each place in turn, so the pass stays linear:
+    # `line` is the line at offset `counted` of the block, which starts
+    # at `base` in the source; `line_start` is where that line starts
+    line, line_start, base = 1, 0, 0
+    for block in blocks((source,) if isinstance(source, str) else source):
+        counted = 0
+        for match in TOKEN_PATTERN.finditer(block):
+            index += 1
+            found = starts.get(index)
+            waiting = searches.get(match.group()) if searches else None
+            if found is None and not waiting:
+                continue
+            offset = match.start()
+            newlines = block.count('\n', counted, offset)
+            if newlines:
+                line += newlines
+                line_start = base + block.rfind('\n', counted, offset) + 1
+            counted = offset
+            place = (line, base + offset - line_start + 1)
+            if found is not None:
+                remaining -= 1
+                for error in found:
+                    if error.name is None:
+                        places[id(error)] = place
+                    else:
+                        searches.setdefault(error.name, []).append([error, error.occurrence])
+                waiting = searches.get(match.group())
+            if waiting:
+                for search in waiting:
+                    if search[1] == 0:
+                        places[id(search[0])] = place
+                    search[1] -= 1
+                waiting[:] = [search for search in waiting if search[1] >= 0]
+                if not waiting:
+                    del searches[match.group()]
+            if not remaining and not searches:
+                break
+        else:
+            newlines = block.count('\n', counted)
+            if newlines:
+                line += newlines
+                line_start = base + block.rfind('\n', counted) + 1
+            base += len(block)
+            continue
+        break
+    # Errors at the end of the input, and any search that ran off the end,
+    # point just past the last character
+    for found in starts.values():
+        for error in found:
+            places.setdefault(id(error), (line, base - line_start + 1))
+
+    return placed(groups, places)
+
+
+def locate_offsets(text, store, starts, groups):
+    """locate() for `text` lexed into `store`, a TokenStore."""
+    # (offset, id(diagnostic)), in the order of the text
+    offsets = []
+    for found in starts.values():
+        for error in found:
+            index = error.token
+            if error.name is not None:
+                index = store.find(error.name, index, error.occurrence)
+            # Errors at the end of the input, and any search that ran off
+            # the end, point just past the last character
+            offset = len(text) if index is None or index >= len(store) else store.offsets[index]
+            offsets.append((offset, id(error)))
+    offsets.sort()
+    places = {}
+    line, line_start, counted = 1, 0, 0
+    for offset, key in offsets:
+        newlines = text.count('\n', counted, offset)
+        if newlines:
+            line += newlines
+            line_start = text.rfind('\n', counted, offset) + 1
+        counted = offset
+        places[key] = (line, offset - line_start + 1)
+    return placed(groups, places)
+
+
+def placed(groups, places):
+    """`groups` with each diagnostic given its (line, column) in `places`,
+    by id."""
+    def place(error):
+        found = places.get(id(error))
+        if found is None:
+            return error
+        return Diagnostic(error.message, error.token, error.name, error.occurrence, *found)
+
+    return [[place(error) for error in group] for group in groups]
+
+
+def rereadable(source):
+    """`source`, the program text or an iterable of text chunks, in a form
+    that can be streamed through the front end and then read again by
+    locate() if there are errors. Text, lists and seekable streams (see
+    lexer.ChunkReader) are read again as they are; any other iterable is
+    copied to a Spool as it is read."""
+    if isinstance(source, str):
+        return (source,)
+    if isinstance(source, (list, tuple)) or getattr(source, 'rereadable', False):
+        return source
+    return Spool(source)
+
+
+class Spool:
+    """An iterable of text chunks that can be iterated more than once. The
+    first pass copies the chunks to a temporary file, which is kept in
+    memory only until it outgrows SPOOL_SIZE; later passes read it back."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.file = None
+
+    def __iter__(self):
+        if self.file is None:
+            self.file = tempfile.SpooledTemporaryFile(SPOOL_SIZE, 'w+', encoding='utf-8',
+                                                      errors='surrogatepass', newline='')
+            return self.record()
+        self.file.flush()
+        self.file.seek(0)
+        return iter(ChunkReader(self.file))
+
+    def record(self):
+        write = self.file.write
+        for chunk in self.chunks:
+            write(chunk)
+            yield chunk
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
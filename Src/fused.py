@@ -0,0 +1,161 @@
+from codegen import IntermediateCodeGenerator
+from diagnostics import Diagnostic, locate, rereadable
+from ir import ASSIGN, LABEL_OP, NEGATED, PRINT, VAR, Operand, Quad, const
+from lexer import Lexer
+from parser import Parser
+
+
+class FusedFrontEnd(Parser):
+    """Lexer, parser, semantic analyzer and code generator in one pass.
+
+    Tokens are pulled from the lexer as the parser needs them; each
+    statement is checked against the symbol table and turned into
+    three-address code as soon as it is parsed, through the parser's
+    semantic actions, so neither a token list nor an AST is ever built.
+    The lexer's symbol table is the only one: every identifier gets its
+    entry when first lexed, and a declaration fills in the entry's type.
+
+    The code, errors and declarations match the multi-pass front end's.
+    Like it, this carries on after errors, so one run reports them all.
+    """
+
+    def __init__(self, source):
+        """`source` is the program text or an iterable of text chunks."""
+        self.lexer = Lexer('')
+        # Read again to place the errors in, if there are any
+        self.source = rereadable(source)
+        super().__init__(self.lexer.iter_tokens(self.source))
+        self.symbol_table = self.lexer.symbol_table
+        self.generator = IntermediateCodeGenerator(None)
+        self.emit = self.generator.three_address_code.append
+        self.semantic_errors = []
+        # Identifiers read by an assignment to an undeclared variable
+        # aren't checked, as in SemanticAnalyzer.visit_assignment
+        self.check_uses = True
+        # Errors count per name in the current statement, as in SemanticAnalyzer
+        self.statement = None
+        self.occurrences = {}
+        # Labels ending the if bodies being parsed; None when the jump to
+        # it wasn't emitted
+        self.labels = []
+
+    def compile(self):
+        """Run the whole front end: returns (three-address code, parse
+        errors, semantic errors), errors with their line and column. The
+        code is empty if there are errors."""
+        self.parse_statement_list()
+        if self.errors or self.semantic_errors:
+            parse_errors, semantic_errors = locate(self.source, self.errors, self.semantic_errors)
+            return [], parse_errors, semantic_errors
+        return self.generator.three_address_code, [], []
+
+    def declarations(self):
+        """The declared variables, as SemanticAnalyzer.symbol_table has them."""
+        return {name: entry for name, entry in self.symbol_table.items()
+                if entry['type'] is not None}
+
+    @property
+    def failed(self):
+        return self.errors or self.semantic_errors
+
+    def identifier(self, name):
+        if self.check_uses and self.symbol_table[name]['type'] is None:
+            occurrence = self.occurrences.get(name, 0)
+            self.occurrences[name] = occurrence + 1
+            self.semantic_errors.append(
+                Diagnostic(f"Undeclared variable '{name}'", self.statement, name, occurrence))
+        return Operand(VAR, name)
+
+    constant = staticmethod(const)
+
+    def _reduce(self, operands, operator):
+        right = operands.pop()
+        temp = self.generator.new_temp()
+        self.emit(Quad(operator, temp, operands[-1], right))
+        operands[-1] = temp
+
+    def declaration(self, var_type, var_name, position):
+        entry = self.symbol_table[var_name]
+        if entry['type'] is not None:
+            self.semantic_errors.append(
+                Diagnostic(f"Multiple declaration of variable '{var_name}'", position + 1))
+        else:
+            entry['type'] = var_type
+            entry['initialized'] = False
+
+    def begin_assignment(self, var_name, position):
+        entry = self.symbol_table[var_name]
+        if entry['type'] is None:
+            self.semantic_errors.append(Diagnostic(f"Undeclared variable '{var_name}'", position))
+            self.check_uses = False
+        else:
+            entry['initialized'] = True
+        self.statement = position
+        self.occurrences = {}
+
+    def assignment(self, var_name, expression, position):
+        self.check_uses = True
+        if expression is not None and not self.failed:
+            self.emit(Quad(ASSIGN, Operand(VAR, var_name), expression))
+
+    def print_statement(self, var_name, position):
+        if self.symbol_table[var_name]['type'] is None:
+            self.semantic_errors.append(
+                Diagnostic(f"Undeclared variable '{var_name}' in print statement", position + 2))
+        self.emit(Quad(PRINT, None, Operand(VAR, var_name)))
+
+    def parse_conditional(self):
+        # Uses in the condition are counted from the 'if'
+        self.statement = self.position
+        self.occurrences = {}
+        return super().parse_conditional()
+
+    def condition(self, left, operator, right):
+        return left, operator, right
+
+    def begin_conditional(self, condition):
+        # Jump over the body when the condition is false
+        label = None
+        if not self.failed:
+            left, operator, right = condition
+            label = self.generator.new_label()
+            self.emit(Quad(NEGATED[operator], label, left, right))
+        self.labels.append(label)
+
+    def conditional(self, condition, statements, position):
+        label = self.labels.pop()
+        if label is not None:
+            self.emit(Quad(LABEL_OP, label))
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+    from codegen import IntermediateCodeGenerator as Generator
+    from ir import format_code
+    from semantic import SemanticAnalyzer
+
+    source = "int x;\nfloat y;\nx = 10 + 5 * 2;\nif (x > 3) { y = x / 4; print(y); }\n"
+    code, parse_errors, semantic_errors = FusedFrontEnd(source).compile()
+    print("\n".join(format_code(code)))
+    print(FusedFrontEnd("int x; x = y + 1; print(z);").compile())
+
+    def multi_pass(source):
+        lexer = Lexer(source)
+        tokens, _ = lexer.tokenize()
+        ast, errors = Parser(tokens).parse()
+        SemanticAnalyzer(ast).analyze()
+        return Generator(ast).generate()
+
+    line = "int a{0};\na{0} = (a{0} + 25) * 3 - a{0} / 2;\nif (a{0} > 100) {{ print(a{0}); }}\n"
+    big = "".join(line.format(i) if i < 500 else line.format(i % 500).split('\n', 1)[1]
+                  for i in range(20000))
+    for name, run in (("multi-pass", multi_pass), ("fused", lambda s: FusedFrontEnd(s).compile()[0])):
+        started = time.perf_counter()
+        run(big)
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        run(big)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:10} {elapsed:6.2f} s  peak {peak / 2**20:7.1f} MiB")
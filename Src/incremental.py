@@ -0,0 +1,334 @@
+import re
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import accumulate, chain
+
+from codegen import IntermediateCodeGenerator
+from diagnostics import Diagnostic, locate
+from lexer import Lexer
+from nodes import Program
+from parser import Parser
+from semantic import SemanticAnalyzer, statement_events
+
+# The characters that can end a top-level statement, plus the opening
+# brace that postpones the end until its block closes.
+BOUNDARY = re.compile(r'[;{}]')
+
+
+def statement_ends(text, pos=0, depth=0):
+    """Yield the offsets just past each top-level statement in text[pos:],
+    which starts `depth` blocks deep.
+
+    A statement ends at a ';' outside braces or at the '}' closing its
+    outermost block; an unmatched '}' ends a statement of its own. Both
+    characters are always tokens by themselves, so splitting the source
+    there never cuts a lexeme.
+    """
+    for match in BOUNDARY.finditer(text, pos):
+        if match.group() == '{':
+            depth += 1
+        elif match.group() == ';':
+            if depth == 0:
+                yield match.end()
+        else:
+            if depth:
+                depth -= 1
+            if depth == 0:
+                yield match.end()
+
+
+class Unit:
+    """One top-level statement: its text (with the whitespace before it)
+    and everything the front end derived from that text alone."""
+
+    __slots__ = ('text', 'closed', 'tokens', 'names', 'statements', 'parse_errors',
+                 'events', 'code')
+
+    def __init__(self, text, closed):
+        self.text = text
+        self.closed = closed
+
+
+def _moved(error, tokens, lines, column):
+    """`error`, located in text that starts `tokens` tokens, `lines` newlines
+    and `column` - 1 characters into the source, placed in the source."""
+    if error.line is None:
+        return error
+    if error.line == 1:
+        column = error.column + column - 1
+    else:
+        column = error.column
+    return Diagnostic(error.message, error.token + tokens, error.name, error.occurrence,
+                      error.line + lines, column)
+
+
+class IncrementalCompilation:
+    """A compile that can be updated by text edits.
+
+    The source is kept as a list of top-level statement units. An edit
+    re-lexes and re-parses only the units it touches, up to the first
+    statement boundary after it where the old and new splits agree; every
+    other unit keeps its tokens, AST subtrees and three-address code.
+    Whole-program results are brought up to date by analyze(), once per
+    edit and only when asked for: semantic analysis replays the cached
+    symbol-table checks of the units from the first one edited on, after
+    rewinding the symbol table to where it stood before that unit, and
+    only their errors are located again. The code is the units' code
+    concatenated (see code()).
+
+    A compilation isn't safe to edit and read from several threads at
+    once; `lock` is there for callers that share one.
+
+    Temporaries and labels are numbered from counters that only grow, so
+    units generated at different times never clash; after an edit the
+    numbers can differ from those of a fresh compile of the same text.
+    """
+
+    def __init__(self, source):
+        self.lock = threading.Lock()
+        self.temp_counter = 0
+        self.label_counter = 0
+        self.units = self.split(source)
+        self.ends = list(accumulate(len(unit.text) for unit in self.units))
+        self.results = None
+        # The semantic state carried from unit to unit. For each unit
+        # checked, `checks` holds where it starts (tokens, newlines and
+        # column before it), the error counts before it and the undo log
+        # of its symbol table changes; `end` is where the last one ends.
+        # Units from `checked` on are out of date.
+        self.analyzer = SemanticAnalyzer(None)
+        self.checks = []
+        self.checked = 0
+        self.end = (0, 0, 1)
+        self.parse_errors = []
+        self.semantic_errors = []
+        # The units rebuilt since changes() was last called, as
+        # (first, units they replaced, count), or None
+        self.changed = (0, 0, len(self.units))
+
+    def split(self, text):
+        units = []
+        start = 0
+        for end in statement_ends(text):
+            units.append(self.unit(text[start:end], True))
+            start = end
+        if start < len(text):
+            units.append(self.unit(text[start:], False))
+        return units
+
+    def unit(self, text, closed):
+        unit = Unit(text, closed)
+        lexer = Lexer(text)
+        unit.tokens, symbol_table = lexer.tokenize()
+        unit.names = tuple(symbol_table)
+        ast, unit.parse_errors = Parser(unit.tokens).parse()
+        unit.statements = ast.statements
+        unit.events = tuple(chain.from_iterable(map(statement_events, ast.statements)))
+
+        # A tree with syntax errors has missing parts, and its code would
+        # be thrown away
+        unit.code = []
+        if not unit.parse_errors:
+            generator = IntermediateCodeGenerator(ast)
+            generator.temp_counter = self.temp_counter
+            generator.label_counter = self.label_counter
+            unit.code = generator.generate()
+            self.temp_counter = generator.temp_counter
+            self.label_counter = generator.label_counter
+        return unit
+
+    def edit(self, offset, length, replacement):
+        """Replace source[offset:offset + length] with `replacement` and
+        bring every result up to date. Returns the number of units that
+        were rebuilt."""
+        ends = self.ends
+        total = ends[-1] if ends else 0
+        if offset < 0 or length < 0 or offset + length > total:
+            raise ValueError(f"Edit {offset}:{offset + length} is outside the source (length {total})")
+
+        units = self.units
+        # Units wholly before the edit end with a statement boundary, so
+        # splitting can restart right after them. Only the last unit can be
+        # unterminated, and then text appended to it joins it.
+        first = bisect_right(ends, offset)
+        if first == len(units) and units and not units[-1].closed:
+            first -= 1
+        last = max(first, bisect_left(ends, offset + length) + 1)
+        start = ends[first - 1] if first else 0
+        text = ''.join(unit.text for unit in units[first:last])
+        text = text[:offset - start] + replacement + text[offset + length - start:]
+
+        # If the edited text no longer ends on a boundary, the statement runs
+        # on into the following units: take in more of them, doubling each
+        # time, until the split comes back into step with the old one.
+        step = 1
+        while last < len(units):
+            tail = 0
+            for tail in statement_ends(text):
+                pass
+            if tail == len(text):
+                break
+            more = min(len(units), last + step)
+            text += ''.join(unit.text for unit in units[last:more])
+            last = more
+            step *= 2
+
+        rebuilt = self.split(text)
+        self.checked = min(self.checked, first)
+        self.record_change(first, last, len(rebuilt))
+        delta = len(replacement) - length
+        units[first:last] = rebuilt
+        ends[first:last] = list(accumulate((len(unit.text) for unit in rebuilt), initial=start))[1:]
+        if delta:
+            tail = first + len(rebuilt)
+            ends[tail:] = [end + delta for end in ends[tail:]]
+        self.results = None
+        return len(rebuilt)
+
+    def record_change(self, first, last, count):
+        """Fold the replacement of units[first:last] by `count` units into
+        the change changes() will report."""
+        if self.changed is None:
+            self.changed = (first, last - first, count)
+            return
+        start, removed, current = self.changed
+        low, high = min(start, first), max(start + current, last)
+        self.changed = (low, high - low - current + removed, high - low - (last - first) + count)
+
+    def changes(self):
+        """(first, removed, units): the units rebuilt since the last call,
+        which replace `removed` units from index `first` of the units as
+        they were then."""
+        if self.changed is None:
+            return 0, 0, []
+        first, removed, count = self.changed
+        self.changed = None
+        return first, removed, self.units[first:first + count]
+
+    def analyze(self):
+        """Bring the whole-program results up to date, once per edit, and
+        return them: (parse errors, semantic errors, declared symbols).
+        Only the units from the first one edited on are checked again."""
+        if self.results is None:
+            analyzer = self.analyzer
+            checked = self.checked
+            if checked < len(self.checks):
+                tokens, lines, column, parse_count, semantic_count, _ = self.checks[checked]
+                analyzer.rewind(list(chain.from_iterable(check[-1] for check in self.checks[checked:])),
+                                semantic_count)
+                del self.checks[checked:]
+                del self.parse_errors[parse_count:]
+                del self.semantic_errors[semantic_count:]
+                self.end = (tokens, lines, column)
+
+            # Positions in a unit count from its first token; errors are
+            # located in the text from the first unit checked, so they are
+            # kept relative to it until then
+            start = tokens, lines, column = self.end
+            parse_errors = []
+            semantic_count = len(analyzer.errors)
+            for unit in self.units[checked:]:
+                undo = []
+                self.checks.append((tokens, lines, column,
+                                    len(self.parse_errors) + len(parse_errors),
+                                    len(analyzer.errors), undo))
+                parse_errors.extend(error.shifted(tokens - start[0]) for error in unit.parse_errors)
+                analyzer.replay(unit.events, tokens, undo)
+                tokens += len(unit.tokens)
+                newlines = unit.text.count('\n')
+                if newlines:
+                    lines += newlines
+                    column = len(unit.text) - unit.text.rfind('\n')
+                else:
+                    column += len(unit.text)
+            self.end = (tokens, lines, column)
+            self.checked = len(self.units)
+
+            semantic_errors = [error.shifted(-start[0]) for error in analyzer.errors[semantic_count:]]
+            if parse_errors or semantic_errors:
+                text = ''.join(unit.text for unit in self.units[checked:])
+                parse_errors, semantic_errors = locate(text, parse_errors, semantic_errors)
+            self.parse_errors.extend(_moved(error, *start) for error in parse_errors)
+            self.semantic_errors.extend(_moved(error, *start) for error in semantic_errors)
+            declared = {name: dict(entry) for name, entry in analyzer.symbol_table.items()}
+            self.results = (list(self.parse_errors), list(self.semantic_errors), declared)
+        return self.results
+
+    def code(self):
+        """The whole program's three-address code: the units' code, or
+        nothing if there are errors."""
+        parse_errors, semantic_errors, _ = self.analyze()
+        if parse_errors or semantic_errors:
+            return []
+        return list(chain.from_iterable(unit.code for unit in self.units))
+
+    @property
+    def source(self):
+        return ''.join(unit.text for unit in self.units)
+
+    def tokens(self):
+        return list(chain.from_iterable(unit.tokens for unit in self.units))
+
+    def symbol_table(self):
+        """The lexer's symbol table: every identifier, in order of first
+        appearance."""
+        names = dict.fromkeys(chain.from_iterable(unit.names for unit in self.units))
+        return {name: {'type': None, 'value': None} for name in names}
+
+    def ast(self):
+        return Program(list(chain.from_iterable(unit.statements for unit in self.units)))
+
+
+class CompilationHandles:
+    """Open IncrementalCompilations by handle, for clients that send edits
+    instead of whole sources. The least recently used are dropped beyond
+    `max_handles`. Safe to share between request threads: the registry's
+    lock is only held to look handles up, and edits to one compilation are
+    serialised by its own lock, so compilations are edited in parallel."""
+
+    def __init__(self, max_handles=64):
+        self.max_handles = max_handles
+        self.compilations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def open(self, source):
+        """Compile `source` and return (handle, compilation)."""
+        compilation = IncrementalCompilation(source)
+        handle = uuid.uuid4().hex
+        with self.lock:
+            self.compilations[handle] = compilation
+            while len(self.compilations) > self.max_handles:
+                self.compilations.popitem(last=False)
+        return handle, compilation
+
+    def edit(self, handle, offset, length, replacement):
+        """Apply an edit to an open compilation and return it. Raises
+        KeyError for an unknown or expired handle."""
+        with self.lock:
+            compilation = self.compilations[handle]
+            self.compilations.move_to_end(handle)
+        with compilation.lock:
+            compilation.edit(offset, length, replacement)
+        return compilation
+
+
+if __name__ == "__main__":
+    import time
+    from ir import format_code
+
+    source = "int x;\nint y;\nx = 10;\nif (x > 5) { y = x * 2; print(y); }\n"
+    compilation = IncrementalCompilation(source)
+    rebuilt = compilation.edit(source.index('10'), 2, '3')
+    print(f"Rebuilt {rebuilt} of {len(compilation.units)} units:")
+    print(compilation.source)
+    print("\n".join(format_code(compilation.code())))
+
+    # An edit costs about the same however long the program around it is
+    for copies in (100, 1000, 10000):
+        big = "int a;\n" + "a = a + 1;\nif (a > 3) { a = a - 2; }\n" * copies
+        compilation = IncrementalCompilation(big)
+        started = time.perf_counter()
+        compilation.edit(len(big) // 2, 0, "a = a * 2;\n")
+        print(f"{copies:6} statements: edit took {(time.perf_counter() - started) * 1000:.2f} ms")
@@ -0,0 +1,135 @@
+import re
+from collections import namedtuple
+from enum import IntEnum
+
+
+class OperandKind(IntEnum):
+    VAR = 0
+    TEMP = 1
+    INT = 2
+    FLOAT = 3
+    LABEL = 4
+    SPILL = 5
+
+
+VAR, TEMP, INT, FLOAT, LABEL, SPILL = OperandKind
+CONSTANT_KINDS = frozenset({INT, FLOAT})
+
+
+class Operand(namedtuple('Operand', 'kind value')):
+    """An instruction operand: a variable, temporary, constant, label or
+    spill slot.
+
+    Constants keep int and float apart (INT 1 != FLOAT 1.0), so operands can
+    be used directly as dict keys by the optimizers. Spill slots are cells
+    of the spill area the register allocator stores temporaries to (see
+    regalloc.py); they print in brackets, as [s1].
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        if self.kind == SPILL:
+            return f"[{self.value}]"
+        return str(self.value)
+
+    @property
+    def is_const(self):
+        return self.kind in CONSTANT_KINDS
+
+
+def const(value):
+    return Operand(FLOAT if isinstance(value, float) else INT, value)
+
+
+# Opcodes. Arithmetic quads are `dest = arg1 op arg2`, relational quads are
+# conditional jumps `if arg1 op arg2 goto dest`.
+ASSIGN = '='
+PRINT = 'print'
+GOTO = 'goto'
+LABEL_OP = 'label'
+ARITHMETIC = frozenset({'+', '-', '*', '/'})
+COMMUTATIVE = frozenset({'+', '*'})
+RELATIONAL = frozenset({'>', '<', '==', '!=', '<=', '>='})
+NEGATED = {'>': '<=', '<': '>=', '==': '!=', '!=': '==', '<=': '>', '>=': '<'}
+
+
+class Quad:
+    """One three-address instruction (op, dest, arg1, arg2)."""
+    __slots__ = ('op', 'dest', 'arg1', 'arg2')
+
+    def __init__(self, op, dest=None, arg1=None, arg2=None):
+        self.op = op
+        self.dest = dest
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __str__(self):
+        op = self.op
+        if op == ASSIGN:
+            return f"{self.dest} = {self.arg1}"
+        if op in ARITHMETIC:
+            return f"{self.dest} = {self.arg1} {op} {self.arg2}"
+        if op in RELATIONAL:
+            return f"if {self.arg1} {op} {self.arg2} goto {self.dest}"
+        if op == PRINT:
+            return f"print {self.arg1}"
+        if op == GOTO:
+            return f"goto {self.dest}"
+        if op == LABEL_OP:
+            return f"{self.dest}:"
+        raise ValueError(f"Unknown opcode {op!r}")
+
+    def __repr__(self):
+        return f"Quad({self.op!r}, {self.dest!r}, {self.arg1!r}, {self.arg2!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Quad):
+            return NotImplemented
+        return (self.op == other.op and self.dest == other.dest
+                and self.arg1 == other.arg1 and self.arg2 == other.arg2)
+
+
+def format_code(code):
+    """Pretty-print instructions as the text lines the UI shows."""
+    return [str(quad) for quad in code]
+
+
+_OPERATORS = r'(\+|-|\*|/)'
+_INSTRUCTION_PATTERNS = [
+    (re.compile(r'(\S+):$'), lambda m: Quad(LABEL_OP, Operand(LABEL, m[1]))),
+    (re.compile(r'print (\S+)$'), lambda m: Quad(PRINT, None, parse_operand(m[1]))),
+    (re.compile(r'goto (\S+)$'), lambda m: Quad(GOTO, Operand(LABEL, m[1]))),
+    (re.compile(r'if (\S+) (\S+) (\S+) goto (\S+)$'),
+     lambda m: Quad(m[2], Operand(LABEL, m[4]), parse_operand(m[1]), parse_operand(m[3]))),
+    (re.compile(rf'(\S+) = (\S+) {_OPERATORS} (\S+)$'),
+     lambda m: Quad(m[3], parse_operand(m[1]), parse_operand(m[2]), parse_operand(m[4]))),
+    (re.compile(r'(\S+) = (\S+)$'), lambda m: Quad(ASSIGN, parse_operand(m[1]), parse_operand(m[2]))),
+]
+
+_TEMP_NAME = re.compile(r't\d+$')
+_SPILL_NAME = re.compile(r'\[(s\d+)\]$')
+
+
+def parse_operand(text):
+    try:
+        return const(float(text) if '.' in text else int(text))
+    except ValueError:
+        if spill := _SPILL_NAME.match(text):
+            return Operand(SPILL, spill[1])
+        return Operand(TEMP if _TEMP_NAME.match(text) else VAR, text)
+
+
+def parse_code(lines):
+    """Read instructions back from their text form (names shaped like tN are
+    taken to be temporaries)."""
+    code = []
+    for line in lines:
+        line = line.strip()
+        for pattern, build in _INSTRUCTION_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                code.append(build(match))
+                break
+        else:
+            raise ValueError(f"Can't parse instruction {line!r}")
+    return code
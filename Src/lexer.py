@@ -1,4 +1,165 @@
 import re
+from itertools import chain
+
+from tokens import KIND_CODES, TokenStore
+
+# One master pattern for the whole language. Each match is a single lexeme;
+# whitespace never matches, so searching skips it. The alternatives mirror the
+# checks in get_next_token so both scanners agree on every input.
+TOKEN_PATTERN = re.compile(r'''
+      [^\W\d]\w*              # identifier or keyword
+    | \d[\d.]*                # number
+    | [=<>]=|[-+*/=<>]        # operator
+    | [;,(){}]                # delimiter
+    | \S                      # anything else is UNKNOWN
+    ''', re.VERBOSE)
+
+
+# Characters that always form a token of their own. Padding them with spaces
+# lets str.split() find most lexeme boundaries in C; only the chunks that are
+# still ambiguous afterwards (e.g. "x=10" or "12abc") go through TOKEN_PATTERN.
+SPLIT_CHARS = ';,(){}+-*/'
+
+# How much of a block is looked at to see which SPLIT_CHARS the source
+# already spaces out (commonly the operators): padding those again is wasted
+# work. Only speed depends on the guess; a chunk left with several lexemes
+# still goes through TOKEN_PATTERN.
+SAMPLE_SIZE = 1 << 12
+
+# Whitespace a streamed buffer may be cut at without splitting a lexeme.
+CUT_CHARS = ' \n\t\r'
+
+CHUNK_SIZE = 1 << 16
+
+
+def read_chunks(stream, size=CHUNK_SIZE):
+    """The contents of a text stream, `size` characters at a time (see
+    ChunkReader)."""
+    return ChunkReader(stream, size)
+
+
+def number_token(text):
+    """The token for a run of digits and dots: a CONSTANT, or UNKNOWN when
+    it isn't a number (such as "1.2.3"), for the parser to report."""
+    try:
+        return ('CONSTANT', float(text) if '.' in text else int(text))
+    except ValueError:
+        return ('UNKNOWN', text)
+
+
+class ChunkReader:
+    """Iterates over the contents of a text stream in chunks. A seekable
+    stream (a file) can be iterated again: every pass starts where the
+    first one did, so the text can be read twice without being kept."""
+
+    def __init__(self, stream, size=CHUNK_SIZE):
+        self.stream = stream
+        self.size = size
+        try:
+            self.start = stream.tell() if stream.seekable() else None
+        except (OSError, ValueError):
+            self.start = None
+
+    @property
+    def rereadable(self):
+        return self.start is not None
+
+    def __iter__(self):
+        if self.start is not None:
+            self.stream.seek(self.start)
+        read, size = self.stream.read, self.size
+        while chunk := read(size):
+            yield chunk
+
+
+def blocks(chunks):
+    """Regroup text chunks into blocks that end on whitespace (but the
+    last), so no lexeme straddles two blocks: each chunk is cut at its
+    last whitespace and the tail is carried over to the next."""
+    carry = ''
+    for chunk in chunks:
+        buffer = carry + chunk
+        cut = max(map(buffer.rfind, CUT_CHARS)) + 1
+        carry = buffer[cut:]
+        yield buffer[:cut]
+    if carry:
+        yield carry
+
+
+class _TokenCache(dict):
+    """Maps a whitespace-free chunk of source to its token.
+
+    Every distinct chunk and lexeme is classified once per lexer and repeated
+    occurrences share the same token tuple. A chunk holding several lexemes
+    maps to a list of tokens instead, and `packed` records that the result
+    needs flattening; `runs` then maps every chunk to a tuple of its tokens,
+    so the flattening is done by chain() in C.
+    """
+
+    def __init__(self, lexer):
+        super().__init__()
+        self.lexer = lexer
+        self.lexemes = {}
+        self.packed = False
+        self.runs = {}
+
+    def __missing__(self, chunk):
+        lexemes = TOKEN_PATTERN.findall(chunk)
+        if len(lexemes) == 1:
+            token = self.classify(chunk)
+        else:
+            token = list(map(self.classify, lexemes))
+            self.packed = True
+        self[chunk] = token
+        return token
+
+    def update_runs(self):
+        """Add the chunks classified since the last call to `runs`."""
+        runs = self.runs
+        for chunk in self.keys() - runs.keys():
+            token = self[chunk]
+            runs[chunk] = tuple(token) if token.__class__ is list else (token,)
+        return runs
+
+    def classify(self, text):
+        token = self.lexemes.get(text)
+        if token is not None:
+            return token
+        lexer = self.lexer
+        first = text[0]
+        if first.isalpha() or first == '_':
+            if text in lexer.KEYWORDS:
+                token = ('KEYWORD', text)
+            else:
+                if text not in lexer.symbol_table:
+                    lexer.symbol_table[text] = {'type': None, 'value': None}
+                token = ('IDENTIFIER', text)
+        elif first.isdigit():
+            token = number_token(text)
+        elif first in lexer.OPERATORS:
+            token = ('OPERATOR', text)
+        elif first in lexer.DELIMITERS:
+            token = ('DELIMITER', text)
+        else:
+            token = ('UNKNOWN', text)
+        self.lexemes[text] = token
+        return token
+
+
+class _InternTable(dict):
+    """Maps a lexeme to its slot in a TokenStore's side table, interning each
+    distinct lexeme on first sight."""
+
+    def __init__(self, lexer, store):
+        super().__init__()
+        self.cache = _TokenCache(lexer)
+        self.store = store
+
+    def __missing__(self, lexeme):
+        kind, value = self.cache.classify(lexeme)
+        slot = self[lexeme] = self.store.intern(KIND_CODES[kind], value)
+        return slot
+
 
 class Lexer:
     def __init__(self, source_code):
@@ -6,7 +167,8 @@ class Lexer:
         self.position = 0
         self.current_char = self.source_code[self.position] if source_code else None
         self.symbol_table = {}
-        
+        self.token_count = 0
+
     # Token types
     KEYWORDS = {'int', 'float', 'if', 'else', 'print'}
     OPERATORS = {'+', '-', '*', '/', '=', '>', '<', '==', '!='}
@@ -47,7 +209,7 @@ class Lexer:
             while self.current_char and (self.current_char.isdigit() or self.current_char == '.'):
                 number += self.current_char
                 self.advance()
-            return ('CONSTANT', float(number) if '.' in number else int(number))
+            return number_token(number)
         
         # Operators
         if self.current_char in self.OPERATORS:
@@ -70,12 +232,58 @@ class Lexer:
         self.advance()
         return ('UNKNOWN', char)
     
+    def scan(self, text, cache):
+        """Return the tokens of a block of text that ends on a lexeme boundary."""
+        sample = text[:SAMPLE_SIZE]
+        for char in SPLIT_CHARS:
+            padded = f' {char} '
+            if not 0 < sample.count(char) == sample.count(padded):
+                text = text.replace(char, padded)
+        parts = text.split()
+        tokens = list(map(cache.__getitem__, parts))
+        if cache.packed:
+            tokens = list(chain.from_iterable(map(cache.update_runs().__getitem__, parts)))
+        self.token_count += len(tokens)
+        return tokens
+
     def tokenize(self):
-        tokens = []
-        while True:
-            token = self.get_next_token()
-            if not token:
-                break
-            tokens.append(token)
+        """Scan the whole buffer at once: split it into chunks in C, then map
+        every chunk to its tokens through a per-lexer cache."""
+        tokens = self.scan(self.source_code or '', _TokenCache(self))
+        self.position = len(self.source_code or '')
+        self.current_char = None
         return tokens, self.symbol_table
 
+    def tokenize_store(self):
+        """Scan the whole buffer into a TokenStore, with each token's source
+        offset. The buffer is matched in whitespace-aligned blocks so the
+        temporary match lists stay bounded."""
+        source = self.source_code or ''
+        store = TokenStore()
+        index = _InternTable(self, store)
+        pos, end = 0, len(source)
+        while pos < end:
+            cut = max(source.rfind(char, pos, pos + CHUNK_SIZE) for char in CUT_CHARS) + 1
+            if cut <= pos or pos + CHUNK_SIZE >= end:
+                cut = end
+            matches = list(TOKEN_PATTERN.finditer(source, pos, cut))
+            store.extend(list(map(index.__getitem__, map(re.Match.group, matches))),
+                         list(map(re.Match.start, matches)))
+            pos = cut
+        self.token_count += len(store)
+        self.position = end
+        self.current_char = None
+        return store
+
+    def iter_tokens(self, chunks=None):
+        """Yield tokens lazily from an iterable of text chunks (the lexer's own
+        source by default). Each chunk is cut at its last whitespace and the
+        tail is carried over, so lexemes may straddle chunk boundaries and
+        only one chunk's worth of tokens is held at a time."""
+        if chunks is None:
+            chunks = (self.source_code or '',)
+        cache = _TokenCache(self)
+        for block in blocks(chunks):
+            self.position += len(block)
+            yield from self.scan(block, cache)
+        self.current_char = None
@@ -0,0 +1,48 @@
+import json
+import logging
+import sys
+
+ROOT = 'simplelang'
+
+# Library convention: nothing is emitted until the application asks for it
+logging.getLogger(ROOT).addHandler(logging.NullHandler())
+
+
+def get_logger(name):
+    """Logger for one compiler module, under the 'simplelang' hierarchy.
+    Silent until configure() is called."""
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object. A record's `data` extra (a dict)
+    is merged in, so structured values stay structured."""
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data = getattr(record, 'data', None)
+        if data:
+            entry.update(data)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(level='WARNING', json_format=False, stream=None):
+    """Send the compiler's log records at `level` and above to `stream`
+    (stderr by default), as text lines or JSON Lines."""
+    logger = logging.getLogger(ROOT)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
@@ -1,89 +1,448 @@
 # main.py - Complete Mini Compiler
 
+import argparse
+import contextlib
+import json
+import os
 import sys
-from lexer import Lexer
+from diagnostics import locate, rereadable
+from lexer import Lexer, read_chunks
 from parser import Parser
 from semantic import SemanticAnalyzer
 from codegen import IntermediateCodeGenerator
-from optimizer import ConstantFoldingOptimizer, CSEOptimizer
+from optimizer import run_passes
+from regalloc import DEFAULT_REGISTERS, allocate_registers
+from vm import BytecodeCompiler, VirtualMachine
+from pybackend import PythonCodeGenerator, PythonProgram
+from batch import BatchCompiler, collect_files, write_jsonl
+from artifact import Artifact, ArtifactError, is_artifact, save_artifact
+from fused import FusedFrontEnd
+from parallel import ParallelFrontEnd
+from ir import format_code
+from log import configure, get_logger
+from metrics import CompileMetrics
+
+logger = get_logger('main')
 
 class SimpleLangCompiler:
     def __init__(self, source_code):
+        """`source_code` is either the program text or an iterable of text
+        chunks (see lexer.read_chunks); chunks are lexed and parsed as a stream
+        without ever holding the whole token list or text. If there are
+        errors, the chunks are read again to give them their line and column
+        (see diagnostics.rereadable)."""
         self.source_code = source_code
         self.tokens = []
         self.ast = None
         self.errors = []
         self.symbol_table = {}
+        self.declarations = {}
         self.three_address_code = []
         self.optimized_code = []
+        self.pass_stats = []
+        self.fixed_point = False
+        self.registers = DEFAULT_REGISTERS
+        self.output = 'text'
+        self.metrics = CompileMetrics()
+        self.bytecode = None
+        self.python_program = None
         
-    def compile(self):
-        print("=== SimpleLang Compiler ===\n")
+    def compile(self, fixed_point=False, output='text', trace_memory=False, fused=False,
+                registers=DEFAULT_REGISTERS, workers=None):
+        """Compile the program. With `fixed_point`, the optimization passes
+        are repeated until the code stops changing. With `fused`, the front
+        end runs in a single pass that builds no token list or AST (see
+        fused.py); `tokens` and `ast` stay empty. With `workers`, the front
+        end runs over that many worker processes, on pieces of the source
+        split at top-level statements (see parallel.py); `tokens` and `ast`
+        stay empty then too. The optimized code's temporaries are allocated
+        to `registers` registers per type, spilling the rest to memory (see
+        regalloc.py), or left as generated if it is 0.
+
+        `output` chooses what is written to stdout: 'text' is the readable
+        phase-by-phase report, 'quiet' writes nothing and 'json' writes
+        report() as one JSON object at the end. Either way each phase's
+        time and counts are kept in `metrics`, with its peak memory too when
+        `trace_memory` is set.
+        """
+        self.fixed_point = fixed_point
+        self.registers = registers
+        self.output = output
+        self.errors = []
+        self.say("=== SimpleLang Compiler ===\n")
         
+        with CompileMetrics(trace_memory) as self.metrics:
+            if workers:
+                success = self.compile_parallel(workers)
+            elif fused:
+                success = self.compile_fused()
+            elif not isinstance(self.source_code, str):
+                success = self.compile_stream()
+            else:
+                success = self.compile_text()
+        logger.info("Compiled in %.6f s", sum(self.timings.values()),
+                    extra={'data': {'success': success, 'timings': self.timings}})
+        if output == 'json':
+            print(json.dumps(self.report()))
+        return success
+
+    def compile_text(self):
         # Phase 1: Lexical Analysis
-        print("1. Lexical Analysis:")
-        lexer = Lexer(self.source_code)
-        self.tokens, self.symbol_table = lexer.tokenize()
-        print(f"   Tokens generated: {len(self.tokens)}")
-        print(f"   Symbol table: {self.symbol_table}\n")
+        self.say("1. Lexical Analysis:")
+        with self.metrics.phase('lexer') as phase:
+            lexer = Lexer(self.source_code)
+            self.tokens = lexer.tokenize_store()
+            self.symbol_table = lexer.symbol_table
+            phase['tokens'] = len(self.tokens)
+        self.say(f"   Tokens generated: {len(self.tokens)}")
+        self.say(f"   Symbol table: {self.symbol_table}\n")
         
         # Phase 2: Syntax Analysis
-        print("2. Syntax Analysis:")
-        parser = Parser(self.tokens)
-        self.ast, parse_errors = parser.parse()
-        if parse_errors:
-            print(f"   Syntax errors: {parse_errors}")
+        self.say("2. Syntax Analysis:")
+        with self.metrics.phase('parser') as phase:
+            parser = Parser(self.tokens)
+            self.ast, parse_errors = parser.parse()
+            phase['nodes'] = self.ast.count()
+        return self.compile_ast(parse_errors, self.source_code, self.tokens)
+
+    def compile_stream(self):
+        # Phases 1 and 2 run interleaved: the parser pulls tokens from the
+        # lexer as it needs them.
+        self.say("1-2. Lexical and Syntax Analysis (streaming):")
+        with self.metrics.phase('lexer+parser') as phase:
+            lexer = Lexer('')
+            source = rereadable(self.source_code)
+            parser = Parser(lexer.iter_tokens(source))
+            self.ast, parse_errors = parser.parse()
+            self.symbol_table = lexer.symbol_table
+            phase['tokens'] = lexer.token_count
+            phase['nodes'] = self.ast.count()
+        self.say(f"   Tokens generated: {lexer.token_count}")
+        self.say(f"   Symbol table: {self.symbol_table}")
+        return self.compile_ast(parse_errors, source)
+
+    def compile_fused(self):
+        # Phases 1-4 in one pass over the tokens
+        self.say("1-4. Lexical, Syntax and Semantic Analysis, Code Generation (fused):")
+        with self.metrics.phase('front end') as phase:
+            front_end = FusedFrontEnd(self.source_code)
+            self.three_address_code, parse_errors, semantic_errors = front_end.compile()
+            self.symbol_table = front_end.symbol_table
+            phase['tokens'] = front_end.lexer.token_count
+            phase['instructions'] = len(self.three_address_code)
+        self.say(f"   Tokens generated: {front_end.lexer.token_count}")
+        return self.front_end_done(front_end, parse_errors, semantic_errors)
+
+    def compile_parallel(self, workers):
+        # Phases 1-4 for pieces of the program in parallel, then stitched together
+        self.say(f"1-4. Lexical, Syntax and Semantic Analysis, Code Generation ({workers} workers):")
+        with self.metrics.phase('front end') as phase:
+            front_end = ParallelFrontEnd(self.source_code, workers)
+            self.three_address_code, parse_errors, semantic_errors = front_end.compile()
+            self.symbol_table = front_end.symbol_table
+            phase['pieces'] = front_end.pieces
+            phase['tokens'] = front_end.token_count
+            phase['instructions'] = len(self.three_address_code)
+        self.say(f"   Tokens generated: {front_end.token_count} in {front_end.pieces} pieces")
+        return self.front_end_done(front_end, parse_errors, semantic_errors)
+
+    def front_end_done(self, front_end, parse_errors, semantic_errors):
+        """Report the errors of a front end that generates code itself, or
+        go on to optimize its code."""
+        self.errors = parse_errors + semantic_errors
+        if self.errors:
+            self.report_errors(parse_errors, semantic_errors)
             return False
-        print("   AST built successfully\n")
+        self.declarations = front_end.declarations()
+        self.say("   Three-address code:")
+        for code in self.three_address_code:
+            self.say(f"     {code}")
+        self.say()
+        return self.optimize()
+
+    def compile_ast(self, parse_errors, source, tokens=None):
+        """Check the AST and generate code from it. The AST may be partial:
+        the parser recovers from syntax errors, so semantic analysis still
+        runs and every error of both phases is reported, located in
+        `source`, the text or chunks the AST was parsed from (by way of
+        `tokens`, its TokenStore, if there is one)."""
+        if parse_errors:
+            self.say(f"   {len(parse_errors)} syntax error(s), AST partially built\n")
+        else:
+            self.say("   AST built successfully\n")
         
         # Phase 3: Semantic Analysis
-        print("3. Semantic Analysis:")
-        analyzer = SemanticAnalyzer(self.ast)
-        semantic_errors = analyzer.analyze()
-        if semantic_errors:
-            print(f"   Semantic errors: {semantic_errors}")
+        self.say("3. Semantic Analysis:")
+        with self.metrics.phase('semantic') as phase:
+            analyzer = SemanticAnalyzer(self.ast)
+            semantic_errors = analyzer.analyze()
+            phase['symbols'] = len(analyzer.symbol_table)
+        if parse_errors or semantic_errors:
+            parse_errors, semantic_errors = locate(source, parse_errors, semantic_errors,
+                                                   tokens=tokens)
+            self.errors = parse_errors + semantic_errors
+            self.report_errors(parse_errors, semantic_errors)
             return False
-        print("   No semantic errors\n")
+        self.declarations = analyzer.symbol_table
+        self.say("   No semantic errors\n")
         
         # Phase 4: Intermediate Code Generation
-        print("4. Intermediate Code Generation:")
-        generator = IntermediateCodeGenerator(self.ast)
-        self.three_address_code = generator.generate()
-        print("   Three-address code:")
+        self.say("4. Intermediate Code Generation:")
+        with self.metrics.phase('codegen') as phase:
+            generator = IntermediateCodeGenerator(self.ast)
+            self.three_address_code = generator.generate()
+            phase['instructions'] = len(self.three_address_code)
+        self.say("   Three-address code:")
         for code in self.three_address_code:
-            print(f"     {code}")
-        print()
-        
+            self.say(f"     {code}")
+        self.say()
+        return self.optimize()
+
+    def optimize(self):
         # Phase 5: Code Optimization
-        print("5. Code Optimization:")
-        # Apply constant folding
-        cf_optimizer = ConstantFoldingOptimizer()
-        folded_code = cf_optimizer.optimize(self.three_address_code)
-        
-        # Apply CSE
-        cse_optimizer = CSEOptimizer()
-        self.optimized_code = cse_optimizer.optimize(folded_code)
+        self.say("5. Code Optimization:")
+        # Constant folding, CSE, copy propagation and dead code elimination
+        # (each pass run is a phase of its own in `metrics`)
+        self.optimized_code, self.pass_stats = run_passes(
+            self.three_address_code, self.declarations, self.fixed_point, metrics=self.metrics)
+        self.optimized_code = allocate_registers(self.optimized_code, self.declarations,
+                                                 self.pass_stats, self.registers, self.metrics)
+        for name, before, after in self.pass_stats:
+            self.say(f"   {name}: {before} -> {after} instructions")
         
-        print("   Optimized code:")
+        self.say("   Optimized code:")
         for code in self.optimized_code:
-            print(f"     {code}")
-        print()
+            self.say(f"     {code}")
+        self.say()
         
         return True
 
+    def report_errors(self, parse_errors, semantic_errors):
+        for kind, errors in (("Syntax", parse_errors), ("Semantic", semantic_errors)):
+            if errors:
+                self.say(f"   {kind} errors:")
+                for error in errors:
+                    self.say(f"     {error}")
+
+    def say(self, *args):
+        """Print a line of the text report; nothing in the other modes."""
+        if self.output == 'text':
+            print(*args)
+
+    @property
+    def timings(self):
+        """Seconds spent in each phase of the last compile."""
+        return self.metrics.timings()
+
+    def report(self):
+        """The outcome of the last compile as JSON-ready data."""
+        return {
+            'success': not self.errors,
+            'errors': self.errors,
+            'timings': self.timings,
+            'metrics': self.metrics.to_dict(),
+            'instructions': len(self.three_address_code),
+            'optimized_code': format_code(self.optimized_code),
+            'passes': [{'name': name, 'before': before, 'after': after}
+                       for name, before, after in self.pass_stats],
+        }
+
+    def execute(self, output=None, backend='vm'):
+        """Run the compiled program, printing to `output` (stdout by
+        default), and return the final values of its variables.
+
+        backend='vm' interprets bytecode; backend='python' translates the
+        optimized code to a Python function, compiled once and kept for
+        later runs.
+        """
+        if backend == 'python':
+            if self.python_program is None:
+                source = PythonCodeGenerator(self.declarations).generate(self.optimized_code)
+                self.python_program = PythonProgram(source)
+            return self.python_program.run(output)
+        if self.bytecode is None:
+            self.bytecode = BytecodeCompiler(self.declarations).compile(self.optimized_code)
+        vm = VirtualMachine(self.bytecode)
+        vm.run(output)
+        return vm.variables()
+
+    def save(self, path):
+        """Write the compiled program to `path` as an artifact that
+        `main.py run` and other processes can load without compiling.
+        Returns its size in bytes."""
+        if self.bytecode is None:
+            self.bytecode = BytecodeCompiler(self.declarations).compile(self.optimized_code)
+        return save_artifact(path, self.optimized_code, self.declarations, self.bytecode)
+
+def run_artifact(path, backend='vm'):
+    """Run a program saved by SimpleLangCompiler.save."""
+    with Artifact.open(path) as artifact:
+        if backend == 'python':
+            source = PythonCodeGenerator(artifact.symbol_table()).generate(artifact.code())
+            PythonProgram(source).run()
+        else:
+            VirtualMachine(artifact.bytecode()).run()
+
+def worker_count(text):
+    count = int(text)
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"need at least one worker, not {count}")
+    return count
+
+def register_count(text):
+    count = int(text)
+    if count < 0:
+        raise argparse.ArgumentTypeError(f"can't allocate to {count} registers")
+    return count
+
+def add_front_end_arguments(arg_parser):
+    group = arg_parser.add_mutually_exclusive_group()
+    group.add_argument('--fused', action='store_true',
+                       help="single-pass front end: no token list or AST is kept")
+    group.add_argument('--workers', type=worker_count,
+                       help="run the front end on pieces of the program in this many "
+                            "worker processes")
+    arg_parser.add_argument('--registers', type=register_count, default=DEFAULT_REGISTERS,
+                            help="registers to allocate temporaries to, per type; the "
+                                 "others are spilled to memory, with two kept for reloads "
+                                 f"(default {DEFAULT_REGISTERS}; 0 keeps every temporary)")
+
+def add_output_arguments(arg_parser):
+    group = arg_parser.add_mutually_exclusive_group()
+    group.add_argument('--quiet', dest='output', action='store_const', const='quiet',
+                       default='text', help="don't print the compiler report")
+    group.add_argument('--json', dest='output', action='store_const', const='json',
+                       help="print the compiler report, with phase timings, as JSON")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="print each phase's time, counts and peak memory to stderr")
+    arg_parser.add_argument('--log-level', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                            help="log compiler diagnostics at this level to stderr")
+    arg_parser.add_argument('--log-json', action='store_true', help="log as JSON Lines")
+
+def print_profile(args, compiler):
+    if args.profile:
+        print(compiler.metrics.format_table(), file=sys.stderr)
+
+def configure_logging(args):
+    if args.log_level or args.log_json:
+        configure(args.log_level or 'INFO', args.log_json)
+
+def run_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="main.py run",
+                                         description="Compile and run a SimpleLang program.")
+    arg_parser.add_argument('file', nargs='?',
+                            help="source file or compiled artifact (default: read stdin)")
+    arg_parser.add_argument('--fixed-point', action='store_true',
+                            help="repeat the optimization passes until nothing changes")
+    add_front_end_arguments(arg_parser)
+    arg_parser.add_argument('--backend', choices=('vm', 'python'), default='vm',
+                            help="bytecode VM, or translate to a Python code object")
+    add_output_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    configure_logging(args)
+
+    if args.file and is_artifact(args.file):
+        try:
+            run_artifact(args.file, args.backend)
+        except ArtifactError as error:
+            sys.exit(f"Can't run {args.file}: {error}")
+        except ZeroDivisionError:
+            sys.exit("Runtime error: division by zero")
+        return
+
+    source = open(args.file, 'r') if args.file else sys.stdin
+    with source:
+        compiler = SimpleLangCompiler(read_chunks(source))
+        # The compiler's report goes to stderr, the program's output to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            success = compiler.compile(args.fixed_point, args.output, args.profile, args.fused,
+                                       args.registers, args.workers)
+    print_profile(args, compiler)
+    if not success:
+        sys.exit("Compilation failed with errors.")
+    try:
+        compiler.execute(backend=args.backend)
+    except ZeroDivisionError:
+        sys.exit("Runtime error: division by zero")
+
+def build_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="main.py build",
+                                         description="Compile a SimpleLang program to an artifact.")
+    arg_parser.add_argument('file', help="source file")
+    arg_parser.add_argument('-o', '--artifact', help="artifact path (default: the source path with .slc)")
+    arg_parser.add_argument('--fixed-point', action='store_true',
+                            help="repeat the optimization passes until nothing changes")
+    add_front_end_arguments(arg_parser)
+    add_output_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    configure_logging(args)
+
+    with open(args.file, 'r') as f:
+        compiler = SimpleLangCompiler(read_chunks(f))
+        success = compiler.compile(args.fixed_point, args.output, args.profile, args.fused,
+                                   args.registers, args.workers)
+    print_profile(args, compiler)
+    if not success:
+        sys.exit("Compilation failed with errors.")
+    path = args.artifact or os.path.splitext(args.file)[0] + '.slc'
+    size = compiler.save(path)
+    print(f"Wrote {path} ({size} bytes)", file=sys.stderr)
+
+def batch_main(argv):
+    arg_parser = argparse.ArgumentParser(prog="main.py batch",
+                                         description="Compile many SimpleLang files in parallel.")
+    arg_parser.add_argument('inputs', nargs='+',
+                            help="directories (every .sl file under them) or glob patterns")
+    arg_parser.add_argument('-o', '--output', help="JSON Lines output file (default: stdout)")
+    arg_parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    arg_parser.add_argument('--chunk-size', type=int, help="files handed to a worker at a time")
+    arg_parser.add_argument('--fixed-point', action='store_true',
+                            help="repeat the optimization passes until nothing changes")
+    args = arg_parser.parse_args(argv)
+
+    paths = [path for pattern in args.inputs for path in collect_files(pattern)]
+    output = open(args.output, 'w') if args.output else sys.stdout
+    with output, BatchCompiler(args.workers, args.chunk_size) as compiler:
+        total, failed = write_jsonl(compiler.compile_files(paths, args.fixed_point), output)
+    print(f"Compiled {total} files, {failed} failed.", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
 def main():
-    if len(sys.argv) > 1:
+    if sys.argv[1:2] == ['run']:
+        return run_main(sys.argv[2:])
+    if sys.argv[1:2] == ['batch']:
+        return batch_main(sys.argv[2:])
+    if sys.argv[1:2] == ['build']:
+        return build_main(sys.argv[2:])
+
+    arg_parser = argparse.ArgumentParser(description="Compile a SimpleLang program.")
+    arg_parser.add_argument('file', nargs='?', help="source file (default: read stdin)")
+    arg_parser.add_argument('--fixed-point', action='store_true',
+                            help="repeat the optimization passes until nothing changes")
+    add_front_end_arguments(arg_parser)
+    add_output_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    configure_logging(args)
+
+    if args.file:
         # Read from file
-        with open(sys.argv[1], 'r') as f:
-            source_code = f.read()
+        with open(args.file, 'r') as f:
+            compiler = SimpleLangCompiler(read_chunks(f))
+            success = compiler.compile(args.fixed_point, args.output, args.profile, args.fused,
+                                       args.registers, args.workers)
     else:
         # Interactive mode
-        print("Enter SimpleLang code (Ctrl+D to finish):")
-        source_code = sys.stdin.read()
-    
-    compiler = SimpleLangCompiler(source_code)
-    success = compiler.compile()
+        if args.output == 'text':
+            print("Enter SimpleLang code (Ctrl+D to finish):")
+        compiler = SimpleLangCompiler(read_chunks(sys.stdin))
+        success = compiler.compile(args.fixed_point, args.output, args.profile, args.fused,
+                                   args.registers, args.workers)
+    print_profile(args, compiler)
     
+    if args.output != 'text':
+        # The exit status tells success from failure
+        sys.exit(0 if success else 1)
     if success:
         print("Compilation successful!")
     else:
@@ -0,0 +1,165 @@
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds and in bytes
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+BYTES_BUCKETS = (1 << 10, 16 << 10, 256 << 10, 1 << 20, 16 << 20, 256 << 20, 1 << 30)
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+class CompileMetrics:
+    """Measurements of one compile, phase by phase.
+
+    Each phase() records its wall time and whatever counts the caller puts
+    in the entry it yields (tokens, nodes, instructions). With
+    `trace_memory`, it also records the peak memory tracemalloc saw
+    allocated during the phase, above what was allocated when it began.
+    Tracing slows allocation down severalfold, so it's off by default, and
+    it is process-wide: compiles traced at the same time see each other's
+    allocations.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.tracing = False
+
+    def __enter__(self):
+        global _tracing_users
+        if self.trace_memory:
+            with _tracing_lock:
+                if _tracing_users == 0:
+                    tracemalloc.start()
+                _tracing_users += 1
+            self.tracing = True
+        return self
+
+    def __exit__(self, *exc_info):
+        global _tracing_users
+        if self.tracing:
+            with _tracing_lock:
+                _tracing_users -= 1
+                if _tracing_users == 0:
+                    tracemalloc.stop()
+            self.tracing = False
+
+    @contextmanager
+    def phase(self, name, **counts):
+        entry = {'phase': name, **counts}
+        if self.tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] = time.perf_counter() - started
+            if self.tracing:
+                entry['peak_bytes'] = max(0, tracemalloc.get_traced_memory()[1] - base)
+            self.phases.append(entry)
+
+    def timings(self):
+        """Seconds by phase; a phase run more than once is summed."""
+        totals = {}
+        for entry in self.phases:
+            totals[entry['phase']] = totals.get(entry['phase'], 0.0) + entry['seconds']
+        return totals
+
+    def to_dict(self):
+        result = {
+            'phases': self.phases,
+            'total_seconds': sum(entry['seconds'] for entry in self.phases),
+        }
+        if self.trace_memory:
+            result['peak_bytes'] = max((entry.get('peak_bytes', 0) for entry in self.phases),
+                                       default=0)
+        return result
+
+    def format_table(self):
+        """The phases as an aligned text table, for --profile."""
+        lines = [f"{'phase':34} {'seconds':>10} {'peak KiB':>10}  counts"]
+        for entry in self.phases:
+            counts = ' '.join(f"{key}={value}" for key, value in entry.items()
+                              if key not in ('phase', 'seconds', 'peak_bytes'))
+            peak = f"{entry['peak_bytes'] / 1024:10.1f}" if 'peak_bytes' in entry else f"{'-':>10}"
+            lines.append(f"{entry['phase']:34} {entry['seconds']:10.6f} {peak}  {counts}")
+        lines.append(f"{'total':34} {sum(entry['seconds'] for entry in self.phases):10.6f}")
+        return '\n'.join(lines)
+
+
+class Histogram:
+    """Counts of observed values by bucket, plus their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """CompileMetrics aggregated over every compile the process runs,
+    rendered in the Prometheus text exposition format. Safe to share
+    between request threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.compiles = 0
+        self.seconds = {}
+        self.peak_bytes = {}
+
+    def observe(self, metrics):
+        """Add one compile, given as CompileMetrics.to_dict()."""
+        with self.lock:
+            self.compiles += 1
+            for entry in metrics['phases']:
+                phase = entry['phase']
+                if phase not in self.seconds:
+                    self.seconds[phase] = Histogram(SECONDS_BUCKETS)
+                self.seconds[phase].observe(entry['seconds'])
+                if 'peak_bytes' in entry:
+                    if phase not in self.peak_bytes:
+                        self.peak_bytes[phase] = Histogram(BYTES_BUCKETS)
+                    self.peak_bytes[phase].observe(entry['peak_bytes'])
+
+    def render(self):
+        with self.lock:
+            lines = [
+                "# HELP simplelang_compiles_total Compiles run by this process.",
+                "# TYPE simplelang_compiles_total counter",
+                f"simplelang_compiles_total {self.compiles}",
+            ]
+            self._render_histograms(lines, 'simplelang_phase_seconds',
+                                    "Wall time of each compiler phase.", self.seconds)
+            self._render_histograms(lines, 'simplelang_phase_peak_bytes',
+                                    "Peak memory allocated during each compiler phase.",
+                                    self.peak_bytes)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for phase, histogram in histograms.items():
+            label = f'phase="{_escape(phase)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,169 @@
+class Node:
+    """Base class for AST nodes.
+
+    `type` names the node kind and `fields` lists its children in the order
+    they appear in the dict form used by the web UI. Statements also keep
+    the `position` (token index) they start at, for error messages.
+    """
+    __slots__ = ()
+    type = None
+    fields = ()
+
+    def to_dict(self):
+        """Convert the subtree to nested dicts and lists, iteratively so deep
+        expression trees don't hit the recursion limit."""
+        root = {}
+        stack = [(self, root)]
+        while stack:
+            node, result = stack.pop()
+            result['type'] = node.type
+            for field in node.fields:
+                result[field] = _to_plain(getattr(node, field), stack)
+        return root
+
+    def count(self):
+        """Number of nodes in the subtree."""
+        total = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            total += 1
+            for field in node.fields:
+                value = getattr(node, field)
+                if isinstance(value, Node):
+                    stack.append(value)
+                elif isinstance(value, list):
+                    stack.extend(item for item in value if isinstance(item, Node))
+        return total
+
+    def __repr__(self):
+        args = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.fields)
+        return f'{self.__class__.__name__}({args})'
+
+
+def _to_plain(value, stack):
+    """Return the dict form of `value`, queueing nodes on `stack` to be filled."""
+    if isinstance(value, Node):
+        result = {}
+        stack.append((value, result))
+        return result
+    if isinstance(value, list):
+        return [_to_plain(item, stack) for item in value]
+    return value
+
+
+class Program(Node):
+    __slots__ = ('statements',)
+    type = 'program'
+    fields = __slots__
+
+    def __init__(self, statements):
+        self.statements = statements
+
+
+class Declaration(Node):
+    __slots__ = ('var_type', 'var_name', 'position')
+    type = 'declaration'
+    fields = ('var_type', 'var_name')
+
+    def __init__(self, var_type, var_name, position=None):
+        self.var_type = var_type
+        self.var_name = var_name
+        self.position = position
+
+
+class Assignment(Node):
+    __slots__ = ('var_name', 'expression', 'position')
+    type = 'assignment'
+    fields = ('var_name', 'expression')
+
+    def __init__(self, var_name, expression, position=None):
+        self.var_name = var_name
+        self.expression = expression
+        self.position = position
+
+
+class Print(Node):
+    __slots__ = ('var_name', 'position')
+    type = 'print'
+    fields = ('var_name',)
+
+    def __init__(self, var_name, position=None):
+        self.var_name = var_name
+        self.position = position
+
+
+class Conditional(Node):
+    __slots__ = ('condition', 'statements', 'position')
+    type = 'conditional'
+    fields = ('condition', 'statements')
+
+    def __init__(self, condition, statements, position=None):
+        self.condition = condition
+        self.statements = statements
+        self.position = position
+
+
+class Condition(Node):
+    __slots__ = ('left', 'operator', 'right')
+    type = 'condition'
+    fields = __slots__
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+
+class BinaryOp(Node):
+    __slots__ = ('operator', 'left', 'right')
+    type = 'binary_op'
+    fields = __slots__
+
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+
+class Identifier(Node):
+    __slots__ = ('value',)
+    type = 'identifier'
+    fields = __slots__
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Constant(Node):
+    __slots__ = ('value',)
+    type = 'constant'
+    fields = __slots__
+
+    def __init__(self, value):
+        self.value = value
+
+
+class NodeVisitor:
+    """Calls visit_<node.type> for each node.
+
+    The method for a node class is looked up once per visitor class and kept
+    in a dispatch table, so a tree walk costs one dict lookup per node.
+    Nodes without a visit method (and missing children, None) go to
+    generic_visit, which does nothing.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+
+    def visit(self, node):
+        method = self._dispatch.get(node.__class__)
+        if method is None:
+            name = f'visit_{node.type}' if isinstance(node, Node) else 'generic_visit'
+            method = getattr(self.__class__, name, NodeVisitor.generic_visit)
+            self._dispatch[node.__class__] = method
+        return method(self, node)
+
+    def generic_visit(self, node):
+        return None
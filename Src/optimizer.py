@@ -1,74 +1,517 @@
+import operator
+
+from cfg import BitDomain, ControlFlowGraph, StrongLiveness, defined_name, global_names, solve
+from ir import (ARITHMETIC, ASSIGN, COMMUTATIVE, CONSTANT_KINDS, FLOAT, GOTO, INT,
+                LABEL_OP, RELATIONAL, VAR, Operand, Quad, format_code, parse_code)
+
+
+def int_divide(a, b):
+    # SimpleLang int division truncates toward zero, like C
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+ARITHMETIC_FUNCTIONS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+INT_ARITHMETIC_FUNCTIONS = dict(ARITHMETIC_FUNCTIONS, **{'/': int_divide})
+RELATIONAL_FUNCTIONS = {'>': operator.gt, '<': operator.lt, '==': operator.eq,
+                        '!=': operator.ne, '<=': operator.le, '>=': operator.ge}
+
+
+def fold_arithmetic(op, left, right):
+    """Apply an arithmetic operator to two constant operands.
+
+    int op int stays int; anything involving a float is computed in float.
+    Returns None for a division by zero, which is left to run time.
+    """
+    if right.value == 0 and op == '/':
+        return None
+    if left.kind == INT and right.kind == INT:
+        return Operand(INT, INT_ARITHMETIC_FUNCTIONS[op](left.value, right.value))
+    return Operand(FLOAT, ARITHMETIC_FUNCTIONS[op](float(left.value), float(right.value)))
+
+
+def _meet(table, other):
+    """Keep the entries two constant tables agree on."""
+    return {name: value for name, value in table.items() if other.get(name) == value}
+
+
+def coerce(value, var_type):
+    """Convert a constant to a variable's declared type."""
+    if var_type == 'int' and value.kind == FLOAT:
+        return Operand(INT, int(value.value))
+    if var_type == 'float' and value.kind == INT:
+        return Operand(FLOAT, float(value.value))
+    return value
+
+
+def operand_type(operand, types):
+    if operand.kind == INT:
+        return 'int'
+    if operand.kind == FLOAT:
+        return 'float'
+    return types.get(operand)
+
+
+def result_type(quad, types):
+    """Type of the value an assignment or arithmetic instruction computes."""
+    left = operand_type(quad.arg1, types)
+    if quad.op == ASSIGN:
+        return left
+    right = operand_type(quad.arg2, types)
+    if None in (left, right):
+        return None
+    return 'float' if 'float' in (left, right) else 'int'
+
+
+def static_types(code, var_types):
+    """Map names to the type, 'int' or 'float', they always hold.
+
+    Declared variables have their declared type, since assigning to one
+    converts the value. A temporary has the type of everything computed
+    into it, or None if that varies or isn't known.
+    """
+    types = {Operand(VAR, name): var_type for name, var_type in var_types.items() if var_type}
+    changed = True
+    while changed:
+        changed = False
+        for quad in code:
+            dest = quad.dest
+            if not (quad.op == ASSIGN or quad.op in ARITHMETIC) or dest.kind == VAR:
+                continue
+            result = result_type(quad, types)
+            if dest in types:
+                if types[dest] is None or types[dest] == result:
+                    continue
+                result = None
+            types[dest] = result
+            changed = True
+    return types
+
+
+def keeps_value(quad, types):
+    """Whether an instruction stores its result in dest unconverted."""
+    dest = quad.dest
+    if dest.kind != VAR or types.get(dest) is None:
+        return True
+    return types[dest] == result_type(quad, types)
+
+
+def loop_heads(code):
+    """Labels targeted by a jump that comes after them."""
+    label_index = {quad.dest: index for index, quad in enumerate(code) if quad.op == LABEL_OP}
+    return {quad.dest for index, quad in enumerate(code)
+            if (quad.op == GOTO or quad.op in RELATIONAL)
+            and label_index.get(quad.dest, index) < index}
+
+
 class ConstantFoldingOptimizer:
+    """Constant folding and propagation over a typed constant lattice.
+
+    Each variable or temporary is either a known INT/FLOAT constant (present
+    in the table) or unknown. Known operands are substituted into every
+    instruction, arithmetic on constants is evaluated directly, and
+    conditional jumps on constants become a goto or disappear. At a label
+    the table is the intersection of the states of every path reaching it.
+    """
+
+    def __init__(self, symbol_table=None):
+        # Declared types from the semantic analyzer, to fold `x = 1` into a
+        # float variable as 1.0 and a float into an int variable truncated
+        self.var_types = {name: info.get('type') for name, info in (symbol_table or {}).items()}
+
     def optimize(self, three_address_code):
         optimized_code = []
         constant_table = {}
-        
+        # Labels reached by a jump from further down (loops): nothing known
+        # about them can be trusted on the way in
+        heads = loop_heads(three_address_code)
+        # Intersected tables of the forward jumps to each label seen so far
+        at_label = {}
+        reachable = True
+
         for instruction in three_address_code:
-            if '=' in instruction:
-                left, right = instruction.split('=')
-                left = left.strip()
-                right = right.strip()
-                
-                # Check if right side is a constant expression
-                try:
-                    # Try to evaluate the expression
-                    result = eval(right, {}, constant_table)
-                    constant_table[left] = result
-                    optimized_code.append(f"{left} = {result}")
-                except:
-                    # Not a constant expression, keep as is
-                    optimized_code.append(instruction)
-            else:
+            op = instruction.op
+            arg1 = constant_table.get(instruction.arg1, instruction.arg1)
+            arg2 = constant_table.get(instruction.arg2, instruction.arg2)
+
+            if op in ARITHMETIC or op == ASSIGN:
+                dest = instruction.dest
+                if op == ASSIGN:
+                    result = arg1 if arg1.kind in CONSTANT_KINDS else None
+                elif arg1.kind in CONSTANT_KINDS and arg2.kind in CONSTANT_KINDS:
+                    result = fold_arithmetic(op, arg1, arg2)
+                else:
+                    result = None
+                if result is None:
+                    constant_table.pop(dest, None)
+                    if arg1 is instruction.arg1 and arg2 is instruction.arg2:
+                        optimized_code.append(instruction)
+                    else:
+                        optimized_code.append(Quad(op, dest, arg1, arg2))
+                else:
+                    if dest.kind == VAR:
+                        result = coerce(result, self.var_types.get(dest.value))
+                    constant_table[dest] = result
+                    optimized_code.append(Quad(ASSIGN, dest, result))
+
+            elif op in RELATIONAL or op == GOTO:
+                label = instruction.dest
+                if op == GOTO:
+                    taken = True
+                elif arg1.kind in CONSTANT_KINDS and arg2.kind in CONSTANT_KINDS:
+                    taken = RELATIONAL_FUNCTIONS[op](arg1.value, arg2.value)
+                    if not taken:
+                        continue
+                else:
+                    taken = None
+                if taken:
+                    optimized_code.append(Quad(GOTO, label))
+                else:
+                    optimized_code.append(Quad(op, label, arg1, arg2))
+                if label not in heads:
+                    incoming = at_label.get(label)
+                    at_label[label] = dict(constant_table) if incoming is None else _meet(incoming, constant_table)
+                if taken:
+                    # Fall-through is unreachable until the next label
+                    reachable = False
+                    constant_table = {}
+
+            elif op == LABEL_OP:
+                label = instruction.dest
+                incoming = at_label.pop(label, None)
+                if label in heads:
+                    constant_table = {}
+                elif not reachable:
+                    constant_table = incoming or {}
+                elif incoming is not None:
+                    constant_table = _meet(constant_table, incoming)
+                reachable = True
                 optimized_code.append(instruction)
-        
+
+            else:
+                optimized_code.append(Quad(op, instruction.dest, arg1, arg2))
+
         return optimized_code
 
 
 class CSEOptimizer:
+    """Common subexpression elimination by global value numbering.
+
+    Every value gets a number. Constants are hash-consed so equal constants
+    share one, and `a op b` is keyed on (op, number of a, number of b) with
+    the operands of + and * in canonical order. An instruction whose key is
+    already in the table, while the name recorded with it still holds that
+    value, becomes a copy of that name. Redefining a name gives it a fresh
+    number, which kills every entry it held or was an operand of.
+
+    The table is scoped along the dominator tree of the forward-branching
+    code the generator emits: entries made between a jump and its label are
+    undone at the label, and names assigned in between get fresh numbers
+    there, because that code doesn't dominate what follows. A label reached
+    from below (a loop head) starts from an empty table. Every step is a
+    constant number of dict operations, so the pass is linear.
+
+    Storing into a declared variable converts between int and float, so
+    such a store only shares its value number when the types agree.
+    """
+
+    def __init__(self, symbol_table=None):
+        self.var_types = {name: info.get('type') for name, info in (symbol_table or {}).items()}
+
     def optimize(self, three_address_code):
         optimized_code = []
-        expression_map = {}  # Maps expressions to temporary variables
+        types = static_types(three_address_code, self.var_types)
+        self.numbers = {}      # name -> value number
+        self.constants = {}    # constant operand -> value number
+        self.counter = 0
+        expressions = {}       # (op, number, number) -> (value number, holder)
+        expression_log = []    # (key, previous entry), to undo a region
+        assigned_log = []      # names assigned, to kill at a join
+        regions = []           # (label, expression_log size, assigned_log size)
+        open_regions = {}      # label -> index of its outermost region
+        heads = loop_heads(three_address_code)
+
         for instruction in three_address_code:
-            if '=' in instruction:
-                temp, expr = instruction.split('=')
-                temp = temp.strip()
-                expr = expr.strip()
-                if expr in expression_map:
-                    # This expression was already computed
-                    optimized_code.append(f"{temp} = {expression_map[expr]}")
-                else:
-                    # First time seeing this expression
-                    expression_map[expr] = temp
+            op = instruction.op
+            dest = instruction.dest
+
+            if op in ARITHMETIC:
+                left = self.value_number(instruction.arg1)
+                right = self.value_number(instruction.arg2)
+                if op in COMMUTATIVE and right < left:
+                    left, right = right, left
+                key = (op, left, right)
+                if not keeps_value(instruction, types):
+                    # Converted on the way in: dest doesn't hold the result
+                    self.numbers[dest] = self.new_number()
+                    assigned_log.append(dest)
                     optimized_code.append(instruction)
-            else:
+                    continue
+                entry = expressions.get(key)
+                if entry is not None and self.numbers.get(entry[1]) == entry[0]:
+                    # Already computed, and its holder still has the value
+                    if entry[1] != dest:
+                        optimized_code.append(Quad(ASSIGN, dest, entry[1]))
+                        self.numbers[dest] = entry[0]
+                        assigned_log.append(dest)
+                    continue
+                number = self.new_number()
+                expression_log.append((key, entry))
+                expressions[key] = (number, dest)
+                self.numbers[dest] = number
+                assigned_log.append(dest)
+
+            elif op == ASSIGN:
+                if keeps_value(instruction, types):
+                    self.numbers[dest] = self.value_number(instruction.arg1)
+                else:
+                    self.numbers[dest] = self.new_number()
+                assigned_log.append(dest)
+
+            elif op == GOTO or op in RELATIONAL:
+                if dest not in open_regions and dest not in heads:
+                    open_regions[dest] = len(regions)
+                    regions.append((dest, len(expression_log), len(assigned_log)))
+
+            elif op == LABEL_OP:
+                if dest in heads:
+                    expressions.clear()
+                    self.numbers.clear()
+                    del expression_log[:], assigned_log[:]
+                    regions = [(label, 0, 0) for label, _, _ in regions]
+                elif dest in open_regions:
+                    start = open_regions[dest]
+                    _, expression_mark, assigned_mark = regions[start]
+                    for label, _, _ in regions[start:]:
+                        del open_regions[label]
+                    del regions[start:]
+                    for key, previous in reversed(expression_log[expression_mark:]):
+                        if previous is None:
+                            del expressions[key]
+                        else:
+                            expressions[key] = previous
+                    del expression_log[expression_mark:]
+                    killed = dict.fromkeys(assigned_log[assigned_mark:])
+                    del assigned_log[assigned_mark:]
+                    for name in killed:
+                        self.numbers[name] = self.new_number()
+                        assigned_log.append(name)
+
+            optimized_code.append(instruction)
+        return optimized_code
+
+    def new_number(self):
+        self.counter += 1
+        return self.counter
+
+    def value_number(self, operand):
+        if operand.kind in CONSTANT_KINDS:
+            table = self.constants
+        else:
+            table = self.numbers
+        number = table.get(operand)
+        if number is None:
+            number = table[operand] = self.new_number()
+        return number
+
+
+class CopyPropagationOptimizer:
+    """Copy propagation.
+
+    After `x = y`, reads of x are replaced by y for as long as neither is
+    reassigned, which leaves the copy itself for dead-code elimination.
+    Copies into names that are read in other blocks are followed across
+    jumps with an available-copies analysis (forward, intersection) on the
+    control-flow graph; the rest are tracked while walking each block.
+    Stores that convert between int and float are not copies.
+    """
+
+    def __init__(self, symbol_table=None):
+        self.var_types = {name: info.get('type') for name, info in (symbol_table or {}).items()}
+
+    def optimize(self, three_address_code):
+        code = three_address_code
+        if not code:
+            return []
+        cfg = ControlFlowGraph(code)
+        names = global_names(cfg)
+        types = static_types(code, self.var_types)
+
+        # Available copies, as (dest, source) pairs with dest a global name
+        domain = BitDomain()
+        kill_of = {}
+        for quad in code:
+            if self.is_copy(quad, types) and quad.dest in names:
+                bit = domain.bit((quad.dest, quad.arg1))
+                for name in (quad.dest, quad.arg1):
+                    kill_of[name] = kill_of.get(name, 0) | bit
+        gen = []
+        kill = []
+        for block in cfg.blocks:
+            block_gen = block_kill = 0
+            for quad in cfg.instructions(block):
+                name = defined_name(quad)
+                if name in kill_of:
+                    block_gen ^= block_gen & kill_of[name]
+                    block_kill |= kill_of[name]
+                if name in names and self.is_copy(quad, types):
+                    block_gen |= domain.bit((quad.dest, quad.arg1))
+            gen.append(block_gen)
+            kill.append(block_kill)
+        available, _ = solve(cfg, gen, kill, meet=operator.and_, top=domain.full())
+
+        optimized_code = []
+        for block in cfg.blocks:
+            copies = {}     # dest -> source
+            readers = {}    # source -> dests copied from it
+            for dest, source in domain.decode(available[block.index]):
+                copies[dest] = source
+                readers.setdefault(source, set()).add(dest)
+            for instruction in cfg.instructions(block):
+                arg1 = copies.get(instruction.arg1, instruction.arg1)
+                arg2 = copies.get(instruction.arg2, instruction.arg2)
+                if arg1 is not instruction.arg1 or arg2 is not instruction.arg2:
+                    instruction = Quad(instruction.op, instruction.dest, arg1, arg2)
                 optimized_code.append(instruction)
+                name = defined_name(instruction)
+                if name is None:
+                    continue
+                source = copies.pop(name, None)
+                if source is not None:
+                    readers[source].discard(name)
+                for dest in readers.pop(name, ()):
+                    del copies[dest]
+                if self.is_copy(instruction, types):
+                    copies[name] = arg1
+                    readers.setdefault(arg1, set()).add(name)
         return optimized_code
 
+    @staticmethod
+    def is_copy(quad, types):
+        return quad.op == ASSIGN and quad.arg1 != quad.dest and keeps_value(quad, types)
+
+
+class DeadCodeOptimizer:
+    """Dead-code elimination.
+
+    Removes blocks that can't be reached from the entry, assignments whose
+    result never reaches a print or a jump (found with strong liveness, so
+    a whole chain of temporaries feeding a dead store goes at once), copies
+    of a name to itself, jumps to the very next instruction, and labels
+    nothing jumps to.
+    """
+
+    def optimize(self, three_address_code):
+        code = three_address_code
+        if not code:
+            return []
+        cfg = ControlFlowGraph(code)
+        reachable = cfg.reachable()
+        if not all(reachable):
+            code = [quad for block, live in zip(cfg.blocks, reachable) if live
+                    for quad in cfg.instructions(block)]
+            cfg = ControlFlowGraph(code)
+
+        liveness = StrongLiveness(cfg)
+        keep = [True] * len(code)
+        for block in cfg.blocks:
+            for index in liveness.dead_assignments(block):
+                keep[index] = False
+        for index, quad in enumerate(code):
+            if quad.op == ASSIGN and quad.arg1 == quad.dest:
+                keep[index] = False
+        code = [quad for quad, kept in zip(code, keep) if kept]
+
+        # Jumps straight to one of the labels that follow them
+        kept = []
+        for index, quad in enumerate(code):
+            if quad.op == GOTO or quad.op in RELATIONAL:
+                following = index + 1
+                while following < len(code) and code[following].op == LABEL_OP:
+                    if code[following].dest == quad.dest:
+                        break
+                    following += 1
+                else:
+                    kept.append(quad)
+                continue
+            kept.append(quad)
+        targets = {quad.dest for quad in kept if quad.op == GOTO or quad.op in RELATIONAL}
+        return [quad for quad in kept if quad.op != LABEL_OP or quad.dest in targets]
+
+
+def run_passes(three_address_code, symbol_table=None, fixed_point=False, max_rounds=20,
+               metrics=None):
+    """Run constant folding, CSE, copy propagation and dead-code elimination.
+
+    With `fixed_point`, the sequence is repeated until the code stops
+    changing (at most `max_rounds` times). Returns the optimized code and a
+    list of (pass name, instructions before, instructions after), one entry
+    per pass run. Each pass run is also recorded as a phase of `metrics`
+    (a CompileMetrics), when given.
+    """
+    passes = [
+        ("Constant folding", ConstantFoldingOptimizer(symbol_table)),
+        ("Common subexpression elimination", CSEOptimizer(symbol_table)),
+        ("Copy propagation", CopyPropagationOptimizer(symbol_table)),
+        ("Dead code elimination", DeadCodeOptimizer()),
+    ]
+    code = three_address_code
+    stats = []
+    for _ in range(max_rounds if fixed_point else 1):
+        previous = code
+        for name, optimizer in passes:
+            before = len(code)
+            if metrics is None:
+                code = optimizer.optimize(code)
+            else:
+                with metrics.phase(name, instructions_before=before) as phase:
+                    code = optimizer.optimize(code)
+                    phase['instructions'] = len(code)
+            stats.append((name, before, len(code)))
+        if code == previous:
+            break
+    return code, stats
+
 
 if __name__ == "__main__":
     # Example: Constant folding
-    original_code = [
+    original_code = parse_code([
         "t1 = 5 + 3",
         "t2 = t1 * 2",
         "x = t2",
         "y = x + 1"
-    ]
+    ])
     optimizer = ConstantFoldingOptimizer()
     optimized = optimizer.optimize(original_code)
-    print("Original:", original_code)
-    print("Optimized:", optimized)
+    print("Original:", format_code(original_code))
+    print("Optimized:", format_code(optimized))
 
     # Example: CSE
-    original_code = [
+    original_code = parse_code([
         "t1 = a + b",
         "t2 = a + b",  # Common subexpression
         "t3 = t1 * 2",
         "t4 = a + b"   # Another common subexpression
-    ]
+    ])
     optimizer = CSEOptimizer()
     optimized = optimizer.optimize(original_code)
-    print("Original:", original_code)
-    print("Optimized:", optimized)
+    print("Original:", format_code(original_code))
+    print("Optimized:", format_code(optimized))
+
+    # Example: copy propagation and dead code elimination to a fixed point
+    original_code = parse_code([
+        "t1 = a + b",
+        "x = t1",
+        "t2 = x * 2",
+        "t3 = a + b",
+        "y = t3",
+        "print y"
+    ])
+    optimized, stats = run_passes(original_code, fixed_point=True)
+    print("Original:", format_code(original_code))
+    print("Optimized:", format_code(optimized))
+    for name, before, after in stats:
+        print(f"  {name}: {before} -> {after}")
 
     # This line seems to be a mistake as it's not valid Python code and not related to the optimizers
     # E:/TUA/Assignment/.venv/Scripts/python.exe e:/TUA/Assignment/webapp.py
@@ -0,0 +1,295 @@
+import gc
+import os
+import re
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
+
+from artifact import OPCODE_NUMBERS, OPCODES
+from codegen import IntermediateCodeGenerator
+from diagnostics import locate, rereadable
+from incremental import statement_ends
+from ir import LABEL, TEMP, Operand, OperandKind, Quad
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer, statement_events
+
+BRACES = re.compile(r'[{}]')
+
+KINDS = tuple(OperandKind)
+NUMBERED = frozenset({TEMP, LABEL})
+
+# Pieces smaller than this aren't worth sending to a process
+MIN_PIECE = 1 << 16
+# Several pieces per worker, so the results of the first ones are stitched
+# together while the workers are still busy with the rest
+PIECES_PER_WORKER = 4
+# Length of the pieces a streamed source, of unknown length, is cut into
+STREAM_PIECE = 1 << 20
+
+
+def brace_depth(text, start, end, depth=0):
+    """The block depth at text[end], for text[start:] starting `depth`
+    blocks deep; unmatched '}' are ignored."""
+    for match in BRACES.finditer(text, start, end):
+        if match.group() == '{':
+            depth += 1
+        elif depth:
+            depth -= 1
+    return depth
+
+
+def split_source(text, parts):
+    """Cut `text` into at most `parts` pieces of about the same length, each
+    ending on a top-level statement boundary (see
+    incremental.statement_ends), so every piece parses on its own exactly
+    as it would within the whole. Up to each cut only braces are scanned,
+    to know the depth there; the statement ends are looked for after it."""
+    pieces = []
+    start = depth = 0
+    for part in range(1, parts):
+        target = len(text) * part // parts
+        if target <= start:
+            continue
+        depth = brace_depth(text, start, target, depth)
+        end = next(statement_ends(text, target, depth), None)
+        if end is None:
+            break
+        pieces.append(text[start:end])
+        start, depth = end, 0
+    if start < len(text) or not pieces:
+        pieces.append(text[start:])
+    return pieces
+
+
+def stream_pieces(chunks, size=STREAM_PIECE):
+    """Cut a source read as an iterable of text chunks into pieces of at
+    least `size` characters (but the last), each ending on a top-level
+    statement boundary as in split_source. Only the piece being filled is
+    held; a statement longer than `size` makes its piece longer."""
+    parts, length, wanted = [], 0, size
+    pieces = 0
+    for chunk in chunks:
+        parts.append(chunk)
+        length += len(chunk)
+        while length >= wanted:
+            text = ''.join(parts)
+            end = next(statement_ends(text, size, brace_depth(text, 0, size)), None)
+            if end is None:
+                # Look again once twice as much has been read
+                parts, wanted = [text], length * 2
+                break
+            yield text[:end]
+            pieces += 1
+            parts = [text[end:]]
+            length, wanted = len(parts[0]), size
+    if length or not pieces:
+        yield ''.join(parts)
+
+
+def window_map(pool, function, items, window):
+    """pool.map(function, items), but reading `items` only as the results
+    are taken, with at most `window` of them submitted and not yet taken."""
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(pool.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+@contextmanager
+def gc_paused():
+    """Suspend the cyclic garbage collector. The front end allocates
+    millions of objects and frees almost none, so the collector's passes
+    over a growing heap find nothing and cost more than the work itself;
+    what is built has no reference cycles for it to find later."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def compile_chunk(text, packed=True):
+    """Lex, parse and generate code for one piece, in a worker process.
+    Returns (token count, identifiers in order of first appearance, parse
+    errors, semantic events, code, temporaries, labels). The code is
+    numbered from t1 and L1, packed by pack_code() unless `packed` is
+    false, and empty if there are parse errors."""
+    with gc_paused():
+        tokens, symbol_table = Lexer(text).tokenize()
+        ast, parse_errors = Parser(tokens).parse()
+        events = tuple(chain.from_iterable(map(statement_events, ast.statements)))
+        code = []
+        temps = labels = 0
+        if not parse_errors:
+            generator = IntermediateCodeGenerator(ast)
+            code = generator.generate()
+            temps, labels = generator.temp_counter, generator.label_counter
+        if packed:
+            code = pack_code(code)
+    return len(tokens), tuple(symbol_table), parse_errors, events, code, temps, labels
+
+
+class _OperandTable(dict):
+    """Maps each operand to its index in `operands`, adding new ones as
+    they are looked up; None is -1."""
+
+    def __init__(self):
+        super().__init__({None: -1})
+        self.operands = []
+
+    def __missing__(self, operand):
+        kind, value = operand
+        index = self[operand] = len(self.operands)
+        self.operands.append((int(kind), int(value[1:]) if kind in NUMBERED else value))
+        return index
+
+
+def pack_code(code):
+    """Code in a form that is quick to send between processes: an array of
+    four ints per instruction (opcode, then dest, arg1 and arg2 as indexes
+    into the operand table, -1 for none) and the operand table, a list of
+    (kind, value) pairs, with temporaries and labels by their number.
+    Pickling the Quads themselves costs more than generating them."""
+    table = _OperandTable()
+    packed = array('i')
+    for quad in code:
+        packed.extend((OPCODE_NUMBERS[quad.op], table[quad.dest], table[quad.arg1],
+                       table[quad.arg2]))
+    return packed, table.operands
+
+
+def unpack_code(packed, temps=0, labels=0):
+    """Rebuild the code from pack_code(), with `temps` added to the number
+    of every temporary and `labels` to that of every label, as if the
+    generator's counters had started there."""
+    instructions, operands = packed
+    table = []
+    for kind, value in operands:
+        kind = KINDS[kind]
+        if kind == TEMP:
+            table.append(Operand(TEMP, f"t{value + temps}"))
+        elif kind == LABEL:
+            table.append(Operand(LABEL, f"L{value + labels}"))
+        else:
+            table.append(Operand(kind, value))
+    # Index -1 is no operand
+    table.append(None)
+    fields = iter(instructions)
+    return [Quad(OPCODES[op], table[dest], table[arg1], table[arg2])
+            for op, dest, arg1, arg2 in zip(fields, fields, fields, fields)]
+
+
+class ParallelFrontEnd:
+    """The front end of one large program, over a pool of worker processes.
+
+    The source is cut into pieces at top-level statement boundaries,
+    found by a quick scan for ';' and balanced braces. Workers lex, parse
+    and generate code for the pieces independently; the results are
+    stitched together here in source order, as they arrive:
+    temporaries and labels are renumbered to follow on from the pieces
+    before, the identifiers are merged into one symbol table, and the
+    semantic checks recorded by each piece are replayed in order, so
+    declarations are seen before the uses that follow them.
+
+    The code, errors and declarations match the multi-pass front end's.
+    Everything after the front end still runs in a single process.
+    """
+
+    def __init__(self, source, workers=None):
+        """`source` is the program text or an iterable of text chunks. Text
+        is split in as many pieces as the workers can use; chunks are cut
+        into pieces of STREAM_PIECE as they are read, and read again only
+        to locate errors (see diagnostics.rereadable)."""
+        self.source = source if isinstance(source, str) else rereadable(source)
+        self.workers = workers or os.cpu_count() or 1
+        self.pieces = 0
+        self.token_count = 0
+        self.symbol_table = {}
+        self.analyzer = SemanticAnalyzer(None)
+
+    def compile(self):
+        """Run the whole front end: returns (three-address code, parse
+        errors, semantic errors), errors with their line and column. The
+        code is empty if there are errors."""
+        window = self.workers * PIECES_PER_WORKER
+        if isinstance(self.source, str):
+            pieces = split_source(self.source, min(window, len(self.source) // MIN_PIECE or 1))
+            workers = min(self.workers, len(pieces))
+        else:
+            pieces = stream_pieces(self.source)
+            workers = self.workers
+        pieces = iter(pieces)
+        first = next(pieces)
+        second = next(pieces, None)
+        if second is None:
+            # Not worth a process
+            return self.stitch([compile_chunk(first, packed=False)], packed=False)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return self.stitch(window_map(pool, compile_chunk, chain((first, second), pieces),
+                                          window))
+
+    def stitch(self, results, packed=True):
+        """Put the pieces' results together, in order."""
+        code = []
+        parse_errors = []
+        names = {}
+        tokens = temps = labels = self.pieces = 0
+        with gc_paused():
+            for count, identifiers, errors, events, chunk, chunk_temps, chunk_labels in results:
+                self.pieces += 1
+                # Positions in a piece count from its first token
+                parse_errors.extend(error.shifted(tokens) for error in errors)
+                self.analyzer.replay(events, tokens)
+                names.update(dict.fromkeys(identifiers))
+                if not (parse_errors or self.analyzer.errors):
+                    code.extend(unpack_code(chunk, temps, labels) if packed else chunk)
+                tokens += count
+                temps += chunk_temps
+                labels += chunk_labels
+        self.token_count = tokens
+        self.symbol_table = {name: {'type': None, 'value': None} for name in names}
+        semantic_errors = self.analyzer.errors
+        if parse_errors or semantic_errors:
+            parse_errors, semantic_errors = locate(self.source, parse_errors, semantic_errors)
+            return [], parse_errors, semantic_errors
+        return code, [], []
+
+    def declarations(self):
+        """The declared variables, as SemanticAnalyzer.symbol_table has them."""
+        return self.analyzer.symbol_table
+
+
+if __name__ == "__main__":
+    import time
+    from ir import format_code
+
+    source = "int x;\nint y;\nx = 10 + 5 * 2;\nif (x > 3) { y = x / 4; print(y); }\n"
+    print("\n".join(format_code(ParallelFrontEnd(source).compile()[0])))
+
+    def multi_pass(source):
+        tokens, _ = Lexer(source).tokenize()
+        ast, _ = Parser(tokens).parse()
+        SemanticAnalyzer(ast).analyze()
+        return IntermediateCodeGenerator(ast).generate()
+
+    line = "int a{0};\na{0} = (a{0} + 25) * 3 - a{0} / 2;\nif (a{0} > 100) {{ print(a{0}); }}\n"
+    big = "".join(line.format(i) if i < 500 else line.format(i % 500).split('\n', 1)[1]
+                  for i in range(50000))
+    started = time.perf_counter()
+    expected = format_code(multi_pass(big))
+    print(f"multi-pass               {time.perf_counter() - started:6.2f} s")
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        started = time.perf_counter()
+        front_end = ParallelFrontEnd(big, workers)
+        code = front_end.compile()[0]
+        elapsed = time.perf_counter() - started
+        same = "same code" if format_code(code) == expected else "DIFFERENT CODE"
+        print(f"{workers:2} worker(s), {front_end.pieces} pieces {elapsed:6.2f} s  {same}")
@@ -1,208 +1,338 @@
-from lexer import Lexer
+import logging
+
+from diagnostics import Diagnostic
+from log import get_logger
+from nodes import (Assignment, BinaryOp, Conditional, Condition, Constant,
+                   Declaration, Identifier, Print, Program)
+from tokens import (CONSTANT, DELIMITER, IDENTIFIER, KEYWORD, OPERATOR, UNKNOWN,
+                    TokenStore, coded)
+
+logger = get_logger('parser')
+
+PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2}
+RELATIONAL_OPERATORS = ('>', '<', '==', '!=')
+
+TYPE_KEYWORDS = ((KEYWORD, 'int'), (KEYWORD, 'float'))
+SEMICOLON = (DELIMITER, ';')
+OPEN_BRACE = (DELIMITER, '{')
+CLOSE_BRACE = (DELIMITER, '}')
+
+# Where error recovery stops skipping: a '}' or a keyword that starts a
+# statement (a ';' is skipped too, as it ends the broken statement). The
+# header of an if also stops at the '{' of its body.
+SYNC_TOKENS = frozenset({CLOSE_BRACE, *TYPE_KEYWORDS, (KEYWORD, 'print'), (KEYWORD, 'if')})
+HEADER_SYNC_TOKENS = SYNC_TOKENS | {OPEN_BRACE}
 
 
 class Parser:
+    """Recursive-descent parser with panic-mode error recovery.
+
+    A syntax error cuts its statement short: the error is recorded (only
+    the first one per statement, as the rest usually follow from it), the
+    part of the statement already parsed is kept in the AST with None for
+    what is missing, and tokens are skipped up to the next statement
+    boundary. Every statement consumes at least one token, so parsing is
+    linear in the input however broken it is, and semantic analysis can
+    still check the partial tree.
+    """
+
+    # Semantic actions: what the parser makes of each construct it
+    # recognizes. These build the AST; the fused front end (fused.py)
+    # overrides them to check and generate code instead.
+    identifier = Identifier
+    constant = Constant
+
     def __init__(self, tokens):
-        self.tokens = tokens
+        """`tokens` may be a TokenStore, a list or any iterator of (TYPE, value)
+        tuples, such as Lexer.iter_tokens(); tokens are pulled one at a time,
+        so only the current one is held. Internally a token is a
+        (TokenKind, value) pair, so kind checks compare small integers."""
+        if isinstance(tokens, TokenStore):
+            self.tokens = tokens.iter_coded()
+        else:
+            self.tokens = coded(tokens)
         self.position = 0
-        self.current_token = self.tokens[self.position] if tokens else None
+        self.current_token = next(self.tokens, None)
         self.errors = []
-        
+        self.blocks = []
+        # Set by the first error of a statement, cleared at the next one
+        self.panicking = False
+        # Checked once: when debug logging is off the per-statement trace
+        # costs a single attribute test
+        self.debug = logger.isEnabledFor(logging.DEBUG)
+
     def advance(self):
         self.position += 1
-        if self.position >= len(self.tokens):
-            self.current_token = None
-        else:
-            self.current_token = self.tokens[self.position]
-    
-    def match(self, expected_type, expected_value=None):
-        if self.current_token and self.current_token[0] == expected_type:
+        self.current_token = next(self.tokens, None)
+
+    def match(self, expected_kind, expected_value=None):
+        if self.current_token and self.current_token[0] == expected_kind:
             if expected_value is None or self.current_token[1] == expected_value:
                 token = self.current_token
                 self.advance()
                 return token
         return None
-    
+
+    def expect(self, expected_kind, expected_value, message):
+        """Match the token or record `message` as the error."""
+        if self.match(expected_kind, expected_value):
+            return True
+        self.error(message)
+        return False
+
+    def end_statement(self, message):
+        """Match the ';' ending a statement. A missing one is taken as
+        read if the statement parsed and the next one starts with an
+        identifier (the usual case: a forgotten ';' at the end of a line),
+        so that statement isn't skipped."""
+        if self.panicking or self.match(DELIMITER, ';'):
+            return
+        self.error(message)
+        if self.current_token and self.current_token[0] == IDENTIFIER:
+            self.panicking = False
+
+    def error(self, message):
+        """Record a syntax error at the current token, unless the statement
+        already has one."""
+        if not self.panicking:
+            self.panicking = True
+            self.errors.append(Diagnostic(message, self.position))
+
+    def synchronize(self, stop=SYNC_TOKENS):
+        """Skip the rest of a broken statement: past the next ';', which
+        ends it, or up to a token in `stop`. Returns whether it ended."""
+        while self.current_token:
+            if self.current_token == SEMICOLON:
+                self.advance()
+                self.panicking = False
+                return True
+            if self.current_token in stop:
+                return False
+            self.advance()
+        return False
+
     def parse_program(self):
         """program → statement_list"""
         statements = self.parse_statement_list()
-        return {'type': 'program', 'statements': statements}
-    
+        return Program(statements)
+
     def parse_statement_list(self):
-        """statement_list → statement | statement statement_list"""
-        print('Entering parse_statement_list, current_token:', self.current_token)
-        statements = []
-        while self.current_token and self.current_token[0] != 'EOF':
-            stmt = self.parse_statement()
+        """statement_list → statement | statement statement_list
+
+        The bodies of if statements are parsed by this same loop, which
+        keeps the ifs whose body is open on a stack (see parse_conditional)
+        instead of making a recursive call per level, so ifs nest to any
+        depth."""
+        if self.debug:
+            logger.debug('Entering parse_statement_list, current_token: %s', self.current_token)
+        program = []
+        # Open if bodies: (condition, statements, position) of each if
+        self.blocks = []
+        while self.current_token or self.blocks:
+            if self.blocks and (not self.current_token or self.current_token == CLOSE_BRACE):
+                stmt = self.close_conditional()
+            else:
+                stmt = self.parse_statement()
             if stmt:
-                statements.append(stmt)
-        print('Exiting parse_statement_list, statements:', len(statements))
-        return statements
-    
+                (self.blocks[-1][1] if self.blocks else program).append(stmt)
+        if self.debug:
+            logger.debug('Exiting parse_statement_list, statements: %d', len(program))
+        return program
+
     def parse_statement(self):
-        """statement → declaration | assignment | print_stmt | conditional"""
-        print('In parse_statement, current_token:', self.current_token)
-        # Skip stray semicolons to prevent infinite loop
-        if self.current_token and self.current_token == ('DELIMITER', ';'):
+        """statement → declaration | assignment | print_stmt | conditional
+
+        Returns the statement's node (partial if it has an error), or None
+        for an empty statement or one too broken to keep. Always consumes
+        at least one token."""
+        if self.debug:
+            logger.debug('In parse_statement, current_token: %s', self.current_token)
+        start = self.position
+        self.panicking = False
+        token = self.current_token
+        stmt = None
+        if token == SEMICOLON:
+            # Empty statement
             self.advance()
-            return None
-        if self.match('KEYWORD', 'int') or self.match('KEYWORD', 'float'):
-            self.position -= 1  # Go back
-            return self.parse_declaration()
-        elif self.current_token and self.current_token[0] == 'IDENTIFIER':
-            return self.parse_assignment()
-        elif self.match('KEYWORD', 'print'):
-            return self.parse_print()
-        elif self.match('KEYWORD', 'if'):
-            return self.parse_conditional()
-        return None
-    
+        elif token in TYPE_KEYWORDS:
+            stmt = self.parse_declaration()
+        elif token[0] == IDENTIFIER:
+            stmt = self.parse_assignment()
+        elif token == (KEYWORD, 'print'):
+            stmt = self.parse_print()
+        elif token == (KEYWORD, 'if'):
+            stmt = self.parse_conditional()
+        else:
+            self.error(f"Unexpected {token[1]!r}")
+        if self.panicking:
+            self.synchronize()
+            if self.position == start:
+                self.advance()
+        return stmt
+
     def parse_declaration(self):
         """declaration → 'int' IDENTIFIER ';' | 'float' IDENTIFIER ';'"""
-        type_token = self.match('KEYWORD')
-        if not type_token:
-            self.errors.append("Expected type keyword (int/float)")
-            return None
-            
-        id_token = self.match('IDENTIFIER')
+        position = self.position
+        var_type = self.current_token[1]
+        self.advance()
+        id_token = self.match(IDENTIFIER)
         if not id_token:
-            self.errors.append("Expected identifier after type")
-            return None
-            
-        if not self.match('DELIMITER', ';'):
-            self.errors.append("Expected ';' after declaration")
+            self.error("Expected identifier after type")
             return None
-            
-        return {'type': 'declaration', 'var_type': type_token[1], 'var_name': id_token[1]}
-    
+        node = self.declaration(var_type, id_token[1], position)
+        self.end_statement("Expected ';' after declaration")
+        return node
+
     def parse_assignment(self):
         """assignment → IDENTIFIER '=' expression ';'"""
-        id_token = self.match('IDENTIFIER')
-        if not id_token:
-            return None
-            
-        if not self.match('OPERATOR', '='):
-            self.errors.append("Expected '=' in assignment")
+        position = self.position
+        var_name = self.current_token[1]
+        self.advance()
+        if not self.match(OPERATOR, '='):
+            self.error("Expected '=' in assignment")
             return None
-            
+        self.begin_assignment(var_name, position)
         expr = self.parse_expression()
-        if not expr:
-            self.errors.append("Expected expression after '='")
-            return None
-            
-        if not self.match('DELIMITER', ';'):
-            self.errors.append("Expected ';' after assignment")
-            return None
-            
-        return {'type': 'assignment', 'var_name': id_token[1], 'expression': expr}
-    
-    def parse_expression(self):
-        """expression → term | expression ADD_OP term"""
-        node = self.parse_term()
-        
-        while self.current_token and self.current_token[1] in ('+', '-'):
-            operator = self.match('OPERATOR')
-            right = self.parse_term()
-            node = {'type': 'binary_op', 'operator': operator[1], 'left': node, 'right': right}
-            
-        return node
-    
-    def parse_term(self):
-        """term → factor | term MUL_OP factor"""
-        node = self.parse_factor()
-        
-        while self.current_token and self.current_token[1] in ('*', '/'):
-            operator = self.match('OPERATOR')
-            right = self.parse_factor()
-            node = {'type': 'binary_op', 'operator': operator[1], 'left': node, 'right': right}
-            
+        if expr is None:
+            self.error("Expected expression after '='")
+        node = self.assignment(var_name, expr, position)
+        self.end_statement("Expected ';' after assignment")
         return node
-    
-    def parse_factor(self):
-        """factor → IDENTIFIER | CONSTANT | '(' expression ')'"""
-        if self.match('DELIMITER', '('):
-            node = self.parse_expression()
-            if not self.match('DELIMITER', ')'):
-                self.errors.append("Expected ')'")
-            return node
-        elif token := self.match('IDENTIFIER'):
-            return {'type': 'identifier', 'value': token[1]}
-        elif token := self.match('CONSTANT'):
-            return {'type': 'constant', 'value': token[1]}
-        else:
-            self.errors.append("Expected identifier, constant, or '('")
-            return None
-    
+
+    def parse_expression(self):
+        """expression → term | expression ADD_OP term
+        term       → factor | term MUL_OP factor
+        factor     → IDENTIFIER | CONSTANT | '(' expression ')'
+
+        Parsed by operator precedence over explicit operand and operator
+        stacks rather than one recursive call per grammar level, so any
+        nesting depth or chain length parses in linear time. A missing
+        operand is None in the tree.
+        """
+        operands = []
+        operators = []  # pending binary operators and '(' markers
+        open_parens = 0
+        while True:
+            # factor
+            while self.match(DELIMITER, '('):
+                operators.append('(')
+                open_parens += 1
+            if token := self.match(IDENTIFIER):
+                operands.append(self.identifier(token[1]))
+            elif token := self.match(CONSTANT):
+                operands.append(self.constant(token[1]))
+            else:
+                token = self.current_token
+                if token and token[0] == UNKNOWN and token[1][0].isdigit():
+                    self.error(f"Malformed number {token[1]!r}")
+                else:
+                    self.error("Expected identifier, constant, or '('")
+                operands.append(None)
+
+            # closing parentheses, then the next operator, if any
+            while True:
+                if self.current_token and self.current_token[1] in PRECEDENCE:
+                    operator = self.match(OPERATOR)[1]
+                    precedence = PRECEDENCE[operator]
+                    while operators and operators[-1] != '(' and PRECEDENCE[operators[-1]] >= precedence:
+                        self._reduce(operands, operators.pop())
+                    operators.append(operator)
+                    break
+                if not open_parens:
+                    while operators:
+                        self._reduce(operands, operators.pop())
+                    return operands[0]
+                while operators[-1] != '(':
+                    self._reduce(operands, operators.pop())
+                operators.pop()
+                open_parens -= 1
+                self.expect(DELIMITER, ')', "Expected ')'")
+
+    @staticmethod
+    def _reduce(operands, operator):
+        right = operands.pop()
+        operands[-1] = BinaryOp(operator, operands[-1], right)
+
     def parse_print(self):
         """print_stmt → 'print' '(' IDENTIFIER ')' ';'"""
-        if not self.match('DELIMITER', '('):
-            self.errors.append("Expected '(' after print")
+        position = self.position
+        self.advance()
+        if not self.expect(DELIMITER, '(', "Expected '(' after print"):
             return None
-            
-        id_token = self.match('IDENTIFIER')
+        id_token = self.match(IDENTIFIER)
         if not id_token:
-            self.errors.append("Expected identifier in print statement")
-            return None
-            
-        if not self.match('DELIMITER', ')'):
-            self.errors.append("Expected ')' after identifier")
+            self.error("Expected identifier in print statement")
             return None
-            
-        if not self.match('DELIMITER', ';'):
-            self.errors.append("Expected ';' after print statement")
-            return None
-            
-        return {'type': 'print', 'var_name': id_token[1]}
-    
+        node = self.print_statement(id_token[1], position)
+        self.expect(DELIMITER, ')', "Expected ')' after identifier")
+        self.end_statement("Expected ';' after print statement")
+        return node
+
     def parse_conditional(self):
-        """conditional → 'if' '(' condition ')' '{' statement_list '}'"""
-        if not self.match('DELIMITER', '('):
-            self.errors.append("Expected '(' after if")
-            return None
-            
-        condition = self.parse_condition()
-        if not condition:
-            self.errors.append("Expected condition")
-            return None
-            
-        if not self.match('DELIMITER', ')'):
-            self.errors.append("Expected ')' after condition")
-            return None
-            
-        if not self.match('DELIMITER', '{'):
-            self.errors.append("Expected '{' after if condition")
-            return None
-            
-        statements = []
-        while self.current_token and self.current_token[1] != '}':
-            stmt = self.parse_statement()
-            if stmt:
-                statements.append(stmt)
-                
-        if not self.match('DELIMITER', '}'):
-            self.errors.append("Expected '}' to close if block")
+        """conditional → 'if' '(' condition ')' '{' statement_list '}'
+
+        A broken header still leaves a conditional, with as much of the
+        condition as was parsed; its body is parsed if recovery finds the
+        '{'. Once the '{' is matched the if is pushed on `blocks` and None
+        returned: parse_statement_list parses the body and calls
+        close_conditional at its end."""
+        position = self.position
+        self.advance()
+        condition = None
+        if self.expect(DELIMITER, '(', "Expected '(' after if"):
+            condition = self.parse_condition()
+            self.expect(DELIMITER, ')', "Expected ')' after condition")
+        self.begin_conditional(condition)
+        if self.panicking and self.synchronize(HEADER_SYNC_TOKENS):
+            # A ';' ended the statement before its body
+            return self.conditional(condition, [], position)
+        if self.expect(DELIMITER, '{', "Expected '{' after if condition"):
+            # The body's statements start afresh
+            self.panicking = False
+            self.blocks.append((condition, [], position))
             return None
-            
-        return {'type': 'conditional', 'condition': condition, 'statements': statements}
-    
+        return self.conditional(condition, [], position)
+
+    def close_conditional(self):
+        """Finish the innermost open if, at its '}' or the end of input."""
+        condition, statements, position = self.blocks.pop()
+        self.panicking = False
+        self.expect(DELIMITER, '}', "Expected '}' to close if block")
+        stmt = self.conditional(condition, statements, position)
+        if self.panicking:
+            self.synchronize()
+        return stmt
+
     def parse_condition(self):
         """condition → expression REL_OP expression"""
         left = self.parse_expression()
-        if not left:
-            return None
-            
-        rel_op = self.match('OPERATOR')
-        if not rel_op or rel_op[1] not in ('>', '<', '==', '!='):
-            self.errors.append("Expected relational operator")
-            return None
-            
-        right = self.parse_expression()
-        if not right:
-            return None
-            
-        return {'type': 'condition', 'left': left, 'operator': rel_op[1], 'right': right}
-    
+        rel_op = self.match(OPERATOR)
+        if not rel_op or rel_op[1] not in RELATIONAL_OPERATORS:
+            self.error("Expected relational operator")
+            return self.condition(left, None, None)
+        return self.condition(left, rel_op[1], self.parse_expression())
+
+    def declaration(self, var_type, var_name, position):
+        return Declaration(var_type, var_name, position)
+
+    def begin_assignment(self, var_name, position):
+        """Called once the target and '=' of an assignment are parsed."""
+
+    def assignment(self, var_name, expression, position):
+        return Assignment(var_name, expression, position)
+
+    def print_statement(self, var_name, position):
+        return Print(var_name, position)
+
+    def condition(self, left, operator, right):
+        return Condition(left, operator, right)
+
+    def begin_conditional(self, condition):
+        """Called after the header of an if, before its body."""
+
+    def conditional(self, condition, statements, position):
+        return Conditional(condition, statements, position)
+
     def parse(self):
         ast = self.parse_program()
         return ast, self.errors
-
@@ -0,0 +1,218 @@
+import math
+import sys
+from functools import lru_cache
+
+from cfg import ControlFlowGraph
+from ir import (ARITHMETIC, ASSIGN, CONSTANT_KINDS, GOTO, LABEL_OP, PRINT, RELATIONAL, SPILL,
+                TEMP, VAR, format_code, parse_code)
+from optimizer import int_divide, result_type, static_types
+
+# Python's tokenizer allows 100 levels of indentation
+MAX_NESTING = 90
+
+
+def divide(left, right):
+    # Division whose operand types aren't known until run time
+    if left.__class__ is int and right.__class__ is int:
+        return int_divide(left, right)
+    return left / right
+
+
+@lru_cache(maxsize=64)
+def compile_source(source):
+    """Compile generated source once; equal programs share the code object."""
+    return compile(source, '<simplelang>', 'exec')
+
+
+class PythonProgram:
+    """A SimpleLang program translated to a Python function.
+
+    `source` is the generated module text and `code` its cached code
+    object. run() writes what the program prints to `output` (stdout by
+    default) and returns the final values of its variables.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.code = compile_source(source)
+        namespace = {'int_divide': int_divide, 'divide': divide}
+        exec(self.code, namespace)
+        self.function = namespace['program']
+
+    def run(self, output=None):
+        return self.function((output or sys.stdout).write)
+
+
+class PythonCodeGenerator:
+    """Translates three-address code to Python source.
+
+    Variables and temporaries become locals of one function, so every read
+    and write is a fast local access; spill slots are the items of one
+    list local, `spill`. The forward, properly nested jumps
+    the generator and optimizers produce become nested `if` statements;
+    anything else (a jump backward, jumps that cross, or nesting deeper
+    than MAX_NESTING) is run by a loop that dispatches on the current
+    basic block.
+    """
+
+    def __init__(self, symbol_table=None):
+        self.var_types = {name: info.get('type') for name, info in (symbol_table or {}).items()}
+
+    def generate(self, three_address_code):
+        code = three_address_code
+        self.types = static_types(code, self.var_types)
+        self.label_index = {quad.dest: index for index, quad in enumerate(code)
+                            if quad.op == LABEL_OP}
+        self.lines = []
+        self.cells = {}
+        names = {}
+        for quad in code:
+            for operand in (quad.dest, quad.arg1, quad.arg2):
+                if operand is not None and operand.kind in (VAR, TEMP):
+                    names.setdefault(operand, None)
+                elif operand is not None and operand.kind == SPILL:
+                    self.cells.setdefault(operand, len(self.cells))
+
+        self.lines.append("def program(write):")
+        for operand in names:
+            initial = '0.0' if self.types.get(operand) == 'float' and operand.kind == VAR else '0'
+            self.lines.append(f"    {self.name(operand)} = {initial}")
+        if self.cells:
+            self.lines.append(f"    spill = [0] * {len(self.cells)}")
+        body_start = len(self.lines)
+        if not self.structured(code, 0, len(code), 1):
+            del self.lines[body_start:]
+            self.dispatcher(code)
+        variables = ', '.join(f"{operand.value!r}: {self.name(operand)}"
+                              for operand in names if operand.kind == VAR)
+        self.lines.append(f"    return {{{variables}}}")
+        return '\n'.join(self.lines) + '\n'
+
+    def structured(self, code, start, end, depth):
+        """Emit code[start:end] with jumps as nested ifs; False if its jumps
+        can't be nested that way."""
+        if depth > MAX_NESTING:
+            return False
+        indent = '    ' * depth
+        emitted = len(self.lines)
+        index = start
+        while index < end:
+            quad = code[index]
+            op = quad.op
+            if op == GOTO or op in RELATIONAL:
+                target = self.label_index[quad.dest]
+                if not index < target <= end:
+                    return False
+                if op in RELATIONAL:
+                    self.lines.append(f"{indent}if not ({self.condition(quad)}):")
+                    inner = len(self.lines)
+                    if not self.structured(code, index + 1, target, depth + 1):
+                        return False
+                    if len(self.lines) == inner:
+                        self.lines.append(f"{indent}    pass")
+                # After a goto, everything up to its label is skipped
+                index = target
+                continue
+            if op != LABEL_OP:
+                self.lines.append(indent + self.statement(quad))
+            index += 1
+        if len(self.lines) == emitted and depth == 1:
+            self.lines.append(f"{indent}pass")
+        return True
+
+    def dispatcher(self, code):
+        """Emit a loop that runs one basic block per turn. The block is
+        found by a balanced tree of `if block < n` tests rather than one
+        long elif chain, so a jump costs O(log blocks) and the nesting that
+        Python's compiler recurses on stays shallow."""
+        cfg = ControlFlowGraph(code)
+        if not cfg.blocks:
+            return
+        bodies = []
+        for block in cfg.blocks:
+            body = []
+            following = block.index + 1 if block.index + 1 < len(cfg.blocks) else None
+            for quad in cfg.instructions(block):
+                if quad.op == GOTO:
+                    following = cfg.block_of_label[quad.dest]
+                elif quad.op in RELATIONAL:
+                    body.append(f"if {self.condition(quad)}:")
+                    body.append(f"    block = {cfg.block_of_label[quad.dest]}")
+                    body.append("    continue")
+                elif quad.op != LABEL_OP:
+                    body.append(self.statement(quad))
+            body.append("break" if following is None else f"block = {following}")
+            bodies.append(body)
+        self.lines.append("    block = 0")
+        self.lines.append("    while True:")
+        self.block_tree(bodies, 0, len(bodies), 2)
+
+    def block_tree(self, bodies, low, high, depth):
+        indent = '    ' * depth
+        if high - low == 1:
+            self.lines.extend(indent + line for line in bodies[low])
+            return
+        middle = (low + high) // 2
+        self.lines.append(f"{indent}if block < {middle}:")
+        self.block_tree(bodies, low, middle, depth + 1)
+        self.lines.append(f"{indent}else:")
+        self.block_tree(bodies, middle, high, depth + 1)
+
+    def statement(self, quad):
+        op = quad.op
+        if op == PRINT:
+            return f"write(f'{{{self.value(quad.arg1)}}}\\n')"
+        if op == ASSIGN:
+            expression = self.value(quad.arg1)
+        elif op in ARITHMETIC:
+            left, right = self.value(quad.arg1), self.value(quad.arg2)
+            if op != '/':
+                expression = f"{left} {op} {right}"
+            else:
+                value_type = result_type(quad, self.types)
+                if value_type == 'int':
+                    expression = f"int_divide({left}, {right})"
+                elif value_type == 'float':
+                    expression = f"{left} / {right}"
+                else:
+                    expression = f"divide({left}, {right})"
+        else:
+            raise ValueError(f"Unknown opcode {op!r}")
+        var_type = self.types.get(quad.dest) if quad.dest.kind == VAR else None
+        if var_type and result_type(quad, self.types) != var_type:
+            expression = f"{var_type}({expression})"
+        return f"{self.name(quad.dest)} = {expression}"
+
+    def condition(self, quad):
+        return f"{self.value(quad.arg1)} {quad.op} {self.value(quad.arg2)}"
+
+    def value(self, operand):
+        if operand.kind not in CONSTANT_KINDS:
+            return self.name(operand)
+        value = operand.value
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"float('{value}')"
+        return f"({value!r})" if value < 0 else repr(value)
+
+    def name(self, operand):
+        # Prefixes keep variables, temporaries and Python's own names apart
+        if operand.kind == SPILL:
+            return f"spill[{self.cells[operand]}]"
+        return f"v_{operand.value}" if operand.kind == VAR else f"_{operand.value}"
+
+
+if __name__ == "__main__":
+    code = parse_code([
+        "t1 = a + 2",
+        "x = t1",
+        "if x <= 1 goto L1",
+        "t2 = x / 2",
+        "x = t2",
+        "print x",
+        "L1:",
+    ])
+    generator = PythonCodeGenerator({'a': {'type': 'int'}, 'x': {'type': 'float'}})
+    print("\n".join(format_code(code)))
+    source = generator.generate(code)
+    print(source)
+    print(PythonProgram(source).run())
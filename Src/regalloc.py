@@ -0,0 +1,286 @@
+import heapq
+from bisect import insort
+
+from cfg import ControlFlowGraph, Liveness
+from ir import ASSIGN, SPILL, TEMP, Operand, Quad, format_code, parse_code
+from optimizer import static_types
+
+DEFAULT_REGISTERS = 16
+
+
+def live_intervals(code):
+    """Map each temporary to the (start, end) of the span of code in which
+    it holds a value, as positions: 2i where instruction i reads its
+    operands and 2i + 1 where it writes its result, so a temporary read
+    for the last time by the instruction that defines another one doesn't
+    overlap it. A temporary live across blocks (by the liveness analysis)
+    is given a single interval over all of them, holes included, which is
+    conservative for any control flow.
+    """
+    first = {}
+    last = {}
+    # Temporaries read in a block before being written there: the only
+    # ones that can be live across blocks. The generator's never are.
+    crossing = set()
+    cfg = ControlFlowGraph(code)
+    for block in cfg.blocks:
+        written = set()
+        for index in range(block.start, block.end):
+            quad = code[index]
+            position = 2 * index
+            for name in (quad.arg1, quad.arg2):
+                if name is not None and name.kind == TEMP:
+                    if name not in first:
+                        first[name] = position
+                    last[name] = position
+                    if name not in written:
+                        crossing.add(name)
+            name = quad.dest
+            if name is not None and name.kind == TEMP:
+                if name not in first:
+                    first[name] = position + 1
+                last[name] = position + 1
+                written.add(name)
+
+    if crossing:
+        # Only the first block a temporary is live into and the last one
+        # it is live out of can extend its interval
+        liveness = Liveness(cfg, crossing)
+        decode = liveness.domain.decode
+        seen = 0
+        for block in cfg.blocks:
+            bits = liveness.live_in[block.index] & ~seen
+            if bits:
+                seen |= bits
+                for name in decode(bits):
+                    first[name] = min(first[name], 2 * block.start)
+        seen = 0
+        for block in reversed(cfg.blocks):
+            bits = liveness.live_out[block.index] & ~seen
+            if bits:
+                seen |= bits
+                for name in decode(bits):
+                    last[name] = max(last[name], 2 * block.end - 1)
+    return {name: (start, last[name]) for name, start in first.items()}
+
+
+class LinearScanAllocator:
+    """Linear-scan register allocation of temporaries.
+
+    The generator makes a new temporary for every operation, and each
+    distinct one costs a VM register or a Python local when the program
+    runs. This maps them onto a pool of `registers` virtual registers,
+    reusing one as soon as the temporary in it is dead: intervals are
+    taken in order of their start, those that have ended free their
+    registers, and when none is free the interval that ends last is
+    spilled (Poletto and Sarkar's heuristic).
+
+    A spilled temporary lives in a slot of the spill area, memory apart
+    from the registers (the VM's LOAD/STORE cells, a list in the Python
+    backend). It is stored there right after each instruction that
+    computes it, into a scratch register, and reloaded into a scratch
+    register before each instruction that reads it. An instruction reads
+    at most two, so a type that spills keeps two of its registers for
+    scratch and allocates the rest; the code then uses at most
+    max(registers, 2) registers of each type. Spill slots are reused as
+    their temporaries die, like registers.
+
+    Temporaries are allocated separately by static type (int, float or
+    unknown), so a register always holds one type and the backends keep
+    their typed division and conversions. The result names registers t1,
+    t2, ... and spill slots [s1], [s2], ... in order of first use.
+    """
+
+    def __init__(self, symbol_table=None, registers=DEFAULT_REGISTERS):
+        if registers < 1:
+            raise ValueError(f"Need at least one register, not {registers}")
+        self.var_types = {name: info.get('type') for name, info in (symbol_table or {}).items()}
+        self.registers = registers
+        self.temporaries = 0
+        self.registers_used = 0
+        self.spilled = 0
+        self.spill_slots = 0
+        self.spill_instructions = 0
+
+    def optimize(self, three_address_code):
+        code = three_address_code
+        intervals = live_intervals(code)
+        self.temporaries = len(intervals)
+        self.spilled = 0
+        if not intervals:
+            self.registers_used = self.spill_slots = self.spill_instructions = 0
+            return list(code)
+        types = static_types(code, self.var_types)
+        by_type = {}
+        for temp in sorted(intervals, key=intervals.get):
+            by_type.setdefault(types.get(temp), []).append(temp)
+
+        location = {}      # temporary -> (spilled?, type, register or slot number)
+        scratch = {}       # type -> its two scratch registers, if it spills
+        for kind, temps in by_type.items():
+            spilled = self.scan(temps, intervals, kind, self.registers, location)
+            if spilled:
+                pool = max(self.registers - 2, 0)
+                spilled = self.scan(temps, intervals, kind, pool, location)
+                scratch[kind] = ((False, kind, pool), (False, kind, pool + 1))
+                self.assign_spill_slots(spilled, intervals, kind, location)
+                self.spilled += len(spilled)
+        return self.rename(code, location, scratch)
+
+    @staticmethod
+    def scan(temps, intervals, kind, registers, location):
+        """Allocate `temps`, all of type `kind` and in order of their start,
+        to `registers` registers; returns those left to spill."""
+        running = []       # [(end, temporary)] sorted by end
+        free = []
+        used = 0
+        spilled = []
+        for temp in temps:
+            start, end = intervals[temp]
+            while running and running[0][0] < start:
+                free.append(location[running.pop(0)[1]][2])
+            if free:
+                register = free.pop()
+            elif used < registers:
+                register = used
+                used += 1
+            elif running and running[-1][0] > end:
+                # An active interval ends later than this one: spill it
+                # and take its register
+                last = running.pop()[1]
+                register = location[last][2]
+                spilled.append(last)
+            else:
+                spilled.append(temp)
+                continue
+            location[temp] = (False, kind, register)
+            insort(running, (end, temp))
+        return spilled
+
+    @staticmethod
+    def assign_spill_slots(spilled, intervals, kind, location):
+        """Give the spilled temporaries slots of the spill area, reusing
+        those of dead ones."""
+        running = []       # heap of (end, slot)
+        free = []
+        slots = 0
+        for temp in sorted(spilled, key=intervals.get):
+            start, end = intervals[temp]
+            while running and running[0][0] < start:
+                free.append(heapq.heappop(running)[1])
+            if free:
+                slot = free.pop()
+            else:
+                slot = slots
+                slots += 1
+            location[temp] = (True, kind, slot)
+            heapq.heappush(running, (end, slot))
+
+    def rename(self, code, location, scratch):
+        """Rewrite `code` with every temporary replaced by its register,
+        and spilled ones reloaded into and stored from scratch registers."""
+        counters = [0, 0]
+        names = {}
+
+        def name(place):
+            operand = names.get(place)
+            if operand is None:
+                spill = place[0]
+                counters[spill] += 1
+                operand = names[place] = (Operand(SPILL, f"s{counters[1]}") if spill
+                                          else Operand(TEMP, f"t{counters[0]}"))
+            return operand
+
+        result = []
+        spill_instructions = 0
+        for quad in code:
+            dest, arg1, arg2 = quad.dest, quad.arg1, quad.arg2
+            if not any(operand is not None and operand.kind == TEMP
+                       for operand in (dest, arg1, arg2)):
+                result.append(quad)
+                continue
+            reloaded = {}
+            args = []
+            for operand in (arg1, arg2):
+                if operand is not None and operand.kind == TEMP:
+                    place = location[operand]
+                    if place[0]:
+                        register = reloaded.get(operand)
+                        if register is None:
+                            register = reloaded[operand] = name(scratch[place[1]][len(reloaded)])
+                            reload = Quad(ASSIGN, register, name(place))
+                            # Not if the register was just stored there
+                            if not (result and result[-1] == Quad(ASSIGN, reload.arg1, register)):
+                                result.append(reload)
+                                spill_instructions += 1
+                        operand = register
+                    else:
+                        operand = name(place)
+                args.append(operand)
+            arg1, arg2 = args
+            store = None
+            if dest is not None and dest.kind == TEMP:
+                place = location[dest]
+                if place[0]:
+                    dest = name(scratch[place[1]][0])
+                    store = Quad(ASSIGN, name(place), dest)
+                else:
+                    dest = name(place)
+            if quad.op != ASSIGN or arg1 != dest:
+                result.append(Quad(quad.op, dest, arg1, arg2))
+            # else a copy between temporaries that now share a register
+            if store is not None:
+                result.append(store)
+                spill_instructions += 1
+        self.registers_used, self.spill_slots = counters
+        self.spill_instructions = spill_instructions
+        return result
+
+
+def allocate_registers(code, symbol_table=None, stats=None, registers=DEFAULT_REGISTERS,
+                       metrics=None):
+    """Run the allocator on optimized code, after optimizer.run_passes.
+    Like a pass, it adds ("Register allocation", instructions before,
+    after) to the `stats` list and is recorded as a phase of `metrics`,
+    when given. With `registers` None or 0 the code is returned as is."""
+    if not registers:
+        return code
+    allocator = LinearScanAllocator(symbol_table, registers)
+    before = len(code)
+    if metrics is None:
+        code = allocator.optimize(code)
+    else:
+        with metrics.phase("Register allocation", instructions_before=before) as phase:
+            code = allocator.optimize(code)
+            phase['instructions'] = len(code)
+            phase['temporaries'] = allocator.temporaries
+            phase['registers'] = allocator.registers_used
+            phase['spill_slots'] = allocator.spill_slots
+            phase['spill_instructions'] = allocator.spill_instructions
+    if stats is not None:
+        stats.append(("Register allocation", before, len(code)))
+    return code
+
+
+if __name__ == "__main__":
+    code = parse_code([
+        "t1 = a + b",
+        "t2 = t1 * 2",
+        "t3 = c - 1",
+        "t4 = t2 / t3",
+        "x = t4",
+        "if x > 10 goto L1",
+        "t5 = x * x",
+        "t6 = t5 + t1",
+        "y = t6",
+        "L1:",
+        "print y",
+    ])
+    table = {name: {'type': 'int'} for name in 'abcxy'}
+    for registers in (4, 1):
+        allocator = LinearScanAllocator(table, registers)
+        allocated = allocator.optimize(code)
+        print(f"{registers} registers: {allocator.temporaries} temporaries -> "
+              f"{allocator.registers_used} registers, {allocator.spill_slots} spill slots, "
+              f"{allocator.spill_instructions} loads and stores")
+        print("\n".join(f"  {line}" for line in format_code(allocated)))
@@ -1,42 +1,199 @@
-class SemanticAnalyzer:
+from diagnostics import Diagnostic
+from nodes import BinaryOp, Conditional, NodeVisitor
+
+
+def _offset(position, tokens):
+    return None if position is None else position + tokens
+
+
+class SemanticAnalyzer(NodeVisitor):
+    """Checks declarations and uses. Works on partial trees from a parser
+    that recovered from syntax errors: missing parts are None and are
+    skipped.
+
+    Errors are Diagnostics. The analyzer knows where statements start,
+    not where identifiers are, so an undeclared name in an expression is
+    recorded as the nth match of the name from the start of its
+    statement (every match of an undeclared name is an error).
+    """
+
     def __init__(self, ast):
         self.ast = ast
         self.symbol_table = {}
         self.errors = []
-        
+        # The statement whose expressions are being checked, and how many
+        # errors each name has had in it so far
+        self.statement = None
+        self.occurrences = {}
+
     def analyze(self):
         self.visit(self.ast)
         return self.errors
     
-    def visit(self, node):
-        if node['type'] == 'program':
-            for stmt in node['statements']:
+    def visit_program(self, node):
+        self.visit_statements(node.statements)
+
+    def visit_statements(self, statements):
+        # Statements in order, each if's body walked in place from an
+        # explicit stack, so ifs nest to any depth
+        stack = statements[::-1]
+        while stack:
+            stmt = stack.pop()
+            if stmt.__class__ is Conditional:
+                self.check_condition(stmt)
+                stack.extend(reversed(stmt.statements))
+            else:
                 self.visit(stmt)
-        elif node['type'] == 'declaration':
-            var_name = node['var_name']
-            if var_name in self.symbol_table:
-                self.errors.append(f"Multiple declaration of variable '{var_name}'")
+
+    def visit_declaration(self, node):
+        var_name = node.var_name
+        if var_name in self.symbol_table:
+            self.errors.append(Diagnostic(f"Multiple declaration of variable '{var_name}'",
+                                          _offset(node.position, 1)))
+        else:
+            self.symbol_table[var_name] = {
+                'type': node.var_type,
+                'initialized': False
+            }
+
+    def visit_assignment(self, node):
+        var_name = node.var_name
+        if var_name not in self.symbol_table:
+            self.errors.append(Diagnostic(f"Undeclared variable '{var_name}'", node.position))
+        else:
+            self.symbol_table[var_name]['initialized'] = True
+            self.statement = node.position
+            self.occurrences = {}
+            self.visit(node.expression)
+
+    def visit_print(self, node):
+        var_name = node.var_name
+        if var_name not in self.symbol_table:
+            self.errors.append(Diagnostic(f"Undeclared variable '{var_name}' in print statement",
+                                          _offset(node.position, 2)))
+
+    def visit_conditional(self, node):
+        self.visit_statements([node])
+
+    def check_condition(self, node):
+        self.statement = node.position
+        self.occurrences = {}
+        self.visit(node.condition)
+
+    def visit_condition(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_binary_op(self, node):
+        # Walk the operand tree with an explicit stack, left to right
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.__class__ is BinaryOp:
+                stack.append(node.right)
+                stack.append(node.left)
             else:
-                self.symbol_table[var_name] = {
-                    'type': node['var_type'],
-                    'initialized': False
-                }
-        elif node['type'] == 'assignment':
-            var_name = node['var_name']
-            if var_name not in self.symbol_table:
-                self.errors.append(f"Undeclared variable '{var_name}'")
+                self.visit(node)
+
+    def visit_identifier(self, node):
+        var_name = node.value
+        if var_name not in self.symbol_table:
+            self.errors.append(self.undeclared_use(var_name, self.statement))
+
+    def undeclared_use(self, var_name, statement):
+        occurrence = self.occurrences.get(var_name, 0)
+        self.occurrences[var_name] = occurrence + 1
+        return Diagnostic(f"Undeclared variable '{var_name}'", statement, var_name, occurrence)
+
+    def replay(self, events, tokens=0, undo=None):
+        """Apply the checks recorded by statement_events, with the same
+        effect on the symbol table and errors as visiting the statements.
+        `tokens` is the number of tokens before the statements, added to
+        the positions they were parsed at. Each change to the symbol table
+        is logged to the `undo` list, if given, for rewind()."""
+        for event in events:
+            kind = event[0]
+            position = _offset(event[-1], tokens)
+            if kind == 'use':
+                if position != self.statement:
+                    self.statement = position
+                    self.occurrences = {}
+                if event[1] not in self.symbol_table:
+                    self.errors.append(self.undeclared_use(event[1], position))
+            elif kind == 'assign':
+                var_name = event[1]
+                if var_name not in self.symbol_table:
+                    self.errors.append(Diagnostic(f"Undeclared variable '{var_name}'", position))
+                else:
+                    entry = self.symbol_table[var_name]
+                    if undo is not None and not entry['initialized']:
+                        undo.append((var_name, dict(entry)))
+                    entry['initialized'] = True
+                    self.statement = position
+                    self.occurrences = {}
+                    for name in event[2]:
+                        if name not in self.symbol_table:
+                            self.errors.append(self.undeclared_use(name, position))
+            elif kind == 'declare':
+                if event[1] in self.symbol_table:
+                    self.errors.append(Diagnostic(f"Multiple declaration of variable '{event[1]}'",
+                                                  _offset(position, 1)))
+                else:
+                    if undo is not None:
+                        undo.append((event[1], None))
+                    self.symbol_table[event[1]] = {'type': event[2], 'initialized': False}
+            elif event[1] not in self.symbol_table:
+                self.errors.append(Diagnostic(f"Undeclared variable '{event[1]}' in print statement",
+                                              _offset(position, 2)))
+
+    def rewind(self, undo, errors):
+        """Take back the symbol table changes logged in `undo` by replay(),
+        latest first, and drop all but the first `errors` errors."""
+        for name, entry in reversed(undo):
+            if entry is None:
+                del self.symbol_table[name]
             else:
-                self.symbol_table[var_name]['initialized'] = True
-                self.visit(node['expression'])
-        elif node['type'] == 'print':
-            var_name = node['var_name']
-            if var_name not in self.symbol_table:
-                self.errors.append(f"Undeclared variable '{var_name}' in print statement")
-        elif node['type'] == 'binary_op':
-            self.visit(node['left'])
-            self.visit(node['right'])
-        elif node['type'] == 'identifier':
-            var_name = node['value']
-            if var_name not in self.symbol_table:
-                self.errors.append(f"Undeclared variable '{var_name}'")
-    
+                self.symbol_table[name] = entry
+        del self.errors[errors:]
+        self.statement = None
+        self.occurrences = {}
+
+
+def statement_events(statement):
+    """Flatten a statement into the symbol-table checks the analyzer makes
+    for it, in order: ('declare', name, type), ('assign', name, names read),
+    ('print', name) and ('use', name), each ending with the position of its
+    statement. Replaying them is much cheaper than walking the tree again."""
+    events = []
+    stack = [statement]
+    while stack:
+        node = stack.pop()
+        kind = node.type
+        if kind == 'declaration':
+            events.append(('declare', node.var_name, node.var_type, node.position))
+        elif kind == 'assignment':
+            events.append(('assign', node.var_name, tuple(_identifiers(node.expression)),
+                           node.position))
+        elif kind == 'print':
+            events.append(('print', node.var_name, node.position))
+        elif kind == 'conditional':
+            condition = node.condition
+            if condition is not None:
+                for side in (condition.left, condition.right):
+                    events.extend(('use', name, node.position) for name in _identifiers(side))
+            stack.extend(reversed(node.statements))
+    return tuple(events)
+
+
+def _identifiers(expression):
+    """Identifier names in an expression, left to right."""
+    names = []
+    stack = [expression]
+    while stack:
+        node = stack.pop()
+        if node.__class__ is BinaryOp:
+            stack.append(node.right)
+            stack.append(node.left)
+        elif node is not None and node.type == 'identifier':
+            names.append(node.value)
+    return names
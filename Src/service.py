@@ -0,0 +1,221 @@
+import json
+
+from diagnostics import locate
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from codegen import IntermediateCodeGenerator
+from optimizer import run_passes
+from regalloc import allocate_registers
+from ir import format_code
+from metrics import CompileMetrics
+
+
+def compile_to_response(source, fixed_point=False, trace_memory=False):
+    """Run every phase on `source` and return the JSON-ready dict the
+    /compile endpoint sends back. Its `metrics` give the time (and with
+    `trace_memory` the peak memory) of each phase."""
+    with CompileMetrics(trace_memory) as metrics:
+        with metrics.phase('lexer') as phase:
+            lexer = Lexer(source)
+            tokens, symbol_table = lexer.tokenize()
+            phase['tokens'] = len(tokens)
+
+        with metrics.phase('parser') as phase:
+            parser = Parser(tokens)
+            ast, parse_errors = parser.parse()
+            phase['nodes'] = ast.count()
+
+        semantic_errors = []
+        declared = {}
+        if ast:
+            with metrics.phase('semantic') as phase:
+                analyzer = SemanticAnalyzer(ast)
+                semantic_errors = analyzer.analyze()
+                declared = analyzer.symbol_table
+                phase['symbols'] = len(declared)
+        if parse_errors or semantic_errors:
+            parse_errors, semantic_errors = locate(source, parse_errors, semantic_errors)
+
+        three_address_code = []
+        if ast and not parse_errors and not semantic_errors:
+            with metrics.phase('codegen') as phase:
+                generator = IntermediateCodeGenerator(ast)
+                three_address_code = generator.generate()
+                phase['instructions'] = len(three_address_code)
+
+        return build_response(tokens, symbol_table, ast, parse_errors, semantic_errors, declared,
+                              three_address_code, fixed_point, metrics)
+
+
+def compile_events(source, fixed_point=False, include=(), page_size=1000):
+    """Run the phases of compile_to_response one at a time, yielding each
+    result as a JSON-ready event dict as soon as it is ready, for
+    /compile/stream.
+
+    Every event has an 'event' name: 'lexer', 'parser', 'semantic',
+    'codegen' and 'optimizer' carry that phase's counts, errors and timing,
+    and 'done' closes the stream with the metrics. Long lists come as
+    'tokens', 'three_address_code' and 'optimized_code' pages of at most
+    `page_size` items, each with the `offset` of its first item. The token
+    list and the AST are only sent when named in `include`; everything is
+    dropped as soon as it has been sent and the next phase no longer
+    needs it.
+    """
+    include = set(include)
+    metrics = CompileMetrics()
+    with metrics.phase('lexer') as phase:
+        tokens, symbol_table = Lexer(source).tokenize()
+        phase['tokens'] = len(tokens)
+    yield {'event': 'lexer', 'symbol_table': symbol_table, **phase}
+    if 'tokens' in include:
+        yield from _pages('tokens', tokens, page_size)
+
+    with metrics.phase('parser') as phase:
+        ast, parse_errors = Parser(tokens).parse()
+        phase['nodes'] = ast.count()
+    del tokens
+    if parse_errors:
+        parse_errors, = locate(source, parse_errors)
+    yield {'event': 'parser', 'parse_errors': parse_errors, **phase}
+    if 'ast' in include:
+        yield {'event': 'ast', 'ast': ast.to_dict()}
+
+    with metrics.phase('semantic') as phase:
+        analyzer = SemanticAnalyzer(ast)
+        semantic_errors = analyzer.analyze()
+        declared = analyzer.symbol_table
+        phase['symbols'] = len(declared)
+    if semantic_errors:
+        semantic_errors, = locate(source, semantic_errors)
+    yield {'event': 'semantic', 'semantic_errors': semantic_errors, **phase}
+
+    three_address_code = []
+    if not parse_errors and not semantic_errors:
+        with metrics.phase('codegen') as phase:
+            three_address_code = IntermediateCodeGenerator(ast).generate()
+            phase['instructions'] = len(three_address_code)
+        yield {'event': 'codegen', **phase}
+        yield from _pages('three_address_code', three_address_code, page_size, format_code)
+    del ast
+
+    optimized, pass_stats = run_passes(three_address_code, declared, fixed_point, metrics=metrics)
+    del three_address_code
+    optimized = allocate_registers(optimized, declared, pass_stats, metrics=metrics)
+    yield {'event': 'optimizer', 'instructions': len(optimized),
+           'passes': [{'name': name, 'before': before, 'after': after}
+                      for name, before, after in pass_stats]}
+    yield from _pages('optimized_code', optimized, page_size, format_code)
+    yield {'event': 'done', 'ok': not parse_errors and not semantic_errors,
+           'metrics': metrics.to_dict()}
+
+
+def _pages(event, items, page_size, convert=list):
+    for offset in range(0, len(items), page_size):
+        yield {'event': event, 'offset': offset,
+               'items': convert(items[offset:offset + page_size])}
+
+
+def compile_to_json(source, fixed_point=False):
+    """compile_to_response encoded as JSON bytes, without its metrics, and
+    the metrics: what a worker process sends back, so the encoding happens
+    off the server's event loop. The bytes are what gets cached; each
+    response adds its own metrics with with_metrics()."""
+    response = compile_to_response(source, fixed_point)
+    metrics = response.pop('metrics')
+    return json.dumps(response).encode(), metrics
+
+
+def with_metrics(encoded, metrics):
+    """A /compile body from compile_to_json's bytes and the `metrics` of
+    this response: the compile's own, or {"cached": true} when the result
+    came from the cache and nothing ran."""
+    return encoded[:-1] + b', "metrics": ' + json.dumps(metrics).encode() + b'}'
+
+
+def incremental_response(compilation, fixed_point=False, optimize=False):
+    """The /compile/incremental response for an IncrementalCompilation: the
+    program's errors, and what changed since the last response, from the
+    cached per-statement results. `changed` says that the units from index
+    `first` on, `removed` of them, were replaced by `units`, each with its
+    tokens, AST statements and three-address code. The optimizer works on
+    the whole program, so the optimized code is only sent with `optimize`."""
+    metrics = CompileMetrics()
+    with metrics.phase('incremental') as phase:
+        parse_errors, semantic_errors, declared = compilation.analyze()
+        first, removed, units = compilation.changes()
+        phase['units'] = len(compilation.units)
+        phase['rebuilt'] = len(units)
+    response = {
+        'parse_errors': parse_errors,
+        'semantic_errors': semantic_errors,
+        'units': len(compilation.units),
+        'changed': {
+            'first': first,
+            'removed': removed,
+            'units': [{'tokens': unit.tokens,
+                       'ast': [statement.to_dict() for statement in unit.statements],
+                       'three_address_code': format_code(unit.code)}
+                      for unit in units],
+        },
+    }
+    if optimize:
+        optimized, pass_stats = run_passes(compilation.code(), declared, fixed_point,
+                                           metrics=metrics)
+        optimized = allocate_registers(optimized, declared, pass_stats, metrics=metrics)
+        response['optimized_code'] = format_code(optimized)
+        response['passes'] = [{'name': name, 'before': before, 'after': after}
+                              for name, before, after in pass_stats]
+    response['metrics'] = metrics.to_dict()
+    return response
+
+
+def build_response(tokens, symbol_table, ast, parse_errors, semantic_errors, declared,
+                   three_address_code, fixed_point=False, metrics=None):
+    optimized, pass_stats = run_passes(three_address_code, declared, fixed_point, metrics=metrics)
+    optimized = allocate_registers(optimized, declared, pass_stats, metrics=metrics)
+
+    response = {
+        'tokens': tokens,
+        'symbol_table': symbol_table,
+        'ast': ast.to_dict() if ast else None,
+        'parse_errors': parse_errors,
+        'semantic_errors': semantic_errors,
+        'three_address_code': format_code(three_address_code),
+        'optimized_code': format_code(optimized),
+        'passes': [{'name': name, 'before': before, 'after': after}
+                   for name, before, after in pass_stats]
+    }
+    if metrics is not None:
+        response['metrics'] = metrics.to_dict()
+    return response
+
+
+def compile_summary(source, fixed_point=False):
+    """The compact result batch jobs keep for each program: its errors and
+    optimized code, without tokens or AST."""
+    tokens = Lexer(source).tokenize_store()
+    ast, parse_errors = Parser(tokens).parse()
+    semantic_errors = []
+    declared = {}
+    three_address_code = []
+    if ast:
+        analyzer = SemanticAnalyzer(ast)
+        semantic_errors = analyzer.analyze()
+        declared = analyzer.symbol_table
+    if parse_errors or semantic_errors:
+        parse_errors, semantic_errors = locate(source, parse_errors, semantic_errors,
+                                               tokens=tokens)
+    if ast and not parse_errors and not semantic_errors:
+        three_address_code = IntermediateCodeGenerator(ast).generate()
+    optimized, pass_stats = run_passes(three_address_code, declared, fixed_point)
+    optimized = allocate_registers(optimized, declared, pass_stats)
+    return {
+        'ok': not parse_errors and not semantic_errors,
+        'parse_errors': parse_errors,
+        'semantic_errors': semantic_errors,
+        'instructions': len(three_address_code),
+        'optimized_code': format_code(optimized),
+        'passes': [{'name': name, 'before': before, 'after': after}
+                   for name, before, after in pass_stats]
+    }
@@ -0,0 +1,129 @@
+from array import array
+from enum import IntEnum
+
+
+class TokenKind(IntEnum):
+    KEYWORD = 0
+    IDENTIFIER = 1
+    CONSTANT = 2
+    OPERATOR = 3
+    DELIMITER = 4
+    UNKNOWN = 5
+
+
+KEYWORD, IDENTIFIER, CONSTANT, OPERATOR, DELIMITER, UNKNOWN = TokenKind
+
+# Kind name used in (TYPE, value) tuples -> TokenKind, and back.
+KIND_CODES = {kind.name: kind for kind in TokenKind}
+KIND_NAMES = [kind.name for kind in TokenKind]
+KINDS = list(TokenKind)
+
+# Side table entries a TokenStore can index with 2-byte items
+NARROW_ENTRIES = 1 << 16
+
+
+def coded(tokens):
+    """Turn (TYPE, value) tuples into (TokenKind, value) pairs."""
+    codes = KIND_CODES
+    return ((codes[kind], value) for kind, value in tokens)
+
+
+class TokenStore:
+    """Compact token buffer.
+
+    Token i is described by kinds[i], values[i] and offsets[i], three
+    parallel arrays of machine integers: its TokenKind, its index in the
+    interned side table, which holds each distinct lexeme's value once,
+    and the position of its lexeme in the source, for locate(). The index
+    array starts with 2-byte items and is widened to 4-byte ones when the
+    table outgrows them, so a token costs 7 bytes.
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.values = array('H')
+        self.offsets = array('I')
+        self.table = []
+        self.table_kinds = array('B')
+
+    def intern(self, kind, value):
+        self.table.append(value)
+        self.table_kinds.append(kind)
+        if len(self.table) > NARROW_ENTRIES and self.values.typecode == 'H':
+            self.values = array('I', self.values)
+        return len(self.table) - 1
+
+    def extend(self, slots, offsets):
+        """Append the tokens with side table `slots` found at `offsets`."""
+        self.kinds.extend(map(self.table_kinds.__getitem__, slots))
+        self.values.extend(slots)
+        if self.offsets.typecode == 'I' and offsets and offsets[-1] > 0xFFFFFFFF:
+            self.offsets = array('Q', self.offsets)
+        self.offsets.extend(offsets)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        return (KIND_NAMES[self.kinds[index]], self.table[self.values[index]])
+
+    def __iter__(self):
+        """Yield (TYPE, value) tuples, the same tokens Lexer.tokenize returns."""
+        return map(self.__getitem__, range(len(self.kinds)))
+
+    def iter_coded(self):
+        """Yield (TokenKind, value) pairs straight from the buffers."""
+        return zip(map(KINDS.__getitem__, self.kinds), map(self.table.__getitem__, self.values))
+
+    def find(self, name, start=0, skip=0):
+        """Index of the identifier `name` at or after token `start`, after
+        `skip` earlier ones, or None if there aren't that many."""
+        for slot, value in enumerate(self.table):
+            if value == name and self.table_kinds[slot] == IDENTIFIER:
+                break
+        else:
+            return None
+        index = start - 1
+        try:
+            for _ in range(skip + 1):
+                index = self.values.index(slot, index + 1)
+        except ValueError:
+            return None
+        return index
+
+    def nbytes(self):
+        """Memory held by the token buffers, not counting the side table."""
+        return sum(len(buffer) * buffer.itemsize
+                   for buffer in (self.kinds, self.values, self.offsets, self.table_kinds))
+
+
+if __name__ == "__main__":
+    # Memory of a 1M-token program as a list of tuples versus a TokenStore
+    import tracemalloc
+    from lexer import Lexer
+
+    line = "int x1;\nx1 = (x1 + 25) * 3.5;\nif (x1 > 100) { print(x1); }\n"
+    per_line = len(Lexer(line).tokenize()[0])
+    source = line * (1_000_000 // per_line + 1)
+
+    def measure(build):
+        tracemalloc.start()
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, current, peak
+
+    def reference_tokens():
+        lexer = Lexer(source)
+        tokens = []
+        while token := lexer.get_next_token():
+            tokens.append(token)
+        return tokens
+
+    for name, build in (("tuples (get_next_token)", reference_tokens),
+                        ("tuples (tokenize)", lambda: Lexer(source).tokenize()[0]),
+                        ("TokenStore", lambda: Lexer(source).tokenize_store())):
+        tokens, current, peak = measure(build)
+        print(f"{name:24} {len(tokens):>9} tokens  "
+              f"{current / len(tokens):6.1f} B/token retained  {peak / 2**20:7.1f} MiB peak")
+        del tokens
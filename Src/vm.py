@@ -0,0 +1,230 @@
+import sys
+from array import array
+
+from ir import (ARITHMETIC, ASSIGN, CONSTANT_KINDS, GOTO, LABEL_OP, PRINT, RELATIONAL, SPILL,
+                VAR, format_code, parse_code)
+from optimizer import int_divide, result_type, static_types
+
+# Opcodes, followed in the code array by their operands: register numbers,
+# an instruction offset for jumps, or a spill memory cell for LOAD (into a
+# register) and STORE (from one).
+# The conditional jumps come last, from JGT on.
+(MOVE, TO_INT, TO_FLOAT, ADD, SUB, MUL, DIV, PRINT_R, JUMP, LOAD, STORE,
+ JGT, JLT, JEQ, JNE, JLE, JGE) = range(17)
+
+OPCODE_NAMES = ['MOVE', 'TO_INT', 'TO_FLOAT', 'ADD', 'SUB', 'MUL', 'DIV', 'PRINT', 'JUMP',
+                'LOAD', 'STORE', 'JGT', 'JLT', 'JEQ', 'JNE', 'JLE', 'JGE']
+OPERAND_COUNTS = [2, 2, 2, 3, 3, 3, 3, 1, 1, 2, 2, 3, 3, 3, 3, 3, 3]
+ARITHMETIC_OPCODES = {'+': ADD, '-': SUB, '*': MUL, '/': DIV}
+JUMP_OPCODES = {'>': JGT, '<': JLT, '==': JEQ, '!=': JNE, '<=': JLE, '>=': JGE}
+
+
+class Bytecode:
+    """A program lowered for the VM.
+
+    `code` is a flat array of opcodes and operands. Every variable,
+    temporary and constant has a register; `registers` holds their initial
+    values (constants are preloaded, variables start at 0 of their
+    declared type) and `names` says which operand each register stands for.
+    Spill slots are cells of a separate memory instead, reached only by
+    LOAD and STORE; `spills` names them.
+    """
+
+    def __init__(self, code, registers, names, spills=()):
+        self.code = code
+        self.registers = registers
+        self.names = names
+        self.spills = list(spills)
+
+    def disassemble(self):
+        lines = []
+        pc = 0
+        while pc < len(self.code):
+            op = self.code[pc]
+            operands = self.code[pc + 1:pc + 1 + OPERAND_COUNTS[op]]
+            if op == JUMP:
+                args = [f"@{operands[0]}"]
+            elif op == LOAD:
+                args = [str(self.names[operands[0]]), str(self.spills[operands[1]])]
+            elif op == STORE:
+                args = [str(self.spills[operands[0]]), str(self.names[operands[1]])]
+            elif op >= JGT:
+                args = [str(self.names[operands[0]]), str(self.names[operands[1]]), f"@{operands[2]}"]
+            else:
+                args = [str(self.names[register]) for register in operands]
+            lines.append(f"{pc:5}  {OPCODE_NAMES[op]:8} {', '.join(args)}")
+            pc += 1 + len(operands)
+        return lines
+
+
+class BytecodeCompiler:
+    """Lowers three-address code to Bytecode.
+
+    Labels disappear into jump offsets, and a store into a declared
+    variable that may change its type gets an explicit TO_INT/TO_FLOAT,
+    the same conversion the constant folder applies.
+    """
+
+    def __init__(self, symbol_table=None):
+        self.var_types = {name: info.get('type') for name, info in (symbol_table or {}).items()}
+
+    def compile(self, three_address_code):
+        self.register_of = {}
+        self.registers = []
+        self.names = []
+        self.cell_of = {}
+        types = static_types(three_address_code, self.var_types)
+        code = array('i')
+        label_offsets = {}
+        jumps = []     # (position of the offset in code, label)
+
+        for quad in three_address_code:
+            op = quad.op
+            if op == LABEL_OP:
+                label_offsets[quad.dest] = len(code)
+                continue
+            if op == ASSIGN and quad.dest.kind == SPILL:
+                code.extend((STORE, self.cell(quad.dest), self.register(quad.arg1)))
+            elif op == ASSIGN and quad.arg1.kind == SPILL:
+                code.extend((LOAD, self.register(quad.dest), self.cell(quad.arg1)))
+            elif op == ASSIGN or op in ARITHMETIC:
+                dest = self.register(quad.dest)
+                if op == ASSIGN:
+                    code.extend((MOVE, dest, self.register(quad.arg1)))
+                else:
+                    code.extend((ARITHMETIC_OPCODES[op], dest,
+                                 self.register(quad.arg1), self.register(quad.arg2)))
+                var_type = types.get(quad.dest) if quad.dest.kind == VAR else None
+                if var_type and result_type(quad, types) != var_type:
+                    code.extend((TO_INT if var_type == 'int' else TO_FLOAT, dest, dest))
+            elif op == PRINT:
+                code.extend((PRINT_R, self.register(quad.arg1)))
+            elif op == GOTO:
+                code.extend((JUMP, 0))
+                jumps.append((len(code) - 1, quad.dest))
+            elif op in RELATIONAL:
+                code.extend((JUMP_OPCODES[op], self.register(quad.arg1), self.register(quad.arg2), 0))
+                jumps.append((len(code) - 1, quad.dest))
+            else:
+                raise ValueError(f"Unknown opcode {op!r}")
+
+        for position, label in jumps:
+            if label not in label_offsets:
+                raise ValueError(f"Jump to undefined label {label}")
+            code[position] = label_offsets[label]
+        return Bytecode(code, self.registers, self.names, self.cell_of)
+
+    def cell(self, operand):
+        return self.cell_of.setdefault(operand, len(self.cell_of))
+
+    def register(self, operand):
+        if operand.kind == SPILL:
+            raise ValueError(f"Spill slot {operand} can only be loaded or stored")
+        number = self.register_of.get(operand)
+        if number is None:
+            number = self.register_of[operand] = len(self.registers)
+            if operand.kind in CONSTANT_KINDS:
+                value = operand.value
+            elif operand.kind == VAR and self.var_types.get(operand.value) == 'float':
+                value = 0.0
+            else:
+                value = 0
+            self.registers.append(value)
+            self.names.append(operand)
+        return number
+
+
+class VirtualMachine:
+    """Runs Bytecode with a dispatch loop over the code array."""
+
+    def __init__(self, bytecode):
+        self.bytecode = bytecode
+        self.registers = list(bytecode.registers)
+        self.memory = [0] * len(bytecode.spills)
+
+    def run(self, output=None):
+        """Execute the program, writing what it prints to `output`
+        (stdout by default). Division by zero raises ZeroDivisionError."""
+        write = (output or sys.stdout).write
+        code = self.bytecode.code.tolist()
+        regs = self.registers
+        memory = self.memory
+        end = len(code)
+        pc = 0
+        while pc < end:
+            op = code[pc]
+            if op == MOVE:
+                regs[code[pc + 1]] = regs[code[pc + 2]]
+                pc += 3
+            elif op == ADD:
+                regs[code[pc + 1]] = regs[code[pc + 2]] + regs[code[pc + 3]]
+                pc += 4
+            elif op == SUB:
+                regs[code[pc + 1]] = regs[code[pc + 2]] - regs[code[pc + 3]]
+                pc += 4
+            elif op == MUL:
+                regs[code[pc + 1]] = regs[code[pc + 2]] * regs[code[pc + 3]]
+                pc += 4
+            elif op == PRINT_R:
+                write(f"{regs[code[pc + 1]]}\n")
+                pc += 2
+            elif op >= JGT:
+                left = regs[code[pc + 1]]
+                right = regs[code[pc + 2]]
+                if op == JGT:
+                    taken = left > right
+                elif op == JLT:
+                    taken = left < right
+                elif op == JEQ:
+                    taken = left == right
+                elif op == JNE:
+                    taken = left != right
+                elif op == JLE:
+                    taken = left <= right
+                else:
+                    taken = left >= right
+                pc = code[pc + 3] if taken else pc + 4
+            elif op == JUMP:
+                pc = code[pc + 1]
+            elif op == DIV:
+                left = regs[code[pc + 2]]
+                right = regs[code[pc + 3]]
+                if left.__class__ is int and right.__class__ is int:
+                    regs[code[pc + 1]] = int_divide(left, right)
+                else:
+                    regs[code[pc + 1]] = left / right
+                pc += 4
+            elif op == TO_INT:
+                regs[code[pc + 1]] = int(regs[code[pc + 2]])
+                pc += 3
+            elif op == LOAD:
+                regs[code[pc + 1]] = memory[code[pc + 2]]
+                pc += 3
+            elif op == STORE:
+                memory[code[pc + 1]] = regs[code[pc + 2]]
+                pc += 3
+            else:
+                regs[code[pc + 1]] = float(regs[code[pc + 2]])
+                pc += 3
+
+    def variables(self):
+        """Current values of the program's variables, by name."""
+        return {operand.value: value
+                for operand, value in zip(self.bytecode.names, self.registers)
+                if operand.kind == VAR}
+
+
+if __name__ == "__main__":
+    code = parse_code([
+        "t1 = a + 2",
+        "x = t1",
+        "if x <= 1 goto L1",
+        "t2 = x / 2",
+        "x = t2",
+        "print x",
+        "L1:",
+    ])
+    bytecode = BytecodeCompiler({'a': {'type': 'int'}, 'x': {'type': 'float'}}).compile(code)
+    print("\n".join(format_code(code)))
+    print("\n".join(bytecode.disassemble()))
+    VirtualMachine(bytecode).run()
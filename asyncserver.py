@@ -0,0 +1,338 @@
+"""Asynchronous compile server.
+
+An alternative to webapp.py for serving many clients at once. One asyncio
+event loop accepts connections and parses requests; compiles run in a
+bounded pool of worker processes, so a large source only ever occupies one
+worker and never blocks the loop or other clients.
+
+    python asyncserver.py --port 5001 --workers 4
+
+Endpoints: POST /compile (the same request and response as webapp.py),
+GET /health and GET /metrics. Malformed requests get 400 (431 for a
+header over the limit), requests over the size limit get 413, a
+full queue gets 429 with Retry-After, a compile over the time limit gets
+504, and a request whose client disconnects is dropped from the queue.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Ensure the Src directory is importable
+ROOT = os.path.dirname(__file__)
+SRC_DIR = os.path.join(ROOT, 'Src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from cache import CompileCache, cache_key
+from log import configure, get_logger
+from metrics import MetricsRegistry
+from service import compile_to_json, with_metrics
+
+logger = get_logger('asyncserver')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 429: 'Too Many Requests',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+MAX_HEADER_BYTES = 16 << 10
+
+
+class Overloaded(Exception):
+    """Raised when the queue of pending compiles is full."""
+
+
+class BadRequest(Exception):
+    """Raised for a request that can't be parsed; `status` is the response's."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class CompilePool:
+    """Runs compiles on `workers` processes, with at most `max_pending`
+    compiles waiting or running at once.
+
+    Work is handed to the pool only when a worker is free, so a request
+    still waiting can be cancelled without ever having started. A compile
+    that is already running can't be interrupted; when its request is
+    cancelled or times out, the compile is abandoned but keeps its worker
+    (and its place in the queue count) until it finishes.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = self.new_executor()
+        self.slots = asyncio.Semaphore(workers)
+        self.pending = 0
+        self.running = 0
+
+    async def run(self, function, *args):
+        if self.pending >= self.max_pending:
+            raise Overloaded()
+        self.pending += 1
+        submitted = False
+        try:
+            await self.slots.acquire()
+            future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+            submitted = True
+            self.running += 1
+            future.add_done_callback(self._finished)
+            return await asyncio.shield(future)
+        finally:
+            if not submitted:
+                self.pending -= 1
+
+    def _finished(self, future):
+        self.running -= 1
+        self.pending -= 1
+        self.slots.release()
+        if not future.cancelled():
+            # Mark an abandoned compile's error as seen
+            future.exception()
+
+    def new_executor(self):
+        # Workers forked straight from the server would inherit its open
+        # client sockets, and a client waiting for EOF would never see its
+        # connection close; start them from a clean fork server instead
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    async def start(self):
+        """Start every worker before the first request needs one."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, int)
+                               for _ in range(self.workers)))
+
+    def restart(self):
+        """Replace a pool whose worker died."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = self.new_executor()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class CompileServer:
+    """HTTP/1.1 front end for a CompilePool, one request per connection."""
+
+    def __init__(self, workers=None, max_pending=None, timeout=30.0, max_source_bytes=1 << 20,
+                 cache=None):
+        workers = workers or os.cpu_count() or 1
+        self.pool = CompilePool(workers, max_pending or workers * 8)
+        self.timeout = timeout
+        self.max_source_bytes = max_source_bytes
+        self.cache = cache
+        self.metrics = MetricsRegistry()
+        self.counts = {'served': 0, 'rejected': 0, 'timed_out': 0, 'cancelled': 0,
+                       'too_large': 0, 'bad_request': 0, 'failed': 0}
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                request = await self.read_request(reader)
+            except BadRequest as error:
+                self.counts['bad_request'] += 1
+                await self.respond(writer, error.status, {'error': str(error)})
+                return
+            if request is None:
+                return
+            method, path, body = request
+            if isinstance(body, int):
+                # Refused before reading the body
+                self.counts['too_large'] += 1
+                await self.respond(writer, 413, {'error': f"Request body over {body} bytes"})
+                return
+            status, payload, headers = await self.route(method, path, body, reader)
+            if status is not None:
+                await self.respond(writer, status, payload, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """(method, path, body) for the next request; body is the size
+        limit instead when Content-Length exceeds it. None on EOF; raises
+        BadRequest for a malformed request."""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise BadRequest(431, f"Request header over {MAX_HEADER_BYTES} bytes") from None
+        lines = head.decode('latin-1').split('\r\n')
+        request_line = lines[0].split(' ')
+        if len(request_line) != 3:
+            raise BadRequest(400, "Malformed request line")
+        method, path, _ = request_line
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise BadRequest(400, "Invalid Content-Length")
+        # JSON escaping can make the body a few times larger than the source
+        limit = self.max_source_bytes * 6 + 1024
+        if length > limit:
+            return method, path, limit
+        body = await reader.readexactly(length) if length else b''
+        return method, path.split('?', 1)[0], body
+
+    async def route(self, method, path, body, reader):
+        if path == '/compile':
+            if method != 'POST':
+                return 405, {'error': "Use POST"}, None
+            return await self.compile(body, reader)
+        if path == '/health' and method == 'GET':
+            return 200, self.health(), None
+        if path == '/metrics' and method == 'GET':
+            return 200, self.render_metrics().encode(), {'Content-Type': 'text/plain; version=0.0.4'}
+        return 404, {'error': f"No route for {method} {path}"}, None
+
+    async def compile(self, body, reader):
+        try:
+            data = json.loads(body or b'{}')
+            source = data.get('source', '')
+            options = {'fixed_point': bool(data.get('fixed_point'))}
+        except (ValueError, AttributeError):
+            return 400, {'error': "Expected a JSON object"}, None
+        if not isinstance(source, str):
+            return 400, {'error': "'source' must be a string"}, None
+        if len(source.encode()) > self.max_source_bytes:
+            self.counts['too_large'] += 1
+            return 413, {'error': f"Source over {self.max_source_bytes} bytes"}, None
+
+        key = cache_key(source, options)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.counts['served'] += 1
+                return 200, with_metrics(cached, {'cached': True}), None
+
+        # Race the compile against the client hanging up: the request is
+        # complete, so the only thing left to read is EOF
+        work = asyncio.ensure_future(self.compile_with_timeout(source, options['fixed_point']))
+        hangup = asyncio.ensure_future(reader.read(1))
+        done, _ = await asyncio.wait({work, hangup}, return_when=asyncio.FIRST_COMPLETED)
+        if work not in done and hangup.result():
+            # Not a hangup but more bytes, which this server doesn't read
+            await asyncio.wait({work})
+        elif work not in done:
+            work.cancel()
+            self.counts['cancelled'] += 1
+            logger.info("Client disconnected; compile cancelled")
+            return None, None, None
+        hangup.cancel()
+
+        try:
+            encoded, metrics = work.result()
+        except Overloaded:
+            self.counts['rejected'] += 1
+            return 429, {'error': "Too many pending compiles"}, {'Retry-After': '1'}
+        except TimeoutError:
+            self.counts['timed_out'] += 1
+            return 504, {'error': f"Compile took over {self.timeout} s"}, None
+        except BrokenProcessPool:
+            self.counts['failed'] += 1
+            logger.error("A compile worker died; restarting the pool")
+            self.pool.restart()
+            return 503, {'error': "Compile worker died"}, None
+        except Exception as e:
+            self.counts['failed'] += 1
+            logger.exception("Error in /compile")
+            return 500, {'error': str(e)}, None
+        self.metrics.observe(metrics)
+        if self.cache is not None:
+            self.cache.put(key, encoded)
+        self.counts['served'] += 1
+        return 200, with_metrics(encoded, metrics), None
+
+    async def compile_with_timeout(self, source, fixed_point):
+        async with asyncio.timeout(self.timeout):
+            return await self.pool.run(compile_to_json, source, fixed_point)
+
+    def health(self):
+        return {
+            'workers': self.pool.workers,
+            'running': self.pool.running,
+            'pending': self.pool.pending,
+            'max_pending': self.pool.max_pending,
+            **self.counts,
+        }
+
+    def render_metrics(self):
+        lines = []
+        for name, value in self.counts.items():
+            lines.append(f"# TYPE simplelang_requests_{name}_total counter")
+            lines.append(f"simplelang_requests_{name}_total {value}")
+        lines.append("# TYPE simplelang_compiles_pending gauge")
+        lines.append(f"simplelang_compiles_pending {self.pool.pending}")
+        return '\n'.join(lines) + '\n' + self.metrics.render()
+
+    async def respond(self, writer, status, payload, headers=None):
+        if isinstance(payload, (bytes, bytearray)):
+            body = payload
+        else:
+            body = json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                f"Content-Length: {len(body)}",
+                "Connection: close"]
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'application/json')
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+
+
+async def serve(host, port, **options):
+    server = CompileServer(**options)
+    await server.pool.start()
+    listener = await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_BYTES)
+    logger.warning("Serving on http://%s:%d with %d workers", host, port, server.pool.workers)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.pool.close()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Serve /compile from a pool of worker processes.")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=5001)
+    arg_parser.add_argument('--workers', type=int, help="compile processes (default: one per core)")
+    arg_parser.add_argument('--max-pending', type=int,
+                            help="compiles waiting or running before new ones get 429 (default: 8 per worker)")
+    arg_parser.add_argument('--timeout', type=float, default=30.0, help="seconds per request")
+    arg_parser.add_argument('--max-source-bytes', type=int, default=1 << 20)
+    arg_parser.add_argument('--cache-entries', type=int, default=256,
+                            help="compile results kept in memory; 0 disables the cache")
+    arg_parser.add_argument('--log-level', default='WARNING')
+    args = arg_parser.parse_args(argv)
+
+    configure(args.log_level)
+    cache = CompileCache(max_entries=args.cache_entries) if args.cache_entries else None
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, max_pending=args.max_pending,
+                          timeout=args.timeout, max_source_bytes=args.max_source_bytes,
+                          cache=cache))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
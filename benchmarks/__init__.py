@@ -0,0 +1,17 @@
+"""Benchmarks for the SimpleLang compiler.
+
+generator.py writes synthetic programs of any size; runner.py times every
+compiler phase on them and saves the results as JSON (--reference-folder
+also times the original eval()-based constant folder, kept in
+reference.py, against the current one):
+
+    python -m benchmarks.runner --sizes 1K 10K 100K 1M -o results.json
+    python -m benchmarks.runner --compare results.json
+"""
+import os
+import sys
+
+# The compiler modules import each other by their plain names
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
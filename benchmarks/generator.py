@@ -0,0 +1,95 @@
+import random
+
+ARITHMETIC_OPERATORS = ('+', '-', '*', '/')
+RELATIONAL_OPERATORS = ('>', '<', '==')
+
+
+class ProgramGenerator:
+    """Writes random, semantically valid SimpleLang programs.
+
+    declarations      variables declared at the top of the program
+    expression_depth  levels of nested sub-expressions in an assignment
+    expression_width  operands combined at each level
+    if_depth          how deeply `if` blocks may nest
+    if_ratio          chance that a statement opens an `if` block
+    redundancy        chance that an expression repeats a recent one
+                      verbatim, giving CSE something to find
+    float_ratio       share of the variables declared float
+
+    The same parameters and seed always give the same program.
+    """
+
+    def __init__(self, declarations=20, expression_depth=2, expression_width=2, if_depth=2,
+                 if_ratio=0.15, redundancy=0.3, float_ratio=0.25, seed=0):
+        self.declarations = max(1, declarations)
+        self.expression_depth = expression_depth
+        self.expression_width = max(1, expression_width)
+        self.if_depth = if_depth
+        self.if_ratio = if_ratio
+        self.redundancy = redundancy
+        self.float_ratio = float_ratio
+        self.seed = seed
+
+    PARAMETERS = ('declarations', 'expression_depth', 'expression_width', 'if_depth',
+                  'if_ratio', 'redundancy', 'float_ratio', 'seed')
+
+    def parameters(self):
+        return {name: getattr(self, name) for name in self.PARAMETERS}
+
+    def generate(self, size):
+        """A program of about `size` characters (never less)."""
+        return ''.join(self.chunks(size))
+
+    def chunks(self, size):
+        """Yield the program of generate(size) a statement at a time."""
+        self.random = random.Random(self.seed)
+        self.recent = []
+        self.names = [f"v{index}" for index in range(self.declarations)]
+        written = 0
+        for name in self.names:
+            kind = 'float' if self.random.random() < self.float_ratio else 'int'
+            line = f"{kind} {name};\n"
+            written += len(line)
+            yield line
+        while written < size:
+            statement = self.statement(0)
+            written += len(statement)
+            yield statement
+
+    def statement(self, depth):
+        indent = '    ' * depth
+        roll = self.random.random()
+        if depth < self.if_depth and roll < self.if_ratio:
+            body = ''.join(self.statement(depth + 1)
+                           for _ in range(self.random.randint(1, 3)))
+            condition = (f"{self.expression(1)} {self.random.choice(RELATIONAL_OPERATORS)} "
+                         f"{self.expression(1)}")
+            return f"{indent}if ({condition}) {{\n{body}{indent}}}\n"
+        if roll > 0.95:
+            return f"{indent}print({self.random.choice(self.names)});\n"
+        return f"{indent}{self.random.choice(self.names)} = {self.expression(self.expression_depth)};\n"
+
+    def expression(self, depth):
+        if self.recent and self.random.random() < self.redundancy:
+            return self.random.choice(self.recent)
+        text = self.build(depth)
+        self.recent.append(text)
+        if len(self.recent) > 16:
+            del self.recent[0]
+        return text
+
+    def build(self, depth):
+        if depth <= 0:
+            if self.random.random() < 0.7:
+                return self.random.choice(self.names)
+            # Non-zero constants: nothing divides by zero
+            return str(self.random.randint(1, 99))
+        operands = [self.build(depth - 1) for _ in range(self.expression_width)]
+        text = operands[0]
+        for operand in operands[1:]:
+            text += f" {self.random.choice(ARITHMETIC_OPERATORS)} {operand}"
+        return f"({text})" if self.expression_width > 1 else text
+
+
+if __name__ == "__main__":
+    print(ProgramGenerator(declarations=4, seed=1).generate(600))
@@ -0,0 +1,130 @@
+"""Load test for asyncserver.py (or any server with the same /compile).
+
+Runs a steady stream of small compiles from many concurrent clients while
+a few other clients keep sending large programs, and reports the latency
+percentiles of each kind along with the status codes returned. On a
+server that isolates compiles in a worker pool, the small requests' tail
+latency should stay close to their latency with no large ones running.
+
+    python asyncserver.py --port 5001 --workers 4 &
+    python -m benchmarks.loadtest --port 5001 --clients 16 --requests 400 --large-clients 2
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.generator import ProgramGenerator
+
+
+async def post(host, port, path, payload):
+    """Send one request and return (status, seconds)."""
+    body = json.dumps(payload).encode()
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(name, results):
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = [seconds for status, seconds in results if status == 200]
+    summary = {'requests': len(results), 'statuses': statuses}
+    for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0)):
+        value = percentile(latencies, fraction)
+        summary[label] = round(value * 1000, 1) if value is not None else None
+    print(f"{name:6} {len(results):5} requests  statuses {statuses}  latency ms "
+          f"p50 {summary['p50']}  p95 {summary['p95']}  p99 {summary['p99']}  max {summary['max']}")
+    return summary
+
+
+async def small_clients(args, sources):
+    queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(sources[index % len(sources)])
+    results = []
+
+    async def client():
+        while not queue.empty():
+            source = queue.get_nowait()
+            try:
+                results.append(await post(args.host, args.port, '/compile', {'source': source}))
+            except OSError:
+                results.append((0, 0.0))
+
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    return results
+
+
+async def large_clients(args, source, stop):
+    results = []
+
+    async def client():
+        while not stop.is_set():
+            unique = f"{source}int unique{len(results)}_{time.time_ns()};\n"
+            try:
+                results.append(await post(args.host, args.port, '/compile', {'source': unique}))
+            except OSError:
+                results.append((0, 0.0))
+
+    await asyncio.gather(*(client() for _ in range(args.large_clients)))
+    return results
+
+
+async def run(args):
+    # Distinct programs, so the server's result cache doesn't answer them
+    sources = [ProgramGenerator(declarations=8, seed=seed).generate(args.small_size)
+               for seed in range(args.requests)]
+    large = ProgramGenerator(declarations=30, seed=-1).generate(args.large_size)
+
+    baseline = summarize('alone', await small_clients(args, sources))
+    stop = asyncio.Event()
+    background = asyncio.ensure_future(large_clients(args, large, stop))
+    await asyncio.sleep(0.2)
+    # Fresh sources again, for the same reason
+    sources = [source + f"int again{index};\n" for index, source in enumerate(sources)]
+    loaded = summarize('mixed', await small_clients(args, sources))
+    stop.set()
+    heavy = summarize('large', await background)
+    return {'alone': baseline, 'mixed': loaded, 'large': heavy}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest",
+                                         description="Measure /compile latency under concurrent load.")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=5001)
+    arg_parser.add_argument('--clients', type=int, default=16, help="concurrent small-program clients")
+    arg_parser.add_argument('--requests', type=int, default=400, help="small programs sent per phase")
+    arg_parser.add_argument('--small-size', type=int, default=1 << 10)
+    arg_parser.add_argument('--large-clients', type=int, default=2,
+                            help="clients sending large programs during the mixed phase")
+    arg_parser.add_argument('--large-size', type=int, default=200 << 10)
+    arg_parser.add_argument('-o', '--output', help="write the summary here as JSON")
+    args = arg_parser.parse_args(argv)
+
+    summary = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+class EvalConstantFolder:
+    """The original constant folder, kept as a reference for the benchmark
+    and the folding tests: every `name = expression` line of text code is
+    evaluated with eval(), over a table of the names folded so far.
+
+    It computes with Python's semantics rather than SimpleLang's (7 / 2 is
+    3.5) and ignores declared types. Lines without a single '=' pass
+    through; the original raised on them (e.g. `if x <= 3 goto L1`).
+    """
+
+    def optimize(self, three_address_code):
+        optimized_code = []
+        constant_table = {}
+
+        for instruction in three_address_code:
+            parts = instruction.split('=')
+            if len(parts) == 2:
+                left, right = parts[0].strip(), parts[1].strip()
+                try:
+                    result = eval(right, {}, constant_table)
+                    constant_table[left] = result
+                    optimized_code.append(f"{left} = {result}")
+                except Exception:
+                    optimized_code.append(instruction)
+            else:
+                optimized_code.append(instruction)
+
+        return optimized_code
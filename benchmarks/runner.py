@@ -0,0 +1,223 @@
+import argparse
+import datetime
+import gc
+import json
+import platform
+import sys
+import time
+
+from benchmarks.generator import ProgramGenerator
+from benchmarks.reference import EvalConstantFolder
+from cache import compiler_version
+from codegen import IntermediateCodeGenerator
+from ir import format_code
+from lexer import Lexer
+from metrics import CompileMetrics
+from optimizer import ConstantFoldingOptimizer, CSEOptimizer
+from parser import Parser
+from semantic import SemanticAnalyzer
+
+DEFAULT_SIZES = ('1K', '10K', '100K', '1M')
+UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+# A phase slower than the baseline by more than this fraction, and by more
+# than the absolute noise floor, is reported
+REGRESSION_THRESHOLD = 0.25
+NOISE_SECONDS = 0.001
+
+# Phases timed for comparison only, left out of the compile's total
+REFERENCE_PHASES = ('constant_folding_eval',)
+
+
+def parse_size(text):
+    """'100K' -> 102400; plain numbers are bytes."""
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def compile_phases(source, trace_memory=False, reference=False):
+    """Run the front end and the first two optimizer passes on `source`,
+    one measured phase each. With `reference`, the original eval()-based
+    constant folder is timed on the same code too, as the
+    'constant_folding_eval' phase. Returns the CompileMetrics."""
+    with CompileMetrics(trace_memory) as metrics:
+        with metrics.phase('lexer') as phase:
+            tokens, _ = Lexer(source).tokenize()
+            phase['tokens'] = len(tokens)
+        with metrics.phase('parser', tokens=len(tokens)) as phase:
+            ast, errors = Parser(tokens).parse()
+        if errors:
+            raise ValueError(f"Generated program doesn't parse: {errors[:3]}")
+        del tokens
+        phase['nodes'] = ast.count()
+        with metrics.phase('semantic', nodes=phase['nodes']) as phase:
+            analyzer = SemanticAnalyzer(ast)
+            errors = analyzer.analyze()
+        if errors:
+            raise ValueError(f"Generated program has semantic errors: {errors[:3]}")
+        with metrics.phase('codegen', nodes=phase['nodes']) as phase:
+            code = IntermediateCodeGenerator(ast).generate()
+            phase['instructions'] = len(code)
+        del ast
+        if reference:
+            text = format_code(code)
+            with metrics.phase('constant_folding_eval', instructions=len(text)):
+                EvalConstantFolder().optimize(text)
+            del text
+        for name, optimizer in (('constant_folding', ConstantFoldingOptimizer(analyzer.symbol_table)),
+                                ('cse', CSEOptimizer(analyzer.symbol_table))):
+            with metrics.phase(name, instructions=len(code)):
+                code = optimizer.optimize(code)
+    return metrics
+
+
+def throughput(entry):
+    """Items per second for a phase: instructions for code generation and
+    the optimizers, tokens for the lexer and parser, nodes for semantic
+    analysis."""
+    for unit in ('instructions', 'tokens', 'nodes'):
+        if unit in entry:
+            return unit, entry[unit] / entry['seconds'] if entry['seconds'] else None
+    return None, None
+
+
+def benchmark(generator, size, repeat=3, trace_memory=True, reference=False):
+    """Time every phase on a program of `size` bytes, best of `repeat`
+    runs; then, with `trace_memory`, one more run under tracemalloc for
+    the peak memory of each phase (tracing distorts the timings, so they
+    are taken without it)."""
+    source = generator.generate(size)
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        metrics = compile_phases(source, reference=reference)
+        if best is None:
+            best = metrics.phases
+        else:
+            for kept, entry in zip(best, metrics.phases):
+                kept['seconds'] = min(kept['seconds'], entry['seconds'])
+    if trace_memory:
+        gc.collect()
+        traced = compile_phases(source, trace_memory=True, reference=reference)
+        for kept, entry in zip(best, traced.phases):
+            kept['peak_bytes'] = entry['peak_bytes']
+
+    phases = {}
+    for entry in best:
+        name = entry.pop('phase')
+        unit, rate = throughput(entry)
+        phases[name] = {**entry, f'{unit}_per_second': rate}
+    return {
+        'size_bytes': len(source),
+        'total_seconds': sum(entry['seconds'] for name, entry in phases.items()
+                             if name not in REFERENCE_PHASES),
+        'peak_bytes': max((entry.get('peak_bytes', 0) for entry in phases.values()), default=0),
+        'phases': phases,
+    }
+
+
+def run(sizes, generator, repeat=3, trace_memory=True, log=None, reference=False):
+    results = []
+    for size in sizes:
+        started = time.perf_counter()
+        result = benchmark(generator, size, repeat, trace_memory, reference)
+        results.append(result)
+        if log:
+            lexer = result['phases']['lexer']
+            print(f"{result['size_bytes']:>12,} bytes: {result['total_seconds']:8.3f} s compile, "
+                  f"{lexer['tokens_per_second']:12,.0f} tokens/s lexed, "
+                  f"peak {result['peak_bytes'] / (1 << 20):8.1f} MiB "
+                  f"({time.perf_counter() - started:.1f} s wall)", file=log)
+            if reference:
+                folding = result['phases']['constant_folding']['seconds']
+                evaluated = result['phases']['constant_folding_eval']['seconds']
+                print(f"{'':>12}  constant folding {folding:.4f} s, eval() folder "
+                      f"{evaluated:.4f} s ({evaluated / folding:.1f}x)", file=log)
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'compiler_version': compiler_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'reference': reference,
+            'generator': generator.parameters(),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Phases (by input size) more than `threshold` slower than in
+    `baseline`, as (size, phase, baseline seconds, current seconds).
+    Differences under NOISE_SECONDS are ignored."""
+    old = {result['size_bytes']: result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = old.get(result['size_bytes'])
+        if before is None:
+            continue
+        for name, entry in result['phases'].items():
+            reference = before['phases'].get(name)
+            if (reference and entry['seconds'] > reference['seconds'] * (1 + threshold)
+                    and entry['seconds'] - reference['seconds'] > NOISE_SECONDS):
+                regressions.append((result['size_bytes'], name, reference['seconds'],
+                                    entry['seconds']))
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m benchmarks.runner",
+                                         description="Time each compiler phase on synthetic programs.")
+    arg_parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                            help="program sizes, e.g. 1K 10K 1M 100M (default: %(default)s)")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="timed runs per size; the best counts")
+    arg_parser.add_argument('--no-memory', action='store_true',
+                            help="skip the tracemalloc run that measures peak memory")
+    arg_parser.add_argument('--reference-folder', action='store_true',
+                            help="also time the original eval()-based constant folder, "
+                                 "as the constant_folding_eval phase")
+    arg_parser.add_argument('-o', '--output', help="write the results here as JSON")
+    arg_parser.add_argument('--compare', metavar='BASELINE',
+                            help="results JSON to compare against; exits 1 on regressions")
+    arg_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                            help="slowdown that counts as a regression (default: %(default)s)")
+    arg_parser.add_argument('--declarations', type=int, default=20)
+    arg_parser.add_argument('--expression-depth', type=int, default=2)
+    arg_parser.add_argument('--expression-width', type=int, default=2)
+    arg_parser.add_argument('--if-depth', type=int, default=2)
+    arg_parser.add_argument('--if-ratio', type=float, default=0.15)
+    arg_parser.add_argument('--redundancy', type=float, default=0.3)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args(argv)
+
+    generator = ProgramGenerator(
+        declarations=args.declarations, expression_depth=args.expression_depth,
+        expression_width=args.expression_width, if_depth=args.if_depth,
+        if_ratio=args.if_ratio, redundancy=args.redundancy, seed=args.seed)
+    sizes = [parse_size(size) for size in args.sizes]
+    results = run(sizes, generator, args.repeat, not args.no_memory, log=sys.stderr,
+                  reference=args.reference_folder)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        for size, name, before, after in regressions:
+            print(f"REGRESSION {size:,} bytes, {name}: {before:.4f} s -> {after:.4f} s "
+                  f"(+{(after / before - 1) * 100:.0f}%)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The compiler's modules import each other by their plain names, as when
+# run from Src/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'Src'))
+sys.path.insert(0, ROOT)
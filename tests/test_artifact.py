@@ -0,0 +1,35 @@
+"""Artifacts: constants of any size round-trip, and an artifact from another
+compiler version is refused."""
+import pytest
+
+from artifact import HEADER, Artifact, ArtifactError, ArtifactBuilder, save_artifact
+from ir import format_code, parse_code
+from main import run_main
+from vm import VirtualMachine
+
+WIDE = [1 << 63, -(1 << 63) - 1, 99999999999999999999 * 10, -(7 ** 3000)]
+
+
+def test_wide_ints_round_trip(tmp_path, capsys):
+    code = parse_code([f"x = {value}" for value in WIDE] + ["print x", "x = 5", "print x"])
+    path = tmp_path / 'program.slc'
+    save_artifact(path, code, {'x': {'type': 'int'}})
+    with Artifact.open(path) as artifact:
+        assert format_code(artifact.code()) == format_code(code)
+        VirtualMachine(artifact.bytecode()).run()
+    assert capsys.readouterr().out.split() == [str(WIDE[-1]), '5']
+
+
+def test_other_compiler_version_is_refused(tmp_path):
+    data = bytearray(ArtifactBuilder().build(parse_code(["print x"]), {'x': {'type': 'int'}}))
+    magic, version, flags, checksum, _ = HEADER.unpack_from(data)
+    HEADER.pack_into(data, 0, magic, version, flags, checksum, b'0123456789abcdef')
+    with pytest.raises(ArtifactError, match="compiler version 0123456789abcdef"):
+        Artifact(bytes(data))
+    with Artifact(bytes(data), check_version=False) as artifact:
+        assert artifact.compiler_version == '0123456789abcdef'
+
+    path = tmp_path / 'old.slc'
+    path.write_bytes(data)
+    with pytest.raises(SystemExit, match="build it again"):
+        run_main([str(path)])
@@ -0,0 +1,50 @@
+"""Malformed requests to the async server get a 4xx response and are
+counted, instead of escaping the connection handler."""
+import asyncio
+import json
+
+import pytest
+
+from asyncserver import MAX_HEADER_BYTES, CompileServer
+
+BAD_REQUESTS = [
+    (b"GET /health\r\n\r\n", 400),
+    (b"GET  /health HTTP/1.1\r\n\r\n", 400),
+    (b"POST /compile HTTP/1.1\r\nContent-Length: lots\r\n\r\n", 400),
+    (b"POST /compile HTTP/1.1\r\nContent-Length: -4\r\n\r\n", 400),
+    (b"GET /health HTTP/1.1\r\nX-Padding: " + b"x" * (MAX_HEADER_BYTES + 1) + b"\r\n\r\n", 431),
+]
+
+
+async def exchange(requests):
+    server = CompileServer(workers=1)
+    listener = await asyncio.start_server(server.handle, '127.0.0.1', 0, limit=MAX_HEADER_BYTES)
+    port = listener.sockets[0].getsockname()[1]
+    responses = []
+    try:
+        for request in requests:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await writer.drain()
+            responses.append(await reader.read())
+            writer.close()
+    finally:
+        listener.close()
+        server.pool.close()
+    return server, responses
+
+
+@pytest.mark.parametrize('request_bytes, status', BAD_REQUESTS)
+def test_bad_request_gets_an_error_response(request_bytes, status):
+    server, (response,) = asyncio.run(exchange([request_bytes]))
+    head, body = response.split(b'\r\n\r\n', 1)
+    assert head.split()[1] == str(status).encode()
+    assert 'error' in json.loads(body)
+    assert server.counts['bad_request'] == 1
+
+
+def test_server_keeps_serving_after_bad_requests():
+    requests = [request for request, _ in BAD_REQUESTS] + [b"GET /health HTTP/1.1\r\n\r\n"]
+    server, responses = asyncio.run(exchange(requests))
+    assert responses[-1].startswith(b"HTTP/1.1 200 ")
+    assert json.loads(responses[-1].split(b'\r\n\r\n', 1)[1])['bad_request'] == len(BAD_REQUESTS)
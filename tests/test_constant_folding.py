@@ -0,0 +1,114 @@
+"""ConstantFoldingOptimizer against a table of expected results, the
+original eval()-based folder, and what the VM computes at run time."""
+import io
+
+import pytest
+
+from benchmarks.reference import EvalConstantFolder
+from ir import FLOAT, INT, format_code, parse_code
+from optimizer import ConstantFoldingOptimizer
+from vm import BytecodeCompiler, VirtualMachine
+
+# expression, folded value (with its type), whether the eval() folder agrees
+ARITHMETIC_CASES = [
+    ("2 + 3", 5, True),
+    ("10 - 4", 6, True),
+    ("6 * 7", 42, True),
+    ("2 * 2.5", 5.0, True),        # mixed int and float promotes to float
+    ("2.5 * 2", 5.0, True),
+    ("1 - 0.5", 0.5, True),
+    ("0.5 + 0.25", 0.75, True),
+    ("7.0 / 2", 3.5, True),
+    ("1 / 4.0", 0.25, True),
+    ("6 / 3", 2, False),           # eval() gave 2.0: / was always true division
+    ("7 / 2", 3, False),           # int / int truncates; eval() gave 3.5
+    ("-7 / 2", -3, False),         # toward zero, like C; eval() gave -3.5
+    ("7 / -2", -3, False),
+    ("-7 / -2", 3, False),
+]
+
+# jump condition, whether the jump is taken
+RELATIONAL_CASES = [
+    ("3 > 2", True),
+    ("2 > 3", False),
+    ("2 < 2.5", True),
+    ("2 == 2.0", True),
+    ("1 != 1", False),
+    ("2.5 <= 2", False),
+    ("2 >= 2", True),
+]
+
+
+def fold(lines, symbol_table=None):
+    return format_code(ConstantFoldingOptimizer(symbol_table).optimize(parse_code(lines)))
+
+
+def run_unoptimized(lines, symbol_table):
+    vm = VirtualMachine(BytecodeCompiler(symbol_table).compile(parse_code(lines)))
+    vm.run(io.StringIO())
+    return vm.variables()
+
+
+@pytest.mark.parametrize('expression, expected, eval_agrees', ARITHMETIC_CASES)
+def test_arithmetic_folds_to_typed_constant(expression, expected, eval_agrees):
+    code = ConstantFoldingOptimizer().optimize(parse_code([f"t1 = {expression}", "x = t1"]))
+    result = code[-1].arg1
+    assert result.kind == (FLOAT if isinstance(expected, float) else INT)
+    assert result.value == expected
+    # The same value the unoptimized code computes when it runs
+    assert run_unoptimized([f"t1 = {expression}", "x = t1"], {}) == {'x': expected}
+
+    folded = EvalConstantFolder().optimize([f"t1 = {expression}", "x = t1"])
+    assert (folded[-1] == f"x = {expected}") == eval_agrees
+
+
+@pytest.mark.parametrize('condition, taken', RELATIONAL_CASES)
+def test_constant_jumps_are_resolved(condition, taken):
+    code = fold([f"if {condition} goto L1", "x = 1", "L1:", "print x"])
+    if taken:
+        assert code[0] == "goto L1"
+    else:
+        assert code[:2] == ["x = 1", "L1:"]
+
+
+@pytest.mark.parametrize('expression, var_type, expected', [
+    ("7 / 2", 'float', 3.0),       # int division first, then stored as float
+    ("7.0 / 2", 'int', 3),         # float result truncated into an int
+    ("2 * 2.5", 'int', 5),
+    ("1", 'float', 1.0),
+    ("2.9", 'int', 2),
+])
+def test_stores_convert_to_declared_type(expression, var_type, expected):
+    symbol_table = {'x': {'type': var_type}}
+    lines = [f"t1 = {expression}", "x = t1"] if ' ' in expression else [f"x = {expression}"]
+    code = ConstantFoldingOptimizer(symbol_table).optimize(parse_code(lines))
+    result = code[-1].arg1
+    assert result.kind == (FLOAT if var_type == 'float' else INT)
+    assert result.value == expected
+    assert run_unoptimized(lines, symbol_table) == {'x': expected}
+
+
+def test_division_by_zero_is_left_to_run_time():
+    assert fold(["t1 = 7 / 0", "x = t1"]) == ["t1 = 7 / 0", "x = t1"]
+    assert fold(["t1 = 1.5 / 0", "x = t1"]) == ["t1 = 1.5 / 0", "x = t1"]
+
+
+def test_constants_propagate_through_copies_and_stop_at_joins():
+    code = fold([
+        "a = 4",
+        "t1 = a * 2",
+        "b = t1",
+        "if c > 0 goto L1",
+        "b = 1",
+        "L1:",
+        "t2 = b + a",
+        "print t2",
+    ])
+    assert code == ["a = 4", "t1 = 8", "b = 8", "if c > 0 goto L1", "b = 1", "L1:",
+                    "t2 = b + 4", "print t2"]
+
+
+def test_matches_eval_folder_on_programs_without_int_division():
+    lines = ["t1 = 2 + 3", "t2 = t1 * 1.5", "x = t2", "t3 = x - 0.5", "y = t3",
+             "t4 = y * 2", "z = t4"]
+    assert fold(lines) == EvalConstantFolder().optimize(lines)
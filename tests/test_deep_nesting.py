@@ -0,0 +1,74 @@
+"""Stress test: input nested 100k levels deep compiles without hitting the
+recursion limit, through every phase, to the same result as the same
+program written shallow."""
+import io
+
+import pytest
+
+from codegen import IntermediateCodeGenerator
+from fused import FusedFrontEnd
+from ir import format_code
+from lexer import Lexer
+from optimizer import run_passes
+from parser import Parser
+from semantic import SemanticAnalyzer
+from vm import BytecodeCompiler, VirtualMachine
+
+DEPTH = 100_000
+DECLARATIONS = "int x;\nint y;\nx = 1;\ny = 0;\n"
+
+
+def nested_ifs(depth):
+    return (DECLARATIONS + "if (x > 0) {\n" * depth + "y = y + x * 2;\n" + "}\n" * depth
+            + "print(y);\n")
+
+
+def nested_parens(depth):
+    return DECLARATIONS + "y = " + "(" * depth + "x + 3" + ")" * depth + " * 2;\nprint(y);\n"
+
+
+def nested_both(depth):
+    return (DECLARATIONS + "if (((x)) > (0)) {\n" * depth
+            + "y = " + "(" * depth + "y + x" + ")" * depth + ";\n" + "}\n" * depth
+            + "print(y);\n")
+
+
+def compile_and_run(source):
+    """Every phase in turn; returns (printed output, final variables)."""
+    tokens, _ = Lexer(source).tokenize()
+    ast, parse_errors = Parser(tokens).parse()
+    assert parse_errors == []
+    analyzer = SemanticAnalyzer(ast)
+    assert analyzer.analyze() == []
+    code = IntermediateCodeGenerator(ast).generate()
+    optimized, _ = run_passes(code, analyzer.symbol_table)
+    output = io.StringIO()
+    vm = VirtualMachine(BytecodeCompiler(analyzer.symbol_table).compile(optimized))
+    vm.run(output)
+    return output.getvalue(), vm.variables()
+
+
+@pytest.mark.parametrize('program', [nested_ifs, nested_parens, nested_both])
+def test_deep_program_matches_shallow(program):
+    deep = compile_and_run(program(DEPTH))
+    shallow = compile_and_run(program(1))
+    assert deep == shallow
+
+
+@pytest.mark.parametrize('program', [nested_ifs, nested_both])
+def test_fused_front_end_handles_deep_nesting(program):
+    source = program(DEPTH)
+    code, parse_errors, semantic_errors = FusedFrontEnd(source).compile()
+    assert parse_errors == semantic_errors == []
+    tokens, _ = Lexer(source).tokenize()
+    ast, _ = Parser(tokens).parse()
+    assert format_code(code) == format_code(IntermediateCodeGenerator(ast).generate())
+
+
+def test_unclosed_deep_ifs_report_each_missing_brace():
+    source = DECLARATIONS + "if (x > 0) {\n" * DEPTH
+    tokens, _ = Lexer(source).tokenize()
+    ast, parse_errors = Parser(tokens).parse()
+    assert len(parse_errors) == DEPTH
+    assert all(error == "Expected '}' to close if block" for error in parse_errors)
+    assert ast.count() > DEPTH
@@ -0,0 +1,76 @@
+"""Error locations for streamed sources: the chunks are read again only if
+there are errors, and never held whole."""
+import io
+
+import pytest
+
+import diagnostics
+from diagnostics import Spool, locate, rereadable
+from fused import FusedFrontEnd
+from lexer import Lexer, read_chunks
+from parallel import ParallelFrontEnd, stream_pieces
+from parser import Parser
+from semantic import SemanticAnalyzer
+
+SOURCE = "int x;\r\nx = y +\n  1;\n\tprint(z);\nif (x > w) {\n  x = ;\n}\nint x;\nfloat"
+
+
+def errors(source):
+    tokens, _ = Lexer(source).tokenize()
+    ast, parse_errors = Parser(tokens).parse()
+    return parse_errors, SemanticAnalyzer(ast).analyze()
+
+
+def places(groups):
+    return [[(error.line, error.column) for error in group] for group in groups]
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 16, 1000])
+def test_locate_in_chunks_matches_text(size):
+    expected = locate(SOURCE, *errors(SOURCE))
+    chunks = [SOURCE[i:i + size] for i in range(0, len(SOURCE), size)]
+    located = locate(iter(chunks), *errors(SOURCE))
+    assert located == expected
+    assert places(located) == places(expected)
+    assert places(expected)[0][-1] == (9, 6)
+
+
+def test_spool_reads_back_what_went_through(monkeypatch):
+    monkeypatch.setattr(diagnostics, 'SPOOL_SIZE', 10)
+    text = "int x;\nx = 1;\n" * 100
+    spool = rereadable(iter([text[i:i + 7] for i in range(0, len(text), 7)]))
+    assert isinstance(spool, Spool)
+    assert ''.join(spool) == text
+    assert spool.file._rolled
+    assert ''.join(spool) == ''.join(spool) == text
+
+
+def test_seekable_stream_is_read_again_not_copied(tmp_path):
+    path = tmp_path / 'program.sl'
+    path.write_text(SOURCE, newline='')
+    with open(path, newline='') as f:
+        f.read(3)
+        chunks = read_chunks(f, 4)
+        assert rereadable(chunks) is chunks
+        assert ''.join(chunks) == ''.join(chunks) == SOURCE[3:]
+    assert read_chunks(io.StringIO(SOURCE)).rereadable
+
+
+@pytest.mark.parametrize('front_end', [FusedFrontEnd, lambda source: ParallelFrontEnd(source, 2)])
+def test_front_ends_locate_errors_in_streamed_chunks(front_end):
+    expected = locate(SOURCE, *errors(SOURCE))
+    chunks = (SOURCE[i:i + 3] for i in range(0, len(SOURCE), 3))
+    code, parse_errors, semantic_errors = front_end(chunks).compile()
+    assert code == []
+    assert [parse_errors, semantic_errors] == expected
+    assert places([parse_errors, semantic_errors]) == places(expected)
+
+
+def test_stream_pieces_end_on_statements():
+    text = "int a;\nif (a > 1) { a = 2; if (a > 3) { a = 4; } }\nprint(a);\n" * 50
+    pieces = list(stream_pieces(iter([text[i:i + 10] for i in range(0, len(text), 10)]), 100))
+    assert ''.join(pieces) == text
+    assert len(pieces) > 10
+    for piece in pieces[:-1]:
+        assert piece.rstrip().endswith((';', '}'))
+        assert piece.count('{') == piece.count('}')
@@ -0,0 +1,152 @@
+"""Incremental compiles match fresh ones after any edits, and
+CompilationHandles serialises edits to one compilation without holding
+up edits to the others."""
+import io
+import random
+import threading
+
+import pytest
+
+from codegen import IntermediateCodeGenerator
+from diagnostics import locate
+from incremental import CompilationHandles, IncrementalCompilation
+from lexer import Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from service import incremental_response
+from vm import BytecodeCompiler, VirtualMachine
+
+SOURCE = "int x;\nx = 1;\n"
+
+
+def test_edit_waits_only_for_its_own_compilation():
+    handles = CompilationHandles()
+    first, busy = handles.open(SOURCE)
+    second, other = handles.open(SOURCE)
+    with busy.lock:
+        waiting = threading.Thread(target=handles.edit, args=(first, len(SOURCE), 0, "print(x);\n"))
+        waiting.start()
+        waiting.join(0.2)
+        assert waiting.is_alive()
+        done = threading.Thread(target=handles.edit, args=(second, len(SOURCE), 0, "x = 2;\n"))
+        done.start()
+        done.join(5)
+        assert not done.is_alive()
+        assert other.source == SOURCE + "x = 2;\n"
+        assert busy.source == SOURCE
+    waiting.join(5)
+    assert busy.source == SOURCE + "print(x);\n"
+
+
+def test_edits_to_one_compilation_are_serialised():
+    handles = CompilationHandles()
+    handle, compilation = handles.open(SOURCE)
+
+    def append(count):
+        for _ in range(count):
+            with compilation.lock:
+                end = len(compilation.source)
+            handles.edit(handle, end, 0, "print(x);\n")
+
+    threads = [threading.Thread(target=append, args=(50,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    statements = compilation.source.count("print(x);")
+    assert statements == 200
+    fresh = IncrementalCompilation(compilation.source).analyze()
+    assert compilation.analyze()[:3] == fresh[:3]
+    assert not compilation.analyze()[0]
+
+
+PROGRAM = """int a;
+float b;
+a = 5;
+b = a * 2.5;
+if (a > 3) {
+  a = a - 1;
+  if (b > a) { print(b); }
+}
+print(a);
+"""
+SNIPPETS = ["", "", "a", "b", "c", ";", "{", "}", " ", "\n", "int c;\n", "print(c);\n",
+            "c = a + b;\n", "if (a < 9) { ", "a = (a + 1) * 2;\n", "1.2.3", "float"]
+
+STATEMENTS = ["\nprint(a);", "\na = a * 3;", "\nb = b / 2.0 + a;", "\nif (b > 1) { a = a + 2; }"]
+
+
+def fresh(source):
+    tokens, _ = Lexer(source).tokenize()
+    ast, parse_errors = Parser(tokens).parse()
+    analyzer = SemanticAnalyzer(ast)
+    semantic_errors = analyzer.analyze()
+    parse_errors, semantic_errors = locate(source, parse_errors, semantic_errors)
+    code = []
+    if not parse_errors and not semantic_errors:
+        code = IntermediateCodeGenerator(ast).generate()
+    return tokens, ast, parse_errors, semantic_errors, analyzer.symbol_table, code
+
+
+def run(code, declared):
+    output = io.StringIO()
+    VirtualMachine(BytecodeCompiler(declared).compile(code)).run(output)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_random_edits_match_a_fresh_compile(seed):
+    rng = random.Random(seed)
+    compilation = IncrementalCompilation(PROGRAM)
+    # What a client keeps from the responses: every unit, updated with
+    # the units that changed
+    units = []
+    undo = []
+    errors = False
+    for step in range(80):
+        source = compilation.source
+        if undo and rng.random() < (0.8 if errors else 0.2):
+            # Take the last edit back, as an editor's undo would
+            compilation.edit(*undo.pop())
+        elif step and not undo and rng.random() < 0.5:
+            # A whole statement, at a statement boundary (only between
+            # undos, which would otherwise be shifted)
+            offset = rng.choice([0] + [i + 1 for i, char in enumerate(source) if char in ';}'])
+            compilation.edit(offset, 0, rng.choice(STATEMENTS))
+        elif step:
+            offset = rng.randrange(len(source) + 1)
+            length = rng.randrange(min(12, len(source) - offset) + 1)
+            replacement = rng.choice(SNIPPETS)
+            compilation.edit(offset, length, replacement)
+            undo.append((offset, len(replacement), source[offset:offset + length]))
+        response = incremental_response(compilation)
+        errors = bool(response['parse_errors'] or response['semantic_errors'])
+        changed = response['changed']
+        units[changed['first']:changed['first'] + changed['removed']] = changed['units']
+
+        source = compilation.source
+        tokens, ast, parse_errors, semantic_errors, declared, code = fresh(source)
+        context = f"step {step}: {source!r}"
+        assert response['parse_errors'] == parse_errors, context
+        assert response['semantic_errors'] == semantic_errors, context
+        assert compilation.analyze()[2] == declared, context
+        assert [token for unit in units for token in unit['tokens']] == tokens, context
+        assert [statement for unit in units for statement in unit['ast']] == \
+            ast.to_dict()['statements'], context
+        assert run(compilation.code(), declared) == run(code, declared), context
+
+
+def test_edit_checks_only_the_units_from_the_edit_on():
+    compilation = IncrementalCompilation("int a;\n" + "a = a + 1;\n" * 1000 + "print(b);\n")
+    assert len(compilation.changes()[2]) == len(compilation.units)
+    errors = compilation.analyze()[1]
+    assert errors == ["Line 1002, column 7: Undeclared variable 'b' in print statement"]
+    replayed = []
+    replay = compilation.analyzer.replay
+    compilation.analyzer.replay = lambda *args: replayed.append(args) or replay(*args)
+    end = len(compilation.source)
+    compilation.edit(end - len("print(b);\n"), 0, "int b;\n")
+    assert compilation.analyze()[1] == []
+    first, removed, rebuilt = compilation.changes()
+    assert first == 1001 and len(rebuilt) <= 3
+    assert len(replayed) == len(compilation.units) - first
@@ -0,0 +1,105 @@
+"""The bulk scanners (tokenize, iter_tokens) against the reference
+character-at-a-time scanner, get_next_token."""
+import pytest
+
+from benchmarks.generator import ProgramGenerator
+from diagnostics import locate
+from fused import FusedFrontEnd
+from lexer import Lexer
+from parser import Parser
+
+CORPUS = [
+    "x=10",
+    "12abc",
+    "x = 12abc;",
+    "a==b<=c>=d!=e=f<g>h",
+    "a+-b*/c--d",
+    "x=-1;y=+2",
+    "3.14 + 2. * 1.5",
+    "float f;\nf = 0.5 / 2.25;\n",
+    "1.5e3",
+    "007 + 0.0",
+    "a.b .5",
+    "x @ y # $ ~ ` ' \" ? : ! % ^ & | [ ] \\",
+    "int x;\nx = 5;",
+    "if(a>b){print(a);}else{print(b);}",
+    "_a1 __b a_ b1c2 9x9",
+    "abc123def(ghi)",
+    "x=10\r\ny=20\r\n",
+    "\tint\tx ;\n\n\n",
+    "int x1;\nx1 = (x1 + 25) * 3.5;\nif (x1 > 100) { print(x1); }\n",
+    "x",
+    "",
+    "   ",
+    "\n",
+]
+
+# Operators spaced out where the block is sampled, packed further on
+LATE_PACKED = "x = a + b - c * d / e;\n" * 200 + "x=a+b-c*d/e;y=-x;"
+
+
+def reference(source):
+    """Tokens and symbol table from the original scanner."""
+    lexer = Lexer(source)
+    tokens = []
+    while token := lexer.get_next_token():
+        tokens.append(token)
+    return tokens, lexer.symbol_table
+
+
+def same(tokens, expected):
+    # Compare types as well as values: 1 == 1.0, but INT and FLOAT differ
+    return [(kind, type(value), value) for kind, value in tokens] == \
+        [(kind, type(value), value) for kind, value in expected]
+
+
+@pytest.mark.parametrize('source', CORPUS + [LATE_PACKED, ProgramGenerator(seed=1).generate(3000)])
+def test_tokenize_matches_get_next_token(source):
+    expected, expected_symbols = reference(source)
+    tokens, symbols = Lexer(source).tokenize()
+    assert same(tokens, expected)
+    assert list(symbols.items()) == list(expected_symbols.items())
+
+
+@pytest.mark.parametrize('source', CORPUS)
+def test_iter_tokens_matches_at_every_chunk_boundary(source):
+    expected, expected_symbols = reference(source)
+    for cut in range(len(source) + 1):
+        lexer = Lexer('')
+        tokens = list(lexer.iter_tokens([source[:cut], source[cut:]]))
+        assert same(tokens, expected), f"split at {cut}"
+        assert list(lexer.symbol_table.items()) == list(expected_symbols.items())
+        assert lexer.token_count == len(expected)
+
+
+def test_iter_tokens_matches_in_small_chunks():
+    source = ProgramGenerator(seed=2).generate(2000)
+    expected, _ = reference(source)
+    for size in (1, 2, 3, 7, 64):
+        chunks = [source[i:i + size] for i in range(0, len(source), size)]
+        assert same(list(Lexer('').iter_tokens(chunks)), expected), f"chunks of {size}"
+
+
+MALFORMED = ["x = 1.5.;", "1..2", "y=3.4.5", "z = 4..;", "1.2.3abc"]
+
+
+@pytest.mark.parametrize('source', MALFORMED)
+def test_malformed_numbers_lex_alike(source):
+    expected, _ = reference(source)
+    assert any(kind == 'UNKNOWN' and value[0].isdigit() for kind, value in expected)
+    assert same(Lexer(source).tokenize()[0], expected)
+    assert same(list(Lexer('').iter_tokens([source])), expected)
+    assert same(list(Lexer(source).tokenize_store()), expected)
+
+
+def test_compile_reports_malformed_numbers_and_carries_on():
+    source = "int x;\nx = 1.2.3;\nx = (2 + 4..5) * 3;\nprint(x);\nprint(y);\nx = 7;\n"
+    tokens, _ = Lexer(source).tokenize()
+    _, parse_errors = Parser(tokens).parse()
+    parse_errors, = locate(source, parse_errors)
+    assert parse_errors == ["Line 2, column 5: Malformed number '1.2.3'",
+                            "Line 3, column 10: Malformed number '4..5'"]
+    code, parse_errors, semantic_errors = FusedFrontEnd(source).compile()
+    assert parse_errors == ["Line 2, column 5: Malformed number '1.2.3'",
+                            "Line 3, column 10: Malformed number '4..5'"]
+    assert semantic_errors == ["Line 5, column 7: Undeclared variable 'y' in print statement"]
@@ -0,0 +1,37 @@
+"""The Python backend against the VM on programs nested too deeply for
+nested Python ifs, which run through the block dispatcher."""
+import io
+
+import pytest
+
+from main import SimpleLangCompiler
+from pybackend import MAX_NESTING
+
+
+def nested(depth):
+    # x is never assigned, so the optimizer can't fold the conditions away
+    return ("int x;\nint y;\ny = x + 3;\n"
+            + "if (y > x) {\ny = y + 1;\nprint(y);\n" * depth
+            + "}\n" * depth + "print(y);\n")
+
+
+@pytest.mark.parametrize('depth', [MAX_NESTING // 2, MAX_NESTING + 1, 2500])
+def test_deep_nesting_matches_the_vm(depth):
+    compiler = SimpleLangCompiler(nested(depth))
+    assert compiler.compile(output='quiet')
+    outputs = {}
+    for backend in ('vm', 'python'):
+        output = io.StringIO()
+        compiler.execute(output, backend=backend)
+        outputs[backend] = output.getvalue()
+    assert outputs['python'] == outputs['vm']
+    assert outputs['vm'].split() == [str(value) for value in range(4, depth + 4)] + [str(depth + 3)]
+
+
+def test_dispatch_is_a_shallow_tree():
+    compiler = SimpleLangCompiler(nested(2500))
+    assert compiler.compile(output='quiet')
+    compiler.execute(io.StringIO(), backend='python')
+    source = compiler.python_program.source
+    assert 'elif' not in source
+    assert max(len(line) - len(line.lstrip()) for line in source.splitlines()) // 4 < 20
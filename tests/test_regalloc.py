@@ -0,0 +1,88 @@
+"""Register allocation keeps programs' behaviour, and spills what doesn't fit
+in `registers` to memory with real stores and reloads."""
+import io
+
+import pytest
+
+from ir import SPILL, TEMP, format_code, parse_code
+from main import SimpleLangCompiler
+from metrics import CompileMetrics
+from pybackend import PythonCodeGenerator, PythonProgram
+from regalloc import LinearScanAllocator, allocate_registers
+from vm import LOAD, STORE, BytecodeCompiler, VirtualMachine
+
+CODE = parse_code([
+    "t1 = a + 1", "t2 = a + 2", "t3 = a + 3", "t4 = t1 * t2", "t5 = t4 * t3",
+    "x = t5", "print x",
+])
+TABLE = {'a': {'type': 'int'}, 'x': {'type': 'int'}}
+
+# Many values live at once: the left operand of each + waits for the
+# parenthesized rest. b is never assigned, so nothing folds.
+PRESSURE = "int a;\nint b;\nint x;\na = b + 3;\nx = " + " + (".join(
+    f"(a * {i} - {i % 7})" for i in range(1, 21)) + ")" * 19 + ";\nprint(x);\n" \
+    "if (x > 100) {\n  x = x / 2 + (a * 2 - 1) * (a * 3 - 2);\n  print(x);\n}\n"
+
+
+def run(code, capsys):
+    VirtualMachine(BytecodeCompiler(TABLE).compile(code)).run()
+    return capsys.readouterr().out
+
+
+def registers(code):
+    return {operand for quad in code for operand in (quad.dest, quad.arg1, quad.arg2)
+            if operand is not None and operand.kind == TEMP}
+
+
+def test_temporaries_beyond_the_registers_are_spilled(capsys):
+    expected = run(CODE, capsys)
+    for count in (1, 2, 3, 16):
+        allocator = LinearScanAllocator(TABLE, count)
+        code = allocator.optimize(CODE)
+        assert run(code, capsys) == expected
+        assert len(registers(code)) == allocator.registers_used <= max(count, 2)
+        spills = [quad for quad in code if SPILL in (getattr(quad.dest, 'kind', None),
+                                                     getattr(quad.arg1, 'kind', None))]
+        assert len(spills) == allocator.spill_instructions
+        assert bool(spills) == (count < 3)
+
+
+def test_profile_phase_counts_spills():
+    with CompileMetrics() as metrics:
+        allocate_registers(CODE, TABLE, registers=1, metrics=metrics)
+    phase, = metrics.phases
+    assert (phase['registers'], phase['spill_slots']) == (2, 3)
+    assert phase['spill_instructions'] > 0
+
+
+@pytest.mark.parametrize('backend', ['vm', 'python'])
+def test_high_pressure_spills_give_the_same_output(backend):
+    outputs = {}
+    used = {}
+    for count in (16, 1):
+        compiler = SimpleLangCompiler(PRESSURE)
+        assert compiler.compile(output='quiet', registers=count)
+        output = io.StringIO()
+        values = compiler.execute(output, backend)
+        outputs[count] = (output.getvalue(), values)
+        used[count] = registers(compiler.optimized_code)
+    assert outputs[1] == outputs[16]
+    assert len(used[16]) > 10 and len(used[1]) <= 2
+
+    compiler = SimpleLangCompiler(PRESSURE)
+    compiler.compile(output='quiet', registers=1)
+    bytecode = BytecodeCompiler(compiler.declarations).compile(compiler.optimized_code)
+    opcodes = bytecode.disassemble()
+    assert any(' LOAD ' in line for line in opcodes) and any(' STORE ' in line for line in opcodes)
+    assert {LOAD, STORE} <= set(bytecode.code)
+    assert len(bytecode.spills) > 0
+    assert not any(name.kind == SPILL for name in bytecode.names)
+    source = PythonCodeGenerator(compiler.declarations).generate(compiler.optimized_code)
+    assert "spill[" in source
+    assert PythonProgram(source).run(io.StringIO()) == outputs[16][1]
+
+
+def test_spill_slots_round_trip_as_text():
+    code = LinearScanAllocator(TABLE, 1).optimize(CODE)
+    assert format_code(parse_code(format_code(code))) == format_code(code)
+    assert any(line.startswith('[s') for line in format_code(code))
@@ -0,0 +1,53 @@
+"""TokenStore holds the same tokens as Lexer.tokenize(), in less memory."""
+import pytest
+
+from benchmarks.generator import ProgramGenerator
+from diagnostics import locate
+from lexer import TOKEN_PATTERN, Lexer
+from parser import Parser
+from semantic import SemanticAnalyzer
+from tests.test_diagnostics import SOURCE, errors
+from tests.test_lexer_parity import CORPUS, same
+
+# More distinct lexemes than 2-byte indexes can address
+WIDE = "".join(f"int v{i};\nv{i} = {i};\n" for i in range(40000))
+
+
+@pytest.mark.parametrize('source', CORPUS + [ProgramGenerator(seed=2).generate(5000), WIDE])
+def test_store_round_trips_to_tokenize(source):
+    tokens, symbols = Lexer(source).tokenize()
+    lexer = Lexer(source)
+    store = lexer.tokenize_store()
+    assert len(store) == len(tokens) == lexer.token_count
+    assert same(list(store), tokens)
+    assert same([store[i] for i in range(len(store))], tokens)
+    assert list(store.offsets) == [match.start() for match in TOKEN_PATTERN.finditer(source)]
+    assert list(lexer.symbol_table.items()) == list(symbols.items())
+
+
+def test_store_widens_its_indexes():
+    narrow = Lexer("int x;\nx = 1;\n" * 1000).tokenize_store()
+    assert narrow.values.itemsize == 2
+    assert narrow.nbytes() == 7 * len(narrow) + len(narrow.table)
+    wide = Lexer(WIDE).tokenize_store()
+    assert len(wide.table) > 1 << 16
+    assert wide.values.itemsize == 4
+
+
+def test_parser_reads_a_store():
+    source = ProgramGenerator(seed=3).generate(5000)
+    tokens, _ = Lexer(source).tokenize()
+    expected = Parser(tokens).parse()
+    ast, errors = Parser(Lexer(source).tokenize_store()).parse()
+    assert (repr(ast), errors) == (repr(expected[0]), expected[1])
+
+
+@pytest.mark.parametrize('source', [SOURCE, SOURCE + "\n", "print(q);\nint q;\nprint(q)"])
+def test_locate_from_store_offsets(source):
+    expected = locate(source, *errors(source))
+    store = Lexer(source).tokenize_store()
+    ast, parse_errors = Parser(store).parse()
+    located = locate(source, parse_errors, SemanticAnalyzer(ast).analyze(), tokens=store)
+    assert located == expected
+    assert [[(error.line, error.column) for error in group] for group in located] == \
+        [[(error.line, error.column) for error in group] for group in expected]
@@ -0,0 +1,69 @@
+"""The /compile endpoints: requests are validated, cached results carry no
+stale metrics, and memory tracing is a server setting."""
+import pytest
+
+flask = pytest.importorskip('flask')
+
+import webapp  # noqa: E402
+
+SOURCE = "int x; x = 2 + 3; print(x);"
+
+
+@pytest.fixture
+def client():
+    webapp.compile_cache.clear()
+    return webapp.app.test_client()
+
+
+def test_cache_hits_get_fresh_metrics(client):
+    first = client.post('/compile', json={'source': SOURCE}).get_json()
+    assert first['metrics']['phases']
+    second = client.post('/compile', json={'source': SOURCE}).get_json()
+    assert second['metrics'] == {'cached': True}
+    del first['metrics'], second['metrics']
+    assert first == second
+    assert b'metrics' not in b''.join(webapp.compile_cache.entries.values())
+
+
+def test_trace_memory_needs_the_server_setting(client, monkeypatch):
+    response = client.post('/compile', json={'source': SOURCE, 'trace_memory': True}).get_json()
+    assert not any('peak_bytes' in phase for phase in response['metrics']['phases'])
+    webapp.compile_cache.clear()
+    monkeypatch.setattr(webapp, 'allow_trace_memory', True)
+    response = client.post('/compile', json={'source': SOURCE, 'trace_memory': True}).get_json()
+    assert all('peak_bytes' in phase for phase in response['metrics']['phases'])
+
+
+@pytest.mark.parametrize('path', ['/compile', '/compile/stream'])
+@pytest.mark.parametrize('source', [123, None, ['int x;'], {'text': 'int x;'}])
+def test_source_must_be_a_string(client, path, source):
+    response = client.post(path, json={'source': source})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "'source' must be a string"}
+
+
+@pytest.mark.parametrize('include', [[['tokens']], [{'ast': 1}], [1], 'tokens', ['code']])
+def test_stream_include_must_list_sections(client, include):
+    response = client.post('/compile/stream', json={'source': SOURCE, 'include': include})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "'include' must be a list of tokens, ast"}
+
+
+@pytest.mark.parametrize('edit, error', [
+    ({'source': 5}, "'source' must be a string"),
+    ({'handle': ['h']}, "'handle' must be a string"),
+    ({'offset': None}, "'offset' must be an integer"),
+    ({'length': None}, "'length' must be an integer"),
+    ({'offset': '3'}, "'offset' must be an integer"),
+    ({'length': True}, "'length' must be an integer"),
+    ({'replacement': None}, "'replacement' must be a string"),
+    ({'replacement': 7}, "'replacement' must be a string"),
+])
+def test_incremental_fields_are_checked(client, edit, error):
+    opened = client.post('/compile/incremental', json={'source': SOURCE}).get_json()
+    request = {'handle': opened['handle'], 'offset': 0, 'length': 0, 'replacement': ''}
+    if 'source' in edit:
+        request = {}
+    response = client.post('/compile/incremental', json={**request, **edit})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
@@ -1,6 +1,8 @@
 from flask import Flask, render_template, request, jsonify
+import json
 import os
 import sys
+import traceback
 
 # Ensure the Src directory is importable
 ROOT = os.path.dirname(__file__)
@@ -8,87 +10,176 @@ SRC_DIR = os.path.join(ROOT, 'Src')
 if SRC_DIR not in sys.path:
     sys.path.insert(0, SRC_DIR)
 
-from lexer import Lexer
-from parser import Parser
-from semantic import SemanticAnalyzer
-from codegen import IntermediateCodeGenerator
-from optimizer import ConstantFoldingOptimizer, CSEOptimizer
+from batch import BatchCompiler
+from cache import CompileCache, cache_key
+from incremental import CompilationHandles
+from log import configure, get_logger
+from metrics import MetricsRegistry
+from service import compile_events, compile_to_response, incremental_response, with_metrics
 
 app = Flask(__name__)
 
+# Compiler diagnostics are off unless SIMPLELANG_LOG_LEVEL is set;
+# SIMPLELANG_LOG_JSON=1 writes them as JSON Lines
+logger = get_logger('webapp')
+if os.environ.get('SIMPLELANG_LOG_LEVEL'):
+    configure(os.environ['SIMPLELANG_LOG_LEVEL'].upper(),
+              os.environ.get('SIMPLELANG_LOG_JSON') == '1')
+
+# Compile results by content hash; set SIMPLELANG_CACHE_DB to a file path to
+# keep them across restarts
+compile_cache = CompileCache(
+    max_entries=int(os.environ.get('SIMPLELANG_CACHE_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('SIMPLELANG_CACHE_BYTES', 32 << 20)),
+    path=os.environ.get('SIMPLELANG_CACHE_DB'))
+
+# Clients may ask /compile for the peak memory of each phase only if
+# SIMPLELANG_TRACE_MEMORY=1: tracing slows every compile in the process
+allow_trace_memory = os.environ.get('SIMPLELANG_TRACE_MEMORY') == '1'
+
+# Phase timings of every compile this server runs, for GET /metrics
+metrics_registry = MetricsRegistry()
+
+# Worker processes for /compile/batch, started on its first request
+batch_compiler = BatchCompiler(
+    workers=int(os.environ.get('SIMPLELANG_BATCH_WORKERS', 0)) or None)
+
+# Compilations the editor keeps open and updates with text edits
+compilation_handles = CompilationHandles(
+    max_handles=int(os.environ.get('SIMPLELANG_INCREMENTAL_HANDLES', 64)))
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/compile', methods=['POST'])
-
 def compile_code():
-    print('>>> /compile endpoint called')
-    sys.stdout.flush()
-    print('Received /compile request')
     try:
         data = request.get_json() or {}
         source = data.get('source', '')
-
-
-        print('Phase 1: Lexical')
-        sys.stdout.flush()
-        lexer = Lexer(source)
-        tokens, symbol_table = lexer.tokenize()
-
-
-        print('Phase 2: Syntax')
-        sys.stdout.flush()
-        parser = Parser(tokens)
-        ast, parse_errors = parser.parse()
-        print("Parser returned")
-        sys.stdout.flush()
-
-
-        print('Phase 3: Semantic')
-        print('AST:', ast)
-        sys.stdout.flush()
-        semantic_errors = []
-        if ast:
-            try:
-                analyzer = SemanticAnalyzer(ast)
-                semantic_errors = analyzer.analyze()
-                print('Semantic analysis complete')
-            except Exception as e:
-                print('Error during semantic analysis:', e)
-                import traceback
-                traceback.print_exc()
-        sys.stdout.flush()
-
-
-        print('Phase 4: IR')
-        sys.stdout.flush()
-        three_address_code = []
-        if ast and not parse_errors and not semantic_errors:
-            generator = IntermediateCodeGenerator(ast)
-            three_address_code = generator.generate()
-
-
-        print('Phase 5: Optimization')
-        sys.stdout.flush()
-        folded = ConstantFoldingOptimizer().optimize(three_address_code)
-        optimized = CSEOptimizer().optimize(folded)
-
-        response = {
-            'tokens': tokens,
-            'symbol_table': symbol_table,
-            'ast': ast,
-            'parse_errors': parse_errors,
-            'semantic_errors': semantic_errors,
-            'three_address_code': three_address_code,
-            'optimized_code': optimized
-        }
-        return jsonify(response)
+        if not isinstance(source, str):
+            return jsonify({'error': "'source' must be a string"}), 400
+        options = {'fixed_point': bool(data.get('fixed_point'))}
+        trace_memory = allow_trace_memory and bool(data.get('trace_memory'))
+        # The metrics of this request's compile; the cache keeps none
+        fresh = {}
+
+        def compute():
+            response = compile_to_response(source, options['fixed_point'], trace_memory)
+            fresh['metrics'] = response.pop('metrics')
+            metrics_registry.observe(fresh['metrics'])
+            return json.dumps(response).encode()
+
+        body = compile_cache.get_or_compute(cache_key(source, options), compute)
+        body = with_metrics(body, fresh.get('metrics', {'cached': True}))
+        return app.response_class(body, mimetype='application/json')
     except Exception as e:
-        import traceback
-        tb = traceback.format_exc()
-        print('ERROR in /compile:', tb)
-        return jsonify({'error': str(e), 'traceback': tb}), 500
+        logger.exception("Error in /compile")
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+# Sections of a streamed compile that are only sent when asked for
+STREAM_SECTIONS = ('tokens', 'ast')
+
+@app.route('/compile/stream', methods=['POST'])
+def compile_stream():
+    """Compile `source` and stream each phase's result as soon as it is
+    ready: JSON Lines by default, or Server-Sent Events when the client
+    accepts text/event-stream. `include` lists the heavy sections to send
+    as well ("tokens", "ast"); `page_size` bounds every list event."""
+    data = request.get_json() or {}
+    if not isinstance(data.get('source', ''), str):
+        return jsonify({'error': "'source' must be a string"}), 400
+    include = data.get('include', [])
+    if (not isinstance(include, list) or not all(isinstance(item, str) for item in include)
+            or not set(include) <= set(STREAM_SECTIONS)):
+        return jsonify({'error': f"'include' must be a list of {', '.join(STREAM_SECTIONS)}"}), 400
+    try:
+        page_size = max(1, int(data.get('page_size', 1000)))
+    except (TypeError, ValueError):
+        return jsonify({'error': "'page_size' must be an integer"}), 400
+    sse = request.accept_mimetypes.best_match(
+        ['application/x-ndjson', 'text/event-stream']) == 'text/event-stream'
+    events = compile_events(data.get('source', ''), bool(data.get('fixed_point')), include,
+                            page_size)
+
+    def generate():
+        try:
+            for event in events:
+                if event['event'] == 'done':
+                    metrics_registry.observe(event['metrics'])
+                if sse:
+                    yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                else:
+                    yield json.dumps(event) + '\n'
+        except Exception as e:
+            # The status line has gone out already; end the stream with the error
+            logger.exception("Error in /compile/stream")
+            error = {'event': 'error', 'error': str(e)}
+            yield (f"event: error\ndata: {json.dumps(error)}\n\n" if sse
+                   else json.dumps(error) + '\n')
+
+    return app.response_class(generate(),
+                              mimetype='text/event-stream' if sse else 'application/x-ndjson')
+
+@app.route('/compile/incremental', methods=['POST'])
+def compile_incremental():
+    """Without a handle, compile `source` and return a new handle with the
+    result. With one, apply the edit `offset`/`length`/`replacement` to
+    that compilation and return what changed (see
+    service.incremental_response); `optimize` adds the optimized code."""
+    data = request.get_json() or {}
+    handle = data.get('handle')
+    if handle is None:
+        fields = {'source': str}
+    else:
+        fields = {'handle': str, 'offset': int, 'length': int, 'replacement': str}
+    for field, kind in fields.items():
+        value = data.get(field, kind())
+        # JSON true and false are bools, which Python counts as ints
+        if not isinstance(value, kind) or isinstance(value, bool):
+            name = 'a string' if kind is str else 'an integer'
+            return jsonify({'error': f"'{field}' must be {name}"}), 400
+    try:
+        if handle is None:
+            handle, compilation = compilation_handles.open(data.get('source', ''))
+        else:
+            compilation = compilation_handles.edit(
+                handle, data.get('offset', 0), data.get('length', 0),
+                data.get('replacement', ''))
+    except KeyError:
+        return jsonify({'error': f"Unknown or expired handle {handle!r}"}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Not while another request is editing the same compilation
+    with compilation.lock:
+        response = incremental_response(compilation, bool(data.get('fixed_point')),
+                                        bool(data.get('optimize')))
+    metrics_registry.observe(response['metrics'])
+    response['handle'] = handle
+    return jsonify(response)
+
+@app.route('/compile/batch', methods=['POST'])
+def compile_batch():
+    """Compile `sources`, a list of {"name", "source"} objects, in parallel.
+    The results are streamed back as JSON Lines, in the order sent."""
+    data = request.get_json() or {}
+    sources = data.get('sources')
+    if not isinstance(sources, list) or not all(isinstance(item, dict) for item in sources):
+        return jsonify({'error': "'sources' must be a list of {name, source} objects"}), 400
+    items = [(str(item.get('name', index)), item.get('source', ''))
+             for index, item in enumerate(sources)]
+    results = batch_compiler.compile_sources(items, bool(data.get('fixed_point')))
+    lines = (json.dumps(result) + '\n' for result in results)
+    return app.response_class(lines, mimetype='application/x-ndjson')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return app.response_class(metrics_registry.render(),
+                              mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(compile_cache.stats())
 
 if __name__ == '__main__':
     app.run(debug=False, port=5000, use_reloader=False)